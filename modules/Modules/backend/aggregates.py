@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Per-file Aggregate Store
+Precomputed deviation histograms stored next to each trade file
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import List, Dict, Optional, Sequence, Iterable
+
+import numpy as np
+import pandas as pd
+import logging
+
+from buckets import currency_counts_from_pairs, format_buckets, DEFAULT_EXCEEDING_THRESHOLD
+from trade_store import file_fingerprint, iter_trades
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_SUFFIX = ".agg.json"
+AGGREGATE_VERSION = 1
+
+# Histogram bin width in deviation percent; bucket edges must be multiples of it
+HISTOGRAM_RESOLUTION = 0.01
+
+AGGREGATE_COLUMNS = ['ccy_pair', 'deviation_percent', 'trade_date']
+
+
+def aggregate_path(path: Path) -> Path:
+    """Sidecar path for a trade file, e.g. .../GSI/SLANG/2024-01-31.parquet.agg.json"""
+    path = Path(path)
+    return path.with_name(path.name + AGGREGATE_SUFFIX)
+
+
+def edges_to_bins(edges: Sequence[float], resolution: float = HISTOGRAM_RESOLUTION) -> Optional[np.ndarray]:
+    """Convert bucket edges to histogram bin numbers, or None if they don't align"""
+    scaled = np.asarray(edges, dtype=float) / resolution
+    bins = np.round(scaled)
+    if not np.allclose(scaled, bins, rtol=0, atol=1e-6):
+        return None
+    return bins.astype(np.int64)
+
+
+def _deviation_bins(deviation: pd.Series, resolution: float) -> np.ndarray:
+    """Histogram bin of each deviation; the rounding absorbs float noise like 0.29 / 0.01"""
+    values = pd.to_numeric(deviation, errors="coerce").to_numpy(dtype=float)
+    return np.floor(np.round(values / resolution, 6))
+
+
+def build_aggregate(frames: Iterable[pd.DataFrame], resolution: float = HISTOGRAM_RESOLUTION) -> Dict:
+    """Aggregate trade chunks into pair x deviation-bin counts plus row/date stats"""
+    partials = []
+    nan_counts = {}
+    row_count = 0
+    min_date, max_date = None, None
+
+    for chunk in frames:
+        row_count += len(chunk)
+        if chunk.empty:
+            continue
+
+        bins = _deviation_bins(chunk['deviation_percent'], resolution)
+        pairs = chunk['ccy_pair']
+        missing = np.isnan(bins)
+
+        if missing.any():
+            for pair, count in pairs[missing].value_counts().items():
+                if count:
+                    nan_counts[pair] = nan_counts.get(pair, 0) + int(count)
+
+        partials.append(
+            pd.DataFrame({'ccy_pair': pairs[~missing].to_numpy(), 'bin': bins[~missing].astype(np.int64)})
+            .value_counts()
+        )
+
+        if 'trade_date' in chunk.columns:
+            dates = pd.to_datetime(chunk['trade_date'], errors="coerce").dropna()
+            if not dates.empty:
+                min_date = dates.min() if min_date is None else min(min_date, dates.min())
+                max_date = dates.max() if max_date is None else max(max_date, dates.max())
+
+    histogram = {}
+    if partials:
+        counts = pd.concat(partials).groupby(level=[0, 1]).sum()
+        for (pair, bin_no), count in counts.items():
+            histogram.setdefault(str(pair), []).append([int(bin_no), int(count)])
+
+    return {
+        "version": AGGREGATE_VERSION,
+        "resolution": resolution,
+        "row_count": row_count,
+        "min_trade_date": min_date.isoformat() if min_date is not None else None,
+        "max_trade_date": max_date.isoformat() if max_date is not None else None,
+        "histogram": histogram,
+        "nan_counts": {str(k): v for k, v in nan_counts.items()},
+    }
+
+
+def write_aggregate(path: Path, resolution: float = HISTOGRAM_RESOLUTION,
+                    frames: Optional[Iterable[pd.DataFrame]] = None) -> Dict:
+    """Compute a trade file's aggregate and write it to the sidecar
+
+    frames, when given, are the file's rows already in memory (e.g. a day
+    partition just written), so the file is not read back.
+    """
+    path = Path(path)
+    fingerprint = file_fingerprint(path)
+    if frames is None:
+        frames = iter_trades(path, AGGREGATE_COLUMNS)
+    aggregate = build_aggregate(frames, resolution)
+    aggregate["fingerprint"] = fingerprint
+
+    sidecar = aggregate_path(path)
+    tmp_path = sidecar.with_name(sidecar.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        # One sidecar per day partition; dumps uses the C encoder, dump does not
+        f.write(json.dumps(aggregate))
+    os.replace(tmp_path, sidecar)
+
+    logger.info(f"Built aggregate for {path.name}: {aggregate['row_count']} rows")
+    return aggregate
+
+
+class AggregateStore:
+    """Builds, caches and merges per-file aggregate sidecars"""
+
+    def __init__(self, resolution: float = HISTOGRAM_RESOLUTION, executor=None):
+        self.resolution = resolution
+        self.executor = executor
+        self._cache: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def build(self, path: Path) -> Dict:
+        """Compute the aggregate for a trade file and write its sidecar"""
+        path = Path(path)
+        if self.executor is not None:
+            aggregate = self.executor.run(write_aggregate, path, self.resolution)
+        else:
+            aggregate = write_aggregate(path, self.resolution)
+
+        with self._lock:
+            self._cache[str(path)] = aggregate
+        return aggregate
+
+    def get(self, path: Path) -> Dict:
+        """Return a file's aggregate, rebuilding it if the file has changed"""
+        path = Path(path)
+        fingerprint = file_fingerprint(path)
+
+        with self._lock:
+            cached = self._cache.get(str(path))
+        if self._is_current(cached, fingerprint):
+            return cached
+
+        sidecar = aggregate_path(path)
+        if sidecar.exists():
+            try:
+                with open(sidecar) as f:
+                    aggregate = json.load(f)
+                if self._is_current(aggregate, fingerprint):
+                    with self._lock:
+                        self._cache[str(path)] = aggregate
+                    return aggregate
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable aggregate {sidecar}: {e}")
+
+        return self.build(path)
+
+    def _is_current(self, aggregate: Optional[Dict], fingerprint: Dict) -> bool:
+        return (aggregate is not None
+                and aggregate.get("version") == AGGREGATE_VERSION
+                and aggregate.get("resolution") == self.resolution
+                and aggregate.get("fingerprint") == fingerprint)
+
+    def supports_edges(self, edges: Sequence[float]) -> bool:
+        """True if the bucket edges can be answered from the histograms"""
+        return edges_to_bins(edges, self.resolution) is not None
+
+    def pair_bucket_counts(self, paths: Iterable[Path], edges: Sequence[float]) -> pd.DataFrame:
+        """Merge the aggregates of several files into pair x bucket counts"""
+        edge_bins = edges_to_bins(edges, self.resolution)
+        if edge_bins is None:
+            raise ValueError(f"bucket_edges must be multiples of {self.resolution}")
+
+        n_buckets = len(edges)
+        totals: Dict[str, np.ndarray] = {}
+        for path in paths:
+            try:
+                aggregate = self.get(path)
+            except Exception as e:
+                logger.warning(f"Skipping {path} in bucket analysis: {str(e)}")
+                continue
+            for pair, entries in aggregate["histogram"].items():
+                entries = np.asarray(entries, dtype=np.int64).reshape(-1, 2)
+                buckets = np.clip(np.searchsorted(edge_bins, entries[:, 0], side="right") - 1, 0, n_buckets - 1)
+                counts = np.bincount(buckets, weights=entries[:, 1], minlength=n_buckets)
+                totals[pair] = totals.get(pair, 0) + counts
+            # Missing deviations land in the first bucket, as in assign_buckets
+            for pair, count in aggregate["nan_counts"].items():
+                counts = np.zeros(n_buckets)
+                counts[0] = count
+                totals[pair] = totals.get(pair, 0) + counts
+
+        if not totals:
+            return pd.DataFrame(columns=range(n_buckets), dtype=np.int64)
+        frame = pd.DataFrame.from_dict(totals, orient="index", columns=range(n_buckets))
+        return frame.astype(np.int64)
+
+    def deviation_buckets(self, paths: Iterable[Path], edges: Sequence[float],
+                          exceeding_threshold: float = DEFAULT_EXCEEDING_THRESHOLD) -> List[Dict]:
+        """Bucket analysis answered entirely from the precomputed aggregates"""
+        pair_counts = self.pair_bucket_counts(paths, edges)
+        return format_buckets(currency_counts_from_pairs(pair_counts), edges, exceeding_threshold)
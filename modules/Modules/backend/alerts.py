@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Alert Categorization Engine
+Vectorized alert severity bands fused with the per-pair / per-LE summary
+"""
+
+import json
+from typing import List, Dict, Optional, Sequence, Tuple, Callable
+
+import numpy as np
+import pandas as pd
+
+# Severity labels, from no alert to the open-ended top band
+ALERT_LABELS = ['✅ No Alert', '⚠️ Minor', '❗ Moderate', '🔴 Major']
+
+# Upper edges of the Minor and Moderate bands on (deviation - threshold)
+DEFAULT_ALERT_BANDS = [0.05, 0.3]
+
+# Upper bound on thresholds evaluated by one sweep
+MAX_SWEEP_CANDIDATES = 10_000
+
+# How a trade's (LegalEntity, ccy pair) finds its threshold in the
+# {(LegalEntity, CCY): threshold} table, which is configured per currency:
+#   pair         - only an entry keyed by the full pair, e.g. (GSI, EURUSD)
+#   tighter_leg  - the pair entry if present, else the lower of the base and
+#                  quote currency entries, e.g. min((GSI, EUR), (GSI, USD))
+#   looser_leg   - the pair entry if present, else the higher of the two legs
+# Trades that resolve to nothing have no threshold and are not categorized.
+THRESHOLD_POLICIES = ('pair', 'tighter_leg', 'looser_leg')
+DEFAULT_THRESHOLD_POLICY = 'tighter_leg'
+
+# Columns the alert-summary and threshold-sweep stages read
+TRADE_COLUMNS = ['legal_entity', 'ccy_pair', 'deviation_percent']
+
+# Loads the given trade columns, or returns None when there are no trades;
+# must be picklable (e.g. a functools.partial) to run in the process pool
+TradeLoader = Callable[[List[str]], Optional[pd.DataFrame]]
+
+# Above this many group combinations the group ids are compacted first
+MAX_DENSE_GROUPS = 1 << 22
+
+
+def validate_alert_bands(bands: Optional[Sequence[float]] = None,
+                         labels: Optional[Sequence[str]] = None) -> Tuple[List[float], List[str]]:
+    """Return band edges and labels, falling back to the defaults
+
+    n band edges need n + 2 labels: no alert, one per closed band and the
+    open-ended top band.
+    """
+    if bands is None:
+        values = list(DEFAULT_ALERT_BANDS)
+    else:
+        try:
+            values = [float(edge) for edge in bands]
+        except (TypeError, ValueError):
+            raise ValueError("alert_bands must be a list of numbers")
+        if any(np.isnan(values)) or any(edge <= 0 for edge in values):
+            raise ValueError("alert_bands must be positive")
+        if any(b <= a for a, b in zip(values, values[1:])):
+            raise ValueError("alert_bands must be strictly increasing")
+
+    if labels is None:
+        if len(values) != len(DEFAULT_ALERT_BANDS):
+            labels = ['No Alert'] + [f"Band {i}" for i in range(1, len(values) + 2)]
+        else:
+            labels = list(ALERT_LABELS)
+    labels = [str(label) for label in labels]
+    if len(labels) != len(values) + 2:
+        raise ValueError(f"{len(values)} alert bands need {len(values) + 2} labels")
+
+    return values, labels
+
+
+def alert_codes(deviation, final_threshold, bands: Sequence[float] = DEFAULT_ALERT_BANDS) -> np.ndarray:
+    """Severity code per trade: 0 = no alert, then one code per band
+
+    Matches the row-wise categorize_alert: deviations at or under the
+    threshold are no alert, band edges are inclusive upper bounds and
+    anything else (including missing values) falls in the top band.
+    """
+    deviation = np.asarray(deviation, dtype=float)
+    final_threshold = np.asarray(final_threshold, dtype=float)
+
+    delta = deviation - final_threshold
+    codes = 1 + np.searchsorted(np.asarray(bands, dtype=float), delta, side='left')
+    codes[deviation <= final_threshold] = 0
+    return codes.astype(np.int8)
+
+
+def categorize_alerts(deviation, final_threshold, bands: Optional[Sequence[float]] = None,
+                      labels: Optional[Sequence[str]] = None) -> pd.Categorical:
+    """Alert category per trade as a categorical of the band labels"""
+    bands, labels = validate_alert_bands(bands, labels)
+    return pd.Categorical.from_codes(alert_codes(deviation, final_threshold, bands), labels)
+
+
+def _group_ids(df: pd.DataFrame, group_by: Sequence[str]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Dense group id per row plus the unique values of each key column"""
+    ids = np.zeros(len(df), dtype=np.int64)
+    uniques = []
+    size = 1
+    for column in group_by:
+        codes, values = pd.factorize(df[column], sort=True, use_na_sentinel=False)
+        ids = ids * len(values) + codes
+        size *= max(len(values), 1)
+        uniques.append(np.asarray(values, dtype=object))
+
+    if size > MAX_DENSE_GROUPS:
+        ids, combined = pd.factorize(ids)
+        keys = np.unravel_index(combined, [len(u) for u in uniques])
+        uniques = [u[k] for u, k in zip(uniques, keys)]
+        return ids, uniques
+
+    keys = np.unravel_index(np.arange(size), [max(len(u), 1) for u in uniques])
+    return ids, [u[k] if len(u) else u for u, k in zip(uniques, keys)]
+
+
+def summarize_alerts(df: pd.DataFrame, group_by: Sequence[str] = ('ccypair',),
+                     deviation_col: str = 'deviation', threshold_col: str = 'final_threshold',
+                     bands: Optional[Sequence[float]] = None, labels: Optional[Sequence[str]] = None,
+                     category_col: Optional[str] = None) -> pd.DataFrame:
+    """Count alerts per band for each group in one pass
+
+    Returns one row per group present with a column per label and
+    Total_Trades, the same shape as the groupby/unstack summary. When
+    category_col is given the per-trade category is also written to df.
+    """
+    bands, labels = validate_alert_bands(bands, labels)
+    group_by = list(group_by)
+
+    codes = alert_codes(df[deviation_col], df[threshold_col], bands)
+    if category_col is not None:
+        df[category_col] = pd.Categorical.from_codes(codes, labels)
+
+    n_labels = len(labels)
+    ids, keys = _group_ids(df, group_by)
+    n_groups = len(keys[0]) if keys else 1
+    counts = np.bincount(ids * n_labels + codes, minlength=n_groups * n_labels).reshape(n_groups, n_labels)
+
+    present = counts.sum(axis=1) > 0
+    summary = pd.DataFrame({column: values[present] for column, values in zip(group_by, keys)})
+    for i, label in enumerate(labels):
+        summary[label] = counts[present, i]
+    summary['Total_Trades'] = counts[present].sum(axis=1)
+    return summary.reset_index(drop=True)
+
+
+def validate_threshold_policy(policy: Optional[str]) -> str:
+    """Return a THRESHOLD_POLICIES name, DEFAULT_THRESHOLD_POLICY for None"""
+    if policy is None:
+        return DEFAULT_THRESHOLD_POLICY
+    if policy not in THRESHOLD_POLICIES:
+        raise ValueError(f"threshold_policy must be one of {list(THRESHOLD_POLICIES)}")
+    return policy
+
+
+def _resolve_thresholds(legal_entities, ccy_pairs, thresholds: Dict[Tuple[str, str], float],
+                        swept: frozenset = frozenset(),
+                        policy: str = DEFAULT_THRESHOLD_POLICY) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-trade (fixed threshold, swept) from {(LegalEntity, CCY): threshold}
+
+    Keys are resolved as THRESHOLD_POLICIES describes. Keys in swept are
+    left out of the fixed threshold and flag the trades whose threshold they
+    control. Resolution runs once per distinct (LegalEntity, pair), not per
+    trade.
+    """
+    policy = validate_threshold_policy(policy)
+    combine = max if policy == 'looser_leg' else min
+    keys = pd.MultiIndex.from_arrays([pd.Series(legal_entities).astype(object),
+                                      pd.Series(ccy_pairs).astype(object)])
+    codes, unique_keys = pd.factorize(keys)
+
+    fixed = np.full(len(unique_keys), np.nan)
+    affected = np.zeros(len(unique_keys), dtype=bool)
+    for i, (legal_entity, pair) in enumerate(unique_keys):
+        if policy == 'pair' or (legal_entity, pair) in thresholds or (legal_entity, pair) in swept:
+            candidates = [(legal_entity, pair)]
+        else:
+            candidates = [(legal_entity, str(pair)[:3]), (legal_entity, str(pair)[3:6])]
+        affected[i] = any(key in swept for key in candidates)
+        legs = [thresholds.get(key) for key in candidates if key not in swept]
+        legs = [value for value in legs if value is not None and not np.isnan(value)]
+        if legs:
+            fixed[i] = combine(legs)
+
+    if not len(codes):
+        return np.empty(0), np.zeros(0, dtype=bool)
+    return fixed[codes], affected[codes]
+
+
+def lookup_final_thresholds(legal_entities, ccy_pairs, thresholds: Dict[Tuple[str, str], float],
+                            policy: str = DEFAULT_THRESHOLD_POLICY) -> np.ndarray:
+    """Threshold per trade from {(LegalEntity, CCY): threshold} under a THRESHOLD_POLICIES rule
+
+    Trades the policy resolves to nothing get NaN.
+    """
+    return _resolve_thresholds(legal_entities, ccy_pairs, thresholds, policy=policy)[0]
+
+
+def sweep_candidates(spec) -> List[float]:
+    """Candidate thresholds from a list or a {"min", "max", "steps"} range"""
+    try:
+        if isinstance(spec, dict):
+            steps = int(spec.get('steps', 101))
+            if steps < 1 or steps > MAX_SWEEP_CANDIDATES:
+                raise ValueError(f"steps must be between 1 and {MAX_SWEEP_CANDIDATES}")
+            values = np.linspace(float(spec['min']), float(spec['max']), steps).tolist()
+        else:
+            values = [float(value) for value in spec]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"candidates must be a list of numbers or a min/max/steps range: {e}")
+
+    if not values or len(values) > MAX_SWEEP_CANDIDATES:
+        raise ValueError(f"Between 1 and {MAX_SWEEP_CANDIDATES} candidate thresholds are required")
+    if any(np.isnan(values)):
+        raise ValueError("candidate thresholds must be numbers")
+    return values
+
+
+def sweep_alert_counts(deviation, fixed_threshold, candidates: Sequence[float],
+                       looser: bool = False) -> np.ndarray:
+    """Alert count for every candidate threshold from one sort
+
+    A trade alerts unless deviation <= min(candidate, fixed_threshold), or
+    max(...) when looser; a NaN fixed threshold means only the candidate
+    applies. Trades the fixed threshold alone decides (over it, or with
+    looser under it) are counted once, the rest are sorted once and each
+    candidate is a binary search.
+    """
+    deviation = np.asarray(deviation, dtype=float)
+    fixed = np.asarray(fixed_threshold, dtype=float)
+    fixed = np.where(np.isnan(fixed), -np.inf if looser else np.inf, fixed)
+
+    within_fixed = deviation <= fixed
+    decided = within_fixed if looser else ~within_fixed
+    remaining = np.sort(deviation[~decided])
+    over = len(remaining) - np.searchsorted(remaining, np.asarray(candidates, dtype=float), side='right')
+    return over if looser else int(decided.sum()) + over
+
+
+def threshold_sweep(legal_entities, ccy_pairs, deviation, thresholds: Dict[Tuple[str, str], float],
+                    swept_keys: Sequence[Tuple[str, str]], candidates: Sequence[float],
+                    policy: str = DEFAULT_THRESHOLD_POLICY) -> Dict:
+    """Alert curve for the trades governed by swept_keys as their threshold moves
+
+    Every swept (LegalEntity, CCY) threshold is set to each candidate in
+    turn; all other thresholds stay as they are.
+    """
+    swept = frozenset(tuple(key) for key in swept_keys)
+    fixed, affected = _resolve_thresholds(legal_entities, ccy_pairs, thresholds, swept, policy)
+    deviation = np.asarray(deviation, dtype=float)[affected]
+    counts = sweep_alert_counts(deviation, fixed[affected], candidates, looser=policy == 'looser_leg')
+    return {
+        "affected_trades": int(affected.sum()),
+        "curve": [{"threshold": float(t), "alerts": int(c)} for t, c in zip(candidates, counts)],
+    }
+
+
+def alert_summary_stage(load: TradeLoader, thresholds: Dict[Tuple[str, str], float],
+                        group_by: Sequence[str], bands: Sequence[float], labels: Sequence[str],
+                        policy: str = DEFAULT_THRESHOLD_POLICY) -> Dict:
+    """CPU stage behind /api/analysis/alert-summary; returns JSON-ready records"""
+    trades = load(TRADE_COLUMNS)
+    if trades is None:
+        return {"summary": [], "trades_without_threshold": 0}
+
+    trades['final_threshold'] = lookup_final_thresholds(trades['legal_entity'], trades['ccy_pair'],
+                                                        thresholds, policy)
+
+    # Trades with no configured threshold cannot be categorized
+    has_threshold = trades['final_threshold'].notna()
+    summary = summarize_alerts(trades[has_threshold], group_by=group_by, deviation_col='deviation_percent',
+                               bands=bands, labels=labels)
+    return {
+        "summary": json.loads(summary.to_json(orient='records')),
+        "trades_without_threshold": int((~has_threshold).sum()),
+    }
+
+
+def threshold_sweep_stage(load: TradeLoader, thresholds: Dict[Tuple[str, str], float],
+                          swept_keys: Sequence[Tuple[str, str]], candidates: Sequence[float],
+                          policy: str = DEFAULT_THRESHOLD_POLICY) -> Optional[Dict]:
+    """CPU stage behind /api/analysis/threshold-sweep; None when there are no trades"""
+    trades = load(TRADE_COLUMNS)
+    if trades is None:
+        return None
+    return threshold_sweep(trades['legal_entity'], trades['ccy_pair'], trades['deviation_percent'],
+                           thresholds, swept_keys, candidates, policy)
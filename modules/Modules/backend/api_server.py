@@ -4,28 +4,96 @@ Flask API Server for GFX Threshold Deviation Dashboard
 Bridges the React frontend with Python backend processing
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context, g
 from flask_cors import CORS
+import math
 import os
 import json
-import threading
-from datetime import datetime
+import time
+from functools import partial
 from pathlib import Path
 import pandas as pd
 from main import GFXDataProcessor, DataRequest, ProcessingStatus
+from buckets import compute_deviation_buckets, validate_bucket_edges, validate_exceeding_threshold
+from alerts import (validate_alert_bands, validate_threshold_policy, sweep_candidates,
+                    alert_summary_stage, threshold_sweep_stage)
+from trade_store import read_trades, read_trade_files
+from jobs import JobManager, JobQueueFull, request_key
+from thresholds import ThresholdUpdateError
+from frame_cache import market_frames
+from exports import ExportCache, parse_export_filters
+from matching import read_result_page, iter_result_rows
+from metrics import REGISTRY, HTTP_REQUEST_SECONDS, current_rss_bytes
 
 app = Flask(__name__)
 CORS(app)
 
 # Global variables for status tracking
 processor = GFXDataProcessor()
-processing_status = {}
-processing_lock = threading.Lock()
+jobs = JobManager()
+export_cache = ExportCache(processor.base_dir.resolve() / "exports" / "cache")
+
+# Result row files per pair and the match-result count that sizes each
+RESULT_COUNT_KEYS = {
+    "matched": "matched_count",
+    "uat_only": "unmatched_count",
+    "prod_only": "prod_only_count",
+    "diffs": "diff_count",
+}
+MAX_RESULT_PAGE = 10000
+
+# Longest a long-poll or SSE wait is held open before an empty reply or keep-alive
+MAX_EVENT_WAIT = 30
+SSE_KEEPALIVE_SECONDS = 15
+
+# Point-in-time values refreshed on every /api/metrics scrape
+JOBS_PENDING = REGISTRY.gauge("gfx_jobs_pending", "Jobs queued or running")
+JOB_STATUSES_STORED = REGISTRY.gauge("gfx_job_statuses_stored", "Job statuses held for polling")
+FRAME_CACHE_BYTES = REGISTRY.gauge("gfx_frame_cache_bytes", "Bytes held by the market frame cache")
+FRAME_CACHE_LOOKUPS = REGISTRY.gauge("gfx_frame_cache_lookups", "Market frame cache lookups", ["result"])
+PROCESS_RSS_BYTES = REGISTRY.gauge("gfx_process_resident_memory_bytes", "Resident memory of the API process")
+
+def uat_trade_loader():
+    """Picklable loader of the downloaded UAT trades, for CPU executor stages"""
+    return partial(read_trade_files, processor.dataset.partition_files("UAT"))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Streamed responses are timed to their first byte
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=request.endpoint or "unknown",
+                                     method=request.method, status=response.status_code)
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy", "service": "gfx-dashboard-python"})
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters of the in-process caches"""
+    return jsonify({"market_frames": market_frames.stats()})
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Stage, queue and request histograms and counters in Prometheus text format"""
+    job_stats = jobs.stats()
+    JOBS_PENDING.set(job_stats["pending"])
+    JOB_STATUSES_STORED.set(job_stats["stored_statuses"])
+    cache_stats = market_frames.stats()
+    FRAME_CACHE_BYTES.set(cache_stats["bytes"])
+    FRAME_CACHE_LOOKUPS.set(cache_stats["hits"], result="hit")
+    FRAME_CACHE_LOOKUPS.set(cache_stats["misses"], result="miss")
+    rss = current_rss_bytes()
+    if rss is not None:
+        PROCESS_RSS_BYTES.set(rss)
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/api/data/download', methods=['POST'])
 def download_data():
     """Start parallel data download process"""
@@ -48,80 +116,216 @@ def download_data():
             download_exceptions=data.get('download_exceptions', True)
         )
         
-        # Generate unique request ID
-        request_id = f"req_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        # Start processing in background thread
-        def background_process():
-            with processing_lock:
-                processing_status[request_id] = {"status": "started", "statuses": []}
+        # Start processing on the bounded job pool
+        def background_process(request_id):
+            jobs.set_status(request_id, {"status": "started", "statuses": []})
+            
+            def publish(status, state):
+                state = dict(state)
+                jobs.set_artifacts(request_id, state.pop("artifacts", {}))
+                jobs.set_status(request_id, {"status": status, **state})
             
             try:
-                statuses = processor.process_parallel_downloads(data_request)
-                
-                # Calculate matching for completed downloads
-                matched_results = {}
-                for status in statuses:
-                    if (status.status == "completed" and 
-                        status.environment in ["UAT", "PROD"]):
-                        
-                        # Find the corresponding UAT/PROD pair
-                        key = f"{status.legal_entity}_{status.source_system}"
-                        if key not in matched_results:
-                            matched_results[key] = {}
-                        
-                        matched_results[key][status.environment] = {
-                            "count": status.records_count,
-                            "status": status.status
-                        }
-                
-                # Calculate matched/unmatched for each pair
-                for key, envs in matched_results.items():
-                    if "UAT" in envs and "PROD" in envs:
-                        legal_entity, source_system = key.split("_")
-                        match_result = processor.match_uat_prod_trades(
-                            legal_entity, source_system, 
-                            data_request.product_type,
-                            data_request.start_date, 
-                            data_request.end_date
-                        )
-                        matched_results[key]["matching"] = match_result
-                
-                with processing_lock:
-                    processing_status[request_id] = {
-                        "status": "completed",
-                        "statuses": [status.__dict__ for status in statuses],
-                        "matching_results": matched_results
-                    }
+                # Downloads and matches land here as soon as each one finishes
+                result = processor.process_download_pipeline(
+                    data_request, on_update=lambda state: publish("running", state),
+                    on_event=lambda event: jobs.publish(request_id, event))
+                publish("completed", result)
                     
             except Exception as e:
-                with processing_lock:
-                    processing_status[request_id] = {
-                        "status": "failed", 
-                        "error": str(e)
-                    }
+                jobs.set_status(request_id, {
+                    "status": "failed", 
+                    "error": str(e)
+                })
         
-        thread = threading.Thread(target=background_process)
-        thread.daemon = True
-        thread.start()
+        # Identical requests already queued or running share one job
+        try:
+            request_id, coalesced = jobs.submit(background_process, key=request_key(data_request))
+        except JobQueueFull as e:
+            return jsonify({"error": f"Too many jobs in progress, retry later: {str(e)}"}), 429
         
         return jsonify({
             "request_id": request_id,
             "status": "processing_started",
+            "coalesced": coalesced,
             "message": "Data download started in background"
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/data/exception-data-download', methods=['POST'])
+def download_exception_data():
+    """Start EPE exception download and consolidation"""
+    try:
+        data = request.get_json() or {}
+        data_input = data.get('input', data)
+        
+        if not all(field in data_input for field in ['start_date', 'end_date']):
+            return jsonify({"error": "Missing required fields: ['start_date', 'end_date']"}), 400
+        
+        start_date, end_date = data_input['start_date'], data_input['end_date']
+        
+        def background_process(request_id):
+            jobs.set_status(request_id, {"status": "started"})
+            result = processor.process_exception_downloads(start_date, end_date,
+                                                           metrics=jobs.job_metrics(request_id),
+                                                           on_event=lambda event: jobs.publish(request_id, event))
+            # Any environment that failed to download or consolidate fails the job
+            environments = {env for per_status in result["downloads"].values() for env in per_status}
+            consolidated = result["consolidated"]
+            succeeded = bool(consolidated) and all(
+                env in consolidated and "error" not in consolidated[env] for env in environments)
+            jobs.set_status(request_id, {
+                "status": "completed" if succeeded else "failed",
+                "matching_results": result
+            })
+        
+        try:
+            request_id, coalesced = jobs.submit(
+                background_process, key=request_key({"epe": [start_date, end_date]}))
+        except JobQueueFull as e:
+            return jsonify({"error": f"Too many jobs in progress, retry later: {str(e)}"}), 429
+        
+        return jsonify({
+            "request_id": request_id,
+            "status": "processing_started",
+            "coalesced": coalesced,
+            "message": "EPE Data download and consolidation started in background"
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/data/status/<request_id>', methods=['GET'])
 def get_processing_status(request_id):
-    """Get status of data processing request"""
-    with processing_lock:
-        if request_id not in processing_status:
-            return jsonify({"error": "Request ID not found"}), 404
+    """Get status of data processing request
+    
+    The ETag is the status version plus the metrics revision; a poll with a
+    current If-None-Match gets 304 without the snapshot being serialized.
+    """
+    # Taken before the snapshot, so a change in between only costs one extra 200
+    etag = jobs.status_etag(request_id)
+    if etag is None:
+        return jsonify({"error": "Request ID not found"}), 404
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    status = jobs.get_status(request_id)
+    if status is None:
+        return jsonify({"error": "Request ID not found"}), 404
+    response = jsonify(status)
+    response.set_etag(etag)
+    return response
+
+def _event_wait_args():
+    # A reconnecting EventSource resumes from the last event it received
+    since = request.headers.get('Last-Event-ID', request.args.get('since', 0))
+    timeout = float(request.args.get('timeout', MAX_EVENT_WAIT - 5))
+    if not math.isfinite(timeout):
+        raise ValueError(f"timeout must be finite, got {timeout}")
+    return int(since), min(max(timeout, 0), MAX_EVENT_WAIT)
+
+@app.route('/api/data/status/<request_id>/events', methods=['GET'])
+def get_processing_events(request_id):
+    """Long-poll for progress events after ?since=<version>
+    
+    Returns as soon as there is an event (or the job has finished), or with
+    no events after ?timeout seconds. Pass the returned version as the next
+    since; on "resync", re-read /api/data/status first.
+    """
+    try:
+        since, timeout = _event_wait_args()
+    except ValueError:
+        return jsonify({"error": "since and timeout must be finite numbers"}), 400
+    
+    result = jobs.events(request_id, since, timeout)
+    if result is None:
+        return jsonify({"error": "Request ID not found"}), 404
+    return jsonify({"request_id": request_id, **result})
+
+@app.route('/api/data/status/<request_id>/stream', methods=['GET'])
+def stream_processing_events(request_id):
+    """Server-Sent Events: one event per status change, download and match
+    
+    Event ids are versions, so a reconnecting EventSource resumes from
+    Last-Event-ID. A "resync" event asks the client to re-read the status;
+    "end" follows the last event of a finished job.
+    """
+    try:
+        since, _ = _event_wait_args()
+    except ValueError:
+        return jsonify({"error": "since and timeout must be finite numbers"}), 400
+    if jobs.status_version(request_id) is None:
+        return jsonify({"error": "Request ID not found"}), 404
+    
+    def generate(since):
+        while True:
+            result = jobs.events(request_id, since, SSE_KEEPALIVE_SECONDS)
+            if result is None:
+                return
+            if result["resync"]:
+                yield f"event: resync\ndata: {json.dumps({'version': result['version']})}\n\n"
+            for event in result["events"]:
+                yield f"id: {event['version']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            since = result["version"] if result["events"] or result["resync"] else since
+            if result["finished"]:
+                yield f"event: end\ndata: {json.dumps({'version': result['version']})}\n\n"
+                return
+            if not result["events"]:
+                yield ": keep-alive\n\n"
+    
+    return Response(stream_with_context(generate(since)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/api/data/results/<request_id>/<pair_key>', methods=['GET'])
+def get_match_results(request_id, pair_key):
+    """Page through a pair's matched/unmatched rows, as JSON pages or NDJSON"""
+    try:
+        kind = request.args.get('kind', 'matched')
+        if kind not in RESULT_COUNT_KEYS:
+            return jsonify({"error": f"kind must be one of {list(RESULT_COUNT_KEYS)}"}), 400
+        
+        matching = (jobs.get_status(request_id) or {}).get("matching_results", {}).get(pair_key, {}).get("matching", {})
+        total = matching.get(RESULT_COUNT_KEYS[kind])
+        result_file = (jobs.get_artifacts(request_id) or {}).get(pair_key, {}).get(kind)
+        # A pair with no rows of this kind may have no file at all
+        missing = result_file is None or not Path(result_file).exists()
+        if missing and total != 0:
+            return jsonify({"error": "No results for this request and pair"}), 404
+        
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', 1000)), 1), MAX_RESULT_PAGE)
+        columns = request.args.get('columns')
+        columns = columns.split(',') if columns else None
+        
+        if request.args.get('format') == 'ndjson':
+            # Stream every row from offset onwards without building a page in memory
+            def generate():
+                if missing:
+                    return
+                for chunk in iter_result_rows(result_file, offset, limit, columns):
+                    yield chunk.to_json(orient='records', lines=True, date_format='iso').rstrip("\n") + "\n"
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        page = pd.DataFrame() if missing else read_result_page(result_file, offset, limit, columns)
+        
+        return jsonify({
+            "kind": kind,
+            "offset": offset,
+            "limit": limit,
+            "total": total,
+            "next_offset": offset + len(page) if len(page) == limit and (total is None or offset + len(page) < total) else None,
+            "rows": json.loads(page.to_json(orient='records', date_format='iso'))
+        })
         
-        return jsonify(processing_status[request_id])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/thresholds/upload', methods=['POST'])
 def upload_threshold_file():
@@ -162,43 +366,17 @@ def get_thresholds():
     """Get processed threshold data"""
     try:
         threshold_mode = request.args.get('mode', 'group')
-        threshold_file = processor.thresholds_dir / f"processed_thresholds_{threshold_mode}.csv"
+        store = processor.get_threshold_store(threshold_mode)
         
-        if not threshold_file.exists():
+        if not store.csv_path.exists():
             return jsonify([])
         
-        df = pd.read_csv(threshold_file)
-        
         if threshold_mode == 'group':
             # Group-wise: aggregate by group
-            grouped = df.groupby(['Adjusted_Group']).agg({
-                'Original_Threshold': 'max',
-                'Proposed_Threshold': 'max', 
-                'Adjusted_Threshold': 'max'
-            }).reset_index()
-            
-            result = []
-            for _, row in grouped.iterrows():
-                result.append({
-                    "id": len(result) + 1,
-                    "group": row['Adjusted_Group'],
-                    "originalThreshold": row['Original_Threshold'],
-                    "proposedThreshold": row['Proposed_Threshold'],
-                    "adjustedThreshold": row['Adjusted_Threshold']
-                })
+            result = store.group_view()
         else:
             # Currency-wise: individual currencies
-            result = []
-            for _, row in df.iterrows():
-                result.append({
-                    "id": len(result) + 1,
-                    "legalEntity": row['LegalEntity'],
-                    "currency": row['CCY'],
-                    "group": row['Adjusted_Group'],
-                    "originalThreshold": row['Original_Threshold'],
-                    "proposedThreshold": row['Proposed_Threshold'],
-                    "adjustedThreshold": row['Adjusted_Threshold']
-                })
+            result = store.currency_view()
         
         return jsonify(result)
         
@@ -211,31 +389,57 @@ def update_threshold(threshold_id):
     try:
         data = request.get_json()
         threshold_mode = request.args.get('mode', 'group')
-        threshold_file = processor.thresholds_dir / f"processed_thresholds_{threshold_mode}.csv"
+        store = processor.get_threshold_store(threshold_mode)
         
-        if not threshold_file.exists():
+        if not store.csv_path.exists():
             return jsonify({"error": "Threshold file not found"}), 404
         
-        df = pd.read_csv(threshold_file)
-        
         # Update logic depends on mode
         if threshold_mode == 'group':
             # Update all thresholds in the group
-            group_name = data.get('group')
-            new_threshold = data.get('adjustedThreshold')
-            
-            if group_name and new_threshold is not None:
-                df.loc[df['Adjusted_Group'] == group_name, 'Adjusted_Threshold'] = new_threshold
+            update = {
+                "group": data.get('group') or store.group_for_id(threshold_id),
+                "adjustedThreshold": data.get('adjustedThreshold')
+            }
         else:
-            # Update specific currency threshold
-            # Implementation depends on how you identify the specific row
-            pass
+            # Update specific currency threshold, by legalEntity/currency or by id;
+            # a group echoed back from the currency view must not widen the update
+            update = {"id": threshold_id, **{k: v for k, v in data.items() if k != 'group'}}
         
-        # Save updated file
-        df.to_csv(threshold_file, index=False)
+        changed = store.update([update])
         
-        return jsonify({"message": "Threshold updated successfully"})
+        return jsonify({"message": "Threshold updated successfully", "rows_updated": changed})
         
+    except ThresholdUpdateError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/thresholds', methods=['PATCH'])
+def update_thresholds_batch():
+    """Apply many group and/or currency threshold updates in one call"""
+    try:
+        data = request.get_json()
+        threshold_mode = request.args.get('mode', 'group')
+        store = processor.get_threshold_store(threshold_mode)
+        
+        if not store.csv_path.exists():
+            return jsonify({"error": "Threshold file not found"}), 404
+        
+        updates = data.get('updates') if isinstance(data, dict) else data
+        if not isinstance(updates, list):
+            return jsonify({"error": "Expected a list of updates"}), 400
+        
+        changed = store.update(updates)
+        
+        return jsonify({
+            "message": "Thresholds updated successfully",
+            "updates_applied": len(updates),
+            "rows_updated": changed
+        })
+        
+    except ThresholdUpdateError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -246,14 +450,27 @@ def analyze_deviation_buckets():
         data = request.get_json()
         threshold_mode = data.get('threshold_mode', 'group')
         
+        try:
+            bucket_edges = validate_bucket_edges(data.get('bucket_edges'))
+            exceeding_threshold = validate_exceeding_threshold(data.get('exceeding_threshold'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Each downloaded day is stored once, however many requested ranges cover it
+        uat_files = processor.dataset.partition_files("UAT")
+        if not uat_files:
+            return jsonify([])
+        
+        # Merge the precomputed per-file aggregates when the edges allow it
+        if processor.aggregate_store.supports_edges(bucket_edges):
+            buckets = processor.aggregate_store.deviation_buckets(uat_files, bucket_edges, exceeding_threshold)
+            return jsonify(buckets)
+        
         # Load all matched trade data
         trades_data = []
-        for uat_file in processor.trades_dir.rglob("UAT/*.gz"):
+        for uat_file in uat_files:
             try:
-                import gzip
-                with gzip.open(uat_file, 'rt') as f:
-                    df = pd.read_csv(f)
-                    trades_data.append(df)
+                trades_data.append(read_trades(uat_file, columns=['ccy_pair', 'deviation_percent']))
             except Exception:
                 continue
         
@@ -262,83 +479,133 @@ def analyze_deviation_buckets():
         
         combined_trades = pd.concat(trades_data, ignore_index=True)
         
-        # Apply threshold logic and create buckets
-        buckets = [
-            {"range": "0.0% - 0.5%", "USD": 0, "EUR": 0, "GBP": 0, "JPY": 0, "total": 0, "isExceeding": False},
-            {"range": "0.5% - 1.0%", "USD": 0, "EUR": 0, "GBP": 0, "JPY": 0, "total": 0, "isExceeding": True},
-            {"range": "1.0% - 2.0%", "USD": 0, "EUR": 0, "GBP": 0, "JPY": 0, "total": 0, "isExceeding": True},
-            {"range": "2.0% - 5.0%", "USD": 0, "EUR": 0, "GBP": 0, "JPY": 0, "total": 0, "isExceeding": True},
-            {"range": "5.0%+", "USD": 0, "EUR": 0, "GBP": 0, "JPY": 0, "total": 0, "isExceeding": True}
-        ]
-        
-        # Count alerts by currency and deviation range
-        for _, trade in combined_trades.iterrows():
-            deviation = float(trade.get('deviation_percent', 0))
-            ccy_pair = trade.get('ccy_pair', '')
-            
-            # Extract base and quote currencies
-            if len(ccy_pair) == 6:
-                base_ccy = ccy_pair[:3] 
-                quote_ccy = ccy_pair[3:]
-                
-                # Determine bucket
-                bucket_idx = 0
-                if deviation >= 5.0:
-                    bucket_idx = 4
-                elif deviation >= 2.0:
-                    bucket_idx = 3
-                elif deviation >= 1.0:
-                    bucket_idx = 2
-                elif deviation >= 0.5:
-                    bucket_idx = 1
-                
-                # Count for both currencies
-                for ccy in [base_ccy, quote_ccy]:
-                    if ccy in buckets[bucket_idx]:
-                        buckets[bucket_idx][ccy] += 1
-        
-        # Calculate totals
-        for bucket in buckets:
-            bucket["total"] = bucket["USD"] + bucket["EUR"] + bucket["GBP"] + bucket["JPY"]
+        # Bucket every trade in one pass and count each currency present
+        buckets = compute_deviation_buckets(
+            combined_trades,
+            edges=bucket_edges,
+            exceeding_threshold=exceeding_threshold
+        )
         
         return jsonify(buckets)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/analysis/alert-summary', methods=['POST'])
+def analyze_alert_summary():
+    """Alert severity counts per currency pair (and optionally legal entity)"""
+    try:
+        data = request.get_json() or {}
+        threshold_mode = data.get('threshold_mode', 'group')
+        group_by = data.get('group_by') or ['ccy_pair']
+        
+        try:
+            bands, labels = validate_alert_bands(data.get('alert_bands'), data.get('alert_labels'))
+            policy = validate_threshold_policy(data.get('threshold_policy'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not set(group_by) <= {'ccy_pair', 'legal_entity'}:
+            return jsonify({"error": "group_by must use ccy_pair and/or legal_entity"}), 400
+        
+        store = processor.get_threshold_store(threshold_mode)
+        if not store.csv_path.exists():
+            return jsonify({"error": "Threshold file not found"}), 404
+        
+        result = processor.cpu_executor.run(alert_summary_stage, uat_trade_loader(), store.threshold_map(),
+                                            group_by, bands, labels, policy)
+        return jsonify({"labels": labels, "threshold_policy": policy, **result})
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/analysis/threshold-sweep', methods=['POST'])
+def analyze_threshold_sweep():
+    """Alert counts for a group or currency across a range of candidate thresholds"""
+    try:
+        data = request.get_json() or {}
+        threshold_mode = data.get('threshold_mode', 'group')
+        
+        try:
+            candidates = sweep_candidates(data.get('candidates', {}))
+            policy = validate_threshold_policy(data.get('threshold_policy'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        store = processor.get_threshold_store(threshold_mode)
+        if not store.csv_path.exists():
+            return jsonify({"error": "Threshold file not found"}), 404
+        
+        # The thresholds being swept: every currency of a group, or one currency
+        if data.get('group') is not None:
+            rows = store.group_rows(data['group'])
+        else:
+            row = store.get(data.get('legalEntity'), data.get('currency'))
+            rows = [row] if row is not None else []
+        if not rows:
+            return jsonify({"error": "Unknown threshold group or currency"}), 400
+        
+        swept_keys = [(row['LegalEntity'], row['CCY']) for row in rows]
+        
+        # Alert counts at the current original/proposed/adjusted thresholds, for reference
+        reference = {}
+        for label, column in [("OrigAlerts", 'Original_Threshold'), ("ProjAlerts", 'Proposed_Threshold'),
+                              ("AdjAlerts", 'Adjusted_Threshold')]:
+            values = [row[column] for row in rows if row.get(column) is not None]
+            if values:
+                reference[label] = max(values)
+        
+        sweep = processor.cpu_executor.run(threshold_sweep_stage, uat_trade_loader(), store.threshold_map(),
+                                           swept_keys, candidates + list(reference.values()), policy)
+        if sweep is None:
+            return jsonify({"affected_trades": 0, "curve": [], "reference": {}})
+        
+        # The reference thresholds were evaluated as extra candidates on the same sort
+        curve = sweep["curve"]
+        sweep["curve"] = curve[:len(candidates)]
+        sweep["reference"] = {
+            label: point for label, point in zip(reference, curve[len(candidates):])
+        }
+        sweep["threshold_policy"] = policy
+        return jsonify(sweep)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/export/<data_type>', methods=['GET'])
 def export_data(data_type):
     """Export data as CSV"""
     try:
         if data_type == "trades":
-            # Export all matched trades
-            export_file = processor.base_dir / "exports" / "all_trades.csv"
-            export_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Combine all trade data
-            all_trades = []
-            for uat_file in processor.trades_dir.rglob("UAT/*.gz"):
-                try:
-                    import gzip
-                    with gzip.open(uat_file, 'rt') as f:
-                        df = pd.read_csv(f)
-                        all_trades.append(df)
-                except Exception:
-                    continue
-            
-            if all_trades:
-                combined_df = pd.concat(all_trades, ignore_index=True)
-                combined_df.to_csv(export_file, index=False)
-                return send_file(export_file, as_attachment=True)
+            # Stream UAT trades as CSV, filtered by legal_entity, source_system,
+            # ccy_pair and start_date/end_date; compress=gzip for a .csv.gz
+            filters = parse_export_filters(request.args)
+            compress = request.args.get('compress') == 'gzip'
+            uat_files = processor.dataset.partition_files("UAT")
+            if uat_files:
+                chunks, cache_hit = export_cache.stream(uat_files, filters, compress)
+                filename = "trades_export.csv.gz" if compress else "trades_export.csv"
+                return Response(
+                    stream_with_context(chunks),
+                    mimetype="application/gzip" if compress else "text/csv",
+                    headers={
+                        "Content-Disposition": f"attachment; filename={filename}",
+                        "X-Export-Cache": "hit" if cache_hit else "miss",
+                    },
+                )
             
         elif data_type == "thresholds":
             # Export current thresholds
-            threshold_file = processor.thresholds_dir / "processed_thresholds_group.csv"
+            # Fold logged slider updates into the CSV before sending it
+            store = processor.get_threshold_store('group')
+            threshold_file = store.csv_path.resolve()
             if threshold_file.exists():
+                store.compact()
                 return send_file(threshold_file, as_attachment=True)
         
         return jsonify({"error": "No data available for export"}), 404
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
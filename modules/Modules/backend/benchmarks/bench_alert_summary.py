@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the vectorized alert categorization and summary engine
+Runs summarize_alerts per ccy pair and legal entity at increasing row counts
+and reports ns/row
+
+Usage: python benchmarks/bench_alert_summary.py [--max-rows 10000000]
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from alerts import summarize_alerts
+from scaling import PAIRS, run_scaling
+
+LEGAL_ENTITIES = ['GSLB', 'GSI', 'GSCO']
+
+
+def make_trades(rows: int, seed: int = 42) -> pd.DataFrame:
+    """Build a trade frame with the columns the alert engine reads"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'ccypair': pd.Categorical.from_codes(rng.integers(0, len(PAIRS), rows), PAIRS).astype(object),
+        'legal_entity': pd.Categorical.from_codes(rng.integers(0, len(LEGAL_ENTITIES), rows), LEGAL_ENTITIES),
+        'deviation': rng.exponential(0.5, rows).round(4),
+        'final_threshold': rng.choice([0.1, 0.25, 0.5], rows),
+    })
+
+
+def main():
+    run_scaling(__doc__, make_trades, lambda trades: summarize_alerts(trades, group_by=['ccypair', 'legal_entity']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the vectorized deviation bucket engine
+Runs compute_deviation_buckets at increasing row counts and reports ns/row
+
+Usage: python benchmarks/bench_deviation_buckets.py [--max-rows 10000000]
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from buckets import compute_deviation_buckets
+from scaling import PAIRS, run_scaling
+
+
+def make_trades(rows: int, seed: int = 42) -> pd.DataFrame:
+    """Build a trade frame with the columns the bucket engine reads"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'ccy_pair': pd.Categorical.from_codes(rng.integers(0, len(PAIRS), rows), PAIRS).astype(object),
+        'deviation_percent': rng.exponential(1.0, rows).round(4),
+    })
+
+
+def main():
+    run_scaling(__doc__, make_trades, compute_deviation_buckets)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for the download -> match -> analyze -> export pipeline
+Downloads synthetic UAT/PROD trade sets from a stub API, then times matching,
+the analysis routes, threshold reads, market data enrichment and the trade
+export at each scale. Wall time, throughput and peak RSS per stage are
+compared against a JSON baseline; the run fails when a stage is slower or
+larger than the baseline by more than the tolerance.
+
+Usage: python benchmarks/bench_pipeline.py [--scales 10k,1m,10m] [--update-baseline]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Optional
+
+# Stages run in this process so their memory shows up in its RSS
+os.environ.setdefault("GFX_CPU_BACKEND", "thread")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import logging
+
+logging.disable(logging.INFO)
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline_pipeline.json"
+
+# Allowed slowdown or growth over the baseline before a stage fails
+DEFAULT_TOLERANCE = 0.25
+
+# Stages faster than this are too noisy to fail on time
+MIN_COMPARABLE_SECONDS = 0.05
+
+PRODUCT_TYPE = "FX_SPOT"
+LEGAL_ENTITY = "GSI"
+SOURCE_SYSTEM = "SLANG"
+START_DATE = "2024-01-01"
+END_DATE = "2024-01-31"
+
+# Threshold view requests per measurement; one read is too quick to time
+THRESHOLD_READS = 50
+
+# Trades enriched per measurement; a sample keeps KDB fixture sizes fixed
+ENRICH_SAMPLE_ROWS = 100_000
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # Peak, not current, where /proc is unavailable (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """Peak resident set size of this process while a stage runs"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+@contextmanager
+def measure(results: Dict, stage: str, rows: int = 0):
+    """Time a stage and sample its peak RSS; the block may set stats["rows"]"""
+    stats = {"rows": rows}
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        yield stats
+        seconds = time.perf_counter() - start
+    rows = stats["rows"]
+    results[stage] = {
+        "seconds": round(seconds, 4),
+        "rows": rows,
+        "rows_per_sec": round(rows / seconds) if seconds > 0 else None,
+        "peak_rss_mb": round(rss.peak / 1024 / 1024, 1),
+    }
+    print(f"  {stage:<18} {seconds:9.3f}s  {rows:>12,d} rows  "
+          f"{results[stage]['rows_per_sec'] or 0:>12,d} rows/s  {results[stage]['peak_rss_mb']:8.1f} MB")
+
+
+def _check(response, stage: str):
+    if response.status_code != 200:
+        raise RuntimeError(f"{stage} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def ensure_fixtures(fixtures_dir: Path, rows: int) -> Path:
+    """Synthetic trade files for one scale, generated once and reused across runs"""
+    from synthetic import write_trade_set
+    scale_dir = fixtures_dir / str(rows)
+    name = f"{PRODUCT_TYPE}_{LEGAL_ENTITY}_{SOURCE_SYSTEM}_{START_DATE}_{END_DATE}.gz"
+    if not all((scale_dir / env / name).exists() for env in ["UAT", "PROD"]):
+        print(f"  generating {rows:,d}-row fixtures in {scale_dir}")
+        write_trade_set(scale_dir, LEGAL_ENTITY, SOURCE_SYSTEM, rows, START_DATE, END_DATE, PRODUCT_TYPE)
+    return scale_dir
+
+
+def run_scale(rows: int, fixtures_dir: Path) -> Dict:
+    import pandas as pd
+    import api_server
+    from main import GFXDataProcessor, DataRequest
+    from exports import ExportCache
+    from stub_api import StubApiProcess
+    from synthetic import market_ticks, threshold_frame
+
+    scale_dir = ensure_fixtures(fixtures_dir, rows)
+    os.chdir(tempfile.mkdtemp(prefix="gfx_bench_"))
+
+    # Fresh processor per scale, downloading over HTTP from the stub
+    processor = GFXDataProcessor(use_mock_data=False,
+                                 kdb_fetcher=lambda pair, start, end: market_ticks(pair, start, end))
+    api_server.processor = processor
+    api_server.export_cache = ExportCache(processor.base_dir.resolve() / "exports" / "cache")
+    client = api_server.app.test_client()
+
+    thresholds = threshold_frame([LEGAL_ENTITY])
+    thresholds_path = Path("thresholds_upload.csv")
+    thresholds.to_csv(thresholds_path, index=False)
+    processor.process_threshold_file(str(thresholds_path), "group")
+
+    results: Dict = {}
+    with StubApiProcess(scale_dir) as stub:
+        processor.http_clients.base_urls.update(stub.base_urls)
+        request = DataRequest(PRODUCT_TYPE, [LEGAL_ENTITY], [SOURCE_SYSTEM], START_DATE, END_DATE,
+                              download_exceptions=False)
+        with measure(results, "download") as stats:
+            statuses = processor.process_parallel_downloads(request)
+            stats["rows"] = downloaded = sum(s.records_count for s in statuses)
+        failed = [s.error_message for s in statuses if s.status != "completed"]
+        if failed:
+            raise RuntimeError(f"download failed: {failed}")
+
+    with measure(results, "match", downloaded):
+        match = processor.match_uat_prod_trades(LEGAL_ENTITY, SOURCE_SYSTEM, PRODUCT_TYPE, START_DATE, END_DATE)
+    if "error" in match:
+        raise RuntimeError(f"match failed: {match['error']}")
+
+    with measure(results, "deviation_buckets", rows):
+        _check(client.post('/api/analysis/deviation-buckets', json={}), "deviation_buckets")
+
+    with measure(results, "alert_summary", rows):
+        _check(client.post('/api/analysis/alert-summary', json={"group_by": ["ccy_pair", "legal_entity"]}),
+               "alert_summary")
+
+    with measure(results, "threshold_reads", len(thresholds) * THRESHOLD_READS):
+        for _ in range(THRESHOLD_READS):
+            _check(client.get('/api/thresholds?mode=group'), "threshold_reads")
+
+    uat_file = scale_dir / "UAT" / f"{PRODUCT_TYPE}_{LEGAL_ENTITY}_{SOURCE_SYSTEM}_{START_DATE}_{END_DATE}.gz"
+    sample = pd.read_csv(uat_file, nrows=ENRICH_SAMPLE_ROWS, usecols=['ccy_pair', 'trade_date'])
+    sample = sample.rename(columns={'ccy_pair': 'CLEAN CCY Pair'})
+    with measure(results, "enrich_cold", len(sample)):
+        processor.enrich_trades_with_market_data(sample)
+    with measure(results, "enrich_warm", len(sample)):
+        processor.enrich_trades_with_market_data(sample)
+
+    with measure(results, "export", rows):
+        response = _check(client.get('/api/export/trades?compress=gzip'), "export")
+        for _ in response.response:
+            pass
+        response.close()
+
+    processor.cpu_executor.shutdown()
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Stages whose time or peak RSS exceeds the baseline by more than tolerance"""
+    failures = []
+    for scale, stages in results.items():
+        for stage, current in stages.items():
+            base = baseline.get(scale, {}).get(stage)
+            if base is None:
+                continue
+            if (current["seconds"] >= MIN_COMPARABLE_SECONDS
+                    and current["seconds"] > base["seconds"] * (1 + tolerance)):
+                failures.append(f"{scale}/{stage}: {current['seconds']:.3f}s vs baseline {base['seconds']:.3f}s")
+            if current["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+                failures.append(f"{scale}/{stage}: {current['peak_rss_mb']:.1f} MB vs baseline "
+                                f"{base['peak_rss_mb']:.1f} MB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default=",".join(SCALES),
+                        help=f"comma-separated subset of {', '.join(SCALES)}")
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="write this run's results into the baseline instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--fixtures', type=Path, default=Path(tempfile.gettempdir()) / "gfx_bench_fixtures")
+    parser.add_argument('--output', type=Path, help="also write this run's results as JSON")
+    parser.add_argument('--in-process', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    scales = [scale.strip().lower() for scale in args.scales.split(",") if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        parser.error(f"unknown scales: {', '.join(unknown)}")
+
+    if args.in_process:
+        results = {}
+        for scale in scales:
+            print(f"{scale} ({SCALES[scale]:,d} UAT rows)", flush=True)
+            results[scale] = run_scale(SCALES[scale], args.fixtures.resolve())
+        args.output.write_text(json.dumps(results, indent=2))
+        return
+
+    # One child process per scale, so peak RSS is not inherited from a larger run
+    results = {}
+    for scale in scales:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            scale_output = Path(f.name)
+        subprocess.run([sys.executable, str(Path(__file__).resolve()), '--in-process', '--scales', scale,
+                        '--fixtures', str(args.fixtures), '--output', str(scale_output)], check=True)
+        results.update(json.loads(scale_output.read_text()))
+        scale_output.unlink()
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.update_baseline:
+        baseline.setdefault("scales", {}).update(results)
+        baseline["machine"] = {"platform": platform.platform(), "python": platform.python_version(),
+                               "cpus": os.cpu_count()}
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline updated: {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+        return
+    failures = compare(results, baseline.get("scales", {}), args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"All stages within {args.tolerance:.0%} of the baseline")
+
+
+if __name__ == '__main__':
+    main()
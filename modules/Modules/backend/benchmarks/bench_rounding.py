@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark and Decimal cross-check for the vectorized half-up rounding
+Compares round_half_up against the per-element Decimal ROUND_HALF_UP apply,
+first for exactness on random decimals and ties, then for speed
+
+Usage: python benchmarks/bench_rounding.py [--max-rows 10000000] [--check-rows 200000]
+"""
+
+import argparse
+import sys
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rounding import round_half_up
+
+
+def round_half_up_val(x, places=4):
+    """Reference: the per-element Decimal implementation used on market data"""
+    if pd.isna(x):
+        return x
+    q = Decimal(1).scaleb(-places)
+    return float(Decimal(str(x)).quantize(q, rounding=ROUND_HALF_UP))
+
+
+def make_decimals(rows: int, seed: int = 42) -> pd.Series:
+    """Random signed decimals with up to 8 places, a share of exact ties and NaNs"""
+    rng = np.random.default_rng(seed)
+
+    # Integer mantissa / exact power of ten is the nearest double to the decimal
+    digits = rng.integers(0, 9, rows)
+    mantissa = rng.integers(-10 ** 9, 10 ** 9, rows)
+
+    # A quarter of the rows are exact ties (trailing 5) at 0 to 5 places
+    ties = rng.random(rows) < 0.25
+    mantissa[ties] = mantissa[ties] // 10 * 10 + np.where(mantissa[ties] < 0, -5, 5)
+    digits[ties] = rng.integers(1, 7, int(ties.sum()))
+
+    values = mantissa / 10.0 ** digits
+    values[rng.random(rows) < 0.01] = np.nan
+    return pd.Series(values)
+
+
+def check(rows: int) -> bool:
+    values = make_decimals(rows)
+    ok = True
+    for places in range(0, 9):
+        expected = values.apply(round_half_up_val, places=places).to_numpy()
+        got = round_half_up(values, places).to_numpy()
+        same = (got == expected) | (np.isnan(got) & np.isnan(expected))
+        mismatches = int((~same).sum())
+        print(f"places={places}: {mismatches} mismatches in {rows:,d} values")
+        if mismatches:
+            ok = False
+            print(pd.DataFrame({'value': values[~same], 'expected': expected[~same], 'got': got[~same]}).head())
+
+    for value, places, expected in [(0.15, 1, 0.2), (-0.15, 1, -0.2), (2.675, 2, 2.68), (1.005, 2, 1.01),
+                                    (0.125, 2, 0.13), (-2.5, 0, -3.0), (1.4999999999999, 0, 1.0)]:
+        got = round_half_up(value, places)
+        if got != expected:
+            ok = False
+            print(f"round_half_up({value}, {places}) = {got}, expected {expected}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--max-rows', type=int, default=10_000_000)
+    parser.add_argument('--check-rows', type=int, default=200_000)
+    parser.add_argument('--places', type=int, default=4)
+    args = parser.parse_args()
+
+    if not check(args.check_rows):
+        sys.exit(1)
+
+    sizes = [n for n in (10_000, 100_000, 1_000_000, 10_000_000) if n <= args.max_rows]
+    for rows in sizes:
+        values = make_decimals(rows)
+        start = time.perf_counter()
+        round_half_up(values, args.places)
+        vectorized = time.perf_counter() - start
+
+        # The Decimal apply is only timed on a sample; it is linear in rows
+        sample = values.iloc[:min(rows, 100_000)]
+        start = time.perf_counter()
+        sample.apply(round_half_up_val, places=args.places)
+        decimal = (time.perf_counter() - start) / len(sample) * rows
+
+        print(f"{rows:>12,d} rows  vectorized {vectorized:8.3f}s ({vectorized / rows * 1e9:6.1f} ns/row)  "
+              f"Decimal apply ~{decimal:8.3f}s  speed-up {decimal / vectorized:6.0f}x")
+
+
+if __name__ == '__main__':
+    main()
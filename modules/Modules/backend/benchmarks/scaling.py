@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Shared harness for the single-engine scaling benchmarks
+Times one function over synthetic trade frames at increasing row counts,
+reports ns/row and the per-row cost ratio of the two largest sizes
+"""
+
+import argparse
+import time
+from typing import Callable, List, Tuple
+
+import pandas as pd
+
+PAIRS = ['EURUSD', 'GBPUSD', 'USDJPY', 'USDCHF', 'USDCAD', 'EURGBP', 'AUDUSD', 'NZDUSD']
+
+SIZES = (10_000, 100_000, 1_000_000, 10_000_000)
+
+
+def time_best(fn: Callable[[pd.DataFrame], object], trades: pd.DataFrame, repeat: int) -> float:
+    """Fastest of repeat runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(trades)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_scaling(description: str, make_trades: Callable[[int], pd.DataFrame],
+                fn: Callable[[pd.DataFrame], object]) -> List[Tuple[int, float]]:
+    """Parse --max-rows/--repeat, time fn at each size and print the results"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--max-rows', type=int, default=10_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for rows in [n for n in SIZES if n <= args.max_rows]:
+        best = time_best(fn, make_trades(rows), args.repeat)
+        results.append((rows, best))
+        print(f"{rows:>12,d} rows  {best:8.3f}s  {best / rows * 1e9:8.1f} ns/row")
+
+    # Linear scaling keeps ns/row roughly flat from 1M rows upwards
+    if len(results) >= 2:
+        (small_rows, small_t), (big_rows, big_t) = results[-2], results[-1]
+        ratio = (big_t / big_rows) / (small_t / small_rows)
+        print(f"per-row cost ratio {big_rows:,d} vs {small_rows:,d}: {ratio:.2f}")
+    return results
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Stub UAT/PROD download API for benchmarks
+Serves synthetic trade files and EPE extracts from a fixtures directory as
+gzip-encoded, chunked responses, in the layout GFXDataProcessor requests
+
+    GET /{env}/trades?product_type=&legal_entity=&source_system=&start_date=&end_date=
+    GET /{env}/exceptions?start_date=&end_date=&status=
+
+Usage: python benchmarks/stub_api.py --fixtures /tmp/gfx_fixtures [--port 8099]
+"""
+
+import argparse
+import gzip
+import socket
+import subprocess
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synthetic import epe_frame
+
+# Bytes sent per HTTP chunk
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def trade_fixture_path(fixtures_dir: Path, environment: str, params: Dict[str, str]) -> Path:
+    """Same {ENV}/{product}_{LE}_{source}_{start}_{end}.gz layout as synthetic.write_trade_set"""
+    name = (f"{params.get('product_type')}_{params.get('legal_entity')}_{params.get('source_system')}_"
+            f"{params.get('start_date')}_{params.get('end_date')}.gz")
+    return Path(fixtures_dir) / environment.upper() / name
+
+
+def exception_fixture_path(fixtures_dir: Path, environment: str, params: Dict[str, str],
+                           rows: int) -> Path:
+    """EPE extract fixture, generated on first request"""
+    status = params.get('status', 'new').lower()
+    path = Path(fixtures_dir) / environment.upper() / "exceptions" / (
+        f"{params.get('start_date')}_{status}_{params.get('end_date')}_{rows}.csv.gz")
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".part")
+        with gzip.open(tmp_path, 'wt', compresslevel=1, newline='') as f:
+            epe_frame(status, rows, start_date=params.get('start_date')).to_csv(f, index=False)
+        tmp_path.replace(path)
+    return path
+
+
+def make_handler(fixtures_dir: Path, exception_rows: int):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if len(parts) != 2:
+                return self.send_error(404)
+
+            environment, resource = parts
+            if resource == "trades":
+                path = trade_fixture_path(fixtures_dir, environment, params)
+            elif resource == "exceptions":
+                path = exception_fixture_path(fixtures_dir, environment, params, exception_rows)
+            else:
+                return self.send_error(404)
+            if not path.exists():
+                return self.send_error(404, f"No fixture {path.name}")
+
+            # Fixtures are already gzip; requests decodes them while streaming
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            with open(path, 'rb') as f:
+                while True:
+                    block = f.read(STREAM_CHUNK_SIZE)
+                    if not block:
+                        break
+                    self.wfile.write(f"{len(block):X}\r\n".encode() + block + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubHandler
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubApiProcess:
+    """Runs the stub in a child process so serving does not compete for the GIL"""
+
+    def __init__(self, fixtures_dir: Path, exception_rows: int = 1000, port: Optional[int] = None):
+        self.fixtures_dir = Path(fixtures_dir)
+        self.exception_rows = exception_rows
+        self.port = port or free_port()
+        self._process: Optional[subprocess.Popen] = None
+
+    @property
+    def base_urls(self) -> Dict[str, str]:
+        return {env: f"http://127.0.0.1:{self.port}/{env.lower()}" for env in ["UAT", "PROD"]}
+
+    def __enter__(self) -> "StubApiProcess":
+        self._process = subprocess.Popen([
+            sys.executable, str(Path(__file__).resolve()),
+            "--fixtures", str(self.fixtures_dir), "--port", str(self.port),
+            "--exception-rows", str(self.exception_rows),
+        ])
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.5).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError("Stub API did not start")
+
+    def __exit__(self, *exc):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', type=Path, required=True)
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--exception-rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.fixtures, args.exception_rows))
+    print(f"Stub API serving {args.fixtures} on http://127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Deviation Bucket Engine
+Vectorized bucketing of trade deviations by currency
+"""
+
+from typing import List, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Lower edges (in %) of each deviation bucket; the last bucket is open-ended
+DEFAULT_BUCKET_EDGES = [0.0, 0.5, 1.0, 2.0, 5.0]
+
+# Buckets starting at or above this deviation are flagged as exceeding
+DEFAULT_EXCEEDING_THRESHOLD = 0.5
+
+
+def validate_bucket_edges(edges: Optional[Sequence[float]]) -> List[float]:
+    """Return bucket edges as floats, falling back to the defaults"""
+    if edges is None:
+        return list(DEFAULT_BUCKET_EDGES)
+
+    if not isinstance(edges, (list, tuple)):
+        raise ValueError("bucket_edges must be a list of numbers")
+    try:
+        values = [float(edge) for edge in edges]
+    except (TypeError, ValueError):
+        raise ValueError("bucket_edges must be a list of numbers")
+
+    if not values:
+        raise ValueError("bucket_edges must not be empty")
+    if any(np.isnan(values)) or any(b <= a for a, b in zip(values, values[1:])):
+        raise ValueError("bucket_edges must be strictly increasing")
+
+    return values
+
+
+def validate_exceeding_threshold(value) -> float:
+    """Return the exceeding threshold as a finite float, falling back to the default"""
+    if value is None:
+        return DEFAULT_EXCEEDING_THRESHOLD
+    try:
+        threshold = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("exceeding_threshold must be a number")
+    if not np.isfinite(threshold):
+        raise ValueError("exceeding_threshold must be finite")
+    return threshold
+
+
+def _format_edge(edge: float) -> str:
+    """Format a bucket edge, keeping at least one decimal place"""
+    return f"{edge:.1f}" if round(edge, 1) == edge else f"{edge:g}"
+
+
+def bucket_labels(edges: Sequence[float]) -> List[str]:
+    """Build range labels such as '0.5% - 1.0%' and '5.0%+'"""
+    labels = [f"{_format_edge(lo)}% - {_format_edge(hi)}%" for lo, hi in zip(edges, edges[1:])]
+    labels.append(f"{_format_edge(edges[-1])}%+")
+    return labels
+
+
+def assign_buckets(deviation: np.ndarray, edges: Sequence[float]) -> np.ndarray:
+    """Return the bucket index of every deviation value
+
+    Values below the first edge and missing values fall into the first bucket.
+    """
+    values = np.nan_to_num(np.asarray(deviation, dtype=float), nan=edges[0])
+    idx = np.searchsorted(np.asarray(edges, dtype=float), values, side="right") - 1
+    return np.clip(idx, 0, len(edges) - 1)
+
+
+def count_pair_buckets(ccy_pair: pd.Series, deviation: pd.Series,
+                       edges: Sequence[float]) -> pd.DataFrame:
+    """Count trades per currency pair and bucket (pairs x buckets)"""
+    n_buckets = len(edges)
+    codes, pairs = pd.factorize(ccy_pair, use_na_sentinel=True)
+    buckets = assign_buckets(pd.to_numeric(deviation, errors="coerce").to_numpy(), edges)
+
+    valid = codes >= 0
+    combined = codes[valid].astype(np.int64) * n_buckets + buckets[valid]
+    counts = np.bincount(combined, minlength=len(pairs) * n_buckets)
+
+    return pd.DataFrame(
+        counts.reshape(len(pairs), n_buckets),
+        index=pd.Index(pairs.astype(str), name="ccy_pair"),
+        columns=range(n_buckets),
+    )
+
+
+def currency_counts_from_pairs(pair_counts: pd.DataFrame) -> pd.DataFrame:
+    """Fold pair x bucket counts onto base and quote currency (currency x buckets)"""
+    pairs = pair_counts.index.to_series()
+    six_char = pairs.str.len() == 6
+    counts = pair_counts[six_char.to_numpy()]
+    pairs = pairs[six_char]
+
+    if counts.empty:
+        return pd.DataFrame(columns=pair_counts.columns, dtype=np.int64)
+
+    # Each trade counts once for its base and once for its quote currency
+    by_base = counts.groupby(pairs.str[:3].to_numpy()).sum()
+    by_quote = counts.groupby(pairs.str[3:].to_numpy()).sum()
+    return pd.concat([by_base, by_quote]).groupby(level=0).sum().sort_index()
+
+
+def format_buckets(ccy_counts: pd.DataFrame, edges: Sequence[float],
+                   exceeding_threshold: float = DEFAULT_EXCEEDING_THRESHOLD) -> List[Dict]:
+    """Render currency x bucket counts in the dashboard's bucket JSON shape"""
+    result = []
+    for idx, label in enumerate(bucket_labels(edges)):
+        bucket = {"range": label}
+        column = ccy_counts[idx] if idx in ccy_counts.columns else pd.Series(dtype=np.int64)
+        for ccy, count in column.items():
+            bucket[str(ccy)] = int(count)
+        bucket["total"] = int(column.sum())
+        bucket["isExceeding"] = bool(edges[idx] >= exceeding_threshold)
+        result.append(bucket)
+    return result
+
+
+def compute_deviation_buckets(trades: pd.DataFrame,
+                              edges: Optional[Sequence[float]] = None,
+                              exceeding_threshold: float = DEFAULT_EXCEEDING_THRESHOLD) -> List[Dict]:
+    """Bucket trades by deviation_percent and count every currency present"""
+    edges = validate_bucket_edges(edges)
+    pair_counts = count_pair_buckets(trades['ccy_pair'], trades['deviation_percent'], edges)
+    return format_buckets(currency_counts_from_pairs(pair_counts), edges, exceeding_threshold)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Partitioned Trade Dataset
+Trades stored once per environment/product/LE/source/trade day and read
+back for any date range from just the partitions it covers, with a
+checksummed manifest of the days already downloaded
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List, Dict, Optional, Sequence, Iterator, Union
+
+import pandas as pd
+import logging
+
+from aggregates import write_aggregate
+from trade_store import Filter, apply_trade_dtypes, file_fingerprint, iter_trades, read_trades
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Parquet day files when pyarrow is installed, gzip CSV otherwise
+PARTITION_SUFFIX = ".parquet" if pq is not None else ".gz"
+
+# Per partition directory: {YYYY-MM-DD: {rows, sha256, size, mtime_ns, final}}
+MANIFEST_NAME = "manifest.json"
+
+# Written next to an assembled window file: the slice checksums it was built from
+WINDOW_META_SUFFIX = ".slices.json"
+
+DateLike = Union[str, date, datetime]
+
+# Manifest read-modify-writes; ingest may run in a worker process, so
+# manifests are only ever updated from this one
+_manifest_lock = threading.Lock()
+
+
+def to_date(value: DateLike) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def date_range(start: DateLike, end: DateLike) -> List[date]:
+    """Every calendar day from start to end inclusive"""
+    start, end = to_date(start), to_date(end)
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def file_checksum(path: Path, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _day_key(day: DateLike) -> str:
+    return to_date(day).strftime("%Y-%m-%d")
+
+
+def _as_list(value: Union[str, Sequence[str]]) -> List[str]:
+    return [value] if isinstance(value, str) else list(value)
+
+
+class TradeDataset:
+    """{root}/{env}/{product}/{legal_entity}/{source}/{YYYY-MM-DD}.parquet
+
+    A day file exists once that day has been downloaded, even if it has no
+    trades. Each partition directory also has a manifest of its day files'
+    row counts and checksums; a day counts as present only when its manifest
+    entry is final (the day had ended when it was fetched) and the file on
+    disk still matches the checksum.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def partition_dir(self, environment: str, product_type: str, legal_entity: str, source_system: str) -> Path:
+        return self.root / environment / product_type / legal_entity / source_system
+
+    def partition_path(self, environment: str, product_type: str, legal_entity: str,
+                       source_system: str, day: DateLike) -> Path:
+        directory = self.partition_dir(environment, product_type, legal_entity, source_system)
+        return directory / f"{to_date(day).strftime('%Y-%m-%d')}{PARTITION_SUFFIX}"
+
+    # -- coverage ------------------------------------------------------
+
+    def available_days(self, environment: str, product_type: str, legal_entity: str,
+                       source_system: str) -> List[date]:
+        directory = self.partition_dir(environment, product_type, legal_entity, source_system)
+        if not directory.exists():
+            return []
+        return sorted(to_date(path.name[:10]) for path in directory.glob(f"*{PARTITION_SUFFIX}"))
+
+    def manifest_path(self, environment: str, product_type: str, legal_entity: str, source_system: str) -> Path:
+        return self.partition_dir(environment, product_type, legal_entity, source_system) / MANIFEST_NAME
+
+    def manifest(self, environment: str, product_type: str, legal_entity: str,
+                 source_system: str) -> Dict[str, Dict]:
+        """{YYYY-MM-DD: entry} for every day slice recorded in a partition"""
+        path = self.manifest_path(environment, product_type, legal_entity, source_system)
+        if not path.exists():
+            return {}
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+            return {}
+
+    def _save_manifest(self, path: Path, manifest: Dict[str, Dict]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(MANIFEST_NAME + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def record_days(self, environment: str, product_type: str, legal_entity: str,
+                    source_system: str, rows_by_day: Dict[str, int]) -> Dict[str, Dict]:
+        """Checksum freshly written day files and add them to the manifest
+
+        Days that had not ended yet are recorded as not final, so the next
+        request fetches them again.
+        """
+        today = date.today()
+        entries = {}
+        for day, rows in rows_by_day.items():
+            path = self.partition_path(environment, product_type, legal_entity, source_system, day)
+            entries[_day_key(day)] = {
+                "rows": int(rows),
+                "sha256": file_checksum(path),
+                **file_fingerprint(path),
+                "final": to_date(day) < today,
+            }
+
+        manifest_path = self.manifest_path(environment, product_type, legal_entity, source_system)
+        with _manifest_lock:
+            manifest = self.manifest(environment, product_type, legal_entity, source_system)
+            manifest.update(entries)
+            self._save_manifest(manifest_path, manifest)
+        return entries
+
+    def _verified(self, path: Path, entry: Optional[Dict]) -> bool:
+        """True if a final manifest entry still describes the file on disk"""
+        if not entry or not entry.get("final") or not path.exists():
+            return False
+        fingerprint = file_fingerprint(path)
+        if all(entry.get(key) == value for key, value in fingerprint.items()):
+            return True
+        # Touched but maybe unchanged (e.g. copied); only the checksum decides
+        return file_checksum(path) == entry.get("sha256")
+
+    def missing_days(self, environment: str, product_type: str, legal_entity: str,
+                     source_system: str, start_date: DateLike, end_date: DateLike) -> List[date]:
+        """Days in the range without a verified, final slice"""
+        manifest = self.manifest(environment, product_type, legal_entity, source_system)
+        return [day for day in date_range(start_date, end_date)
+                if not self._verified(self.partition_path(environment, product_type, legal_entity,
+                                                          source_system, day),
+                                      manifest.get(_day_key(day)))]
+
+    def range_rows(self, environment: str, product_type: str, legal_entity: str,
+                   source_system: str, start_date: DateLike, end_date: DateLike) -> int:
+        """Rows recorded in the manifest for the days of a range"""
+        manifest = self.manifest(environment, product_type, legal_entity, source_system)
+        return sum(manifest.get(_day_key(day), {}).get("rows", 0) for day in date_range(start_date, end_date))
+
+    def slice_checksums(self, environment: str, product_type: str, legal_entity: str,
+                        source_system: str, start_date: DateLike, end_date: DateLike) -> Dict[str, Optional[str]]:
+        manifest = self.manifest(environment, product_type, legal_entity, source_system)
+        return {_day_key(day): manifest.get(_day_key(day), {}).get("sha256")
+                for day in date_range(start_date, end_date)}
+
+    # -- writes --------------------------------------------------------
+
+    def write_day(self, environment: str, product_type: str, legal_entity: str,
+                  source_system: str, day: DateLike, trades: pd.DataFrame) -> Path:
+        """Replace one day's partition atomically"""
+        path = self.partition_path(environment, product_type, legal_entity, source_system, day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        if pq is not None:
+            trades.to_parquet(tmp_path, index=False)
+        else:
+            trades.to_csv(tmp_path, index=False, compression="gzip")
+        os.replace(tmp_path, path)
+        return path
+
+    def ingest(self, path: Path, environment: str, product_type: str, legal_entity: str,
+               source_system: str, start_date: DateLike, end_date: DateLike,
+               chunksize: int = 500_000, date_column: str = "trade_date",
+               aggregate: bool = False) -> Dict:
+        """Split a downloaded range file into day partitions
+
+        The download is authoritative for every day from start_date to
+        end_date: each of those partitions is rewritten, empty days included.
+        Rows dated outside the window are ignored. Days outside the window
+        are never touched. The result's rows_by_day is what record_days
+        expects once the partitions should count as downloaded. With
+        aggregate, each day's bucket aggregate is written from the rows in
+        hand rather than by reading the day file back.
+        """
+        days = date_range(start_date, end_date)
+        window_start = pd.Timestamp(days[0])
+        window_end = pd.Timestamp(days[-1]) + pd.Timedelta(days=1)
+
+        # Each chunk's day groups are spilled as they arrive, so at most one
+        # chunk and then one day are in memory rather than the whole window
+        spill_root = Path(tempfile.mkdtemp(prefix="gfx_ingest_"))
+        try:
+            columns = None
+            for chunk_no, chunk in enumerate(iter_trades(path, chunksize=chunksize)):
+                columns = list(chunk.columns)
+                dates = pd.to_datetime(chunk[date_column], errors="coerce")
+                in_window = (dates >= window_start) & (dates < window_end)
+                chunk = chunk[in_window]
+                for day, frame in chunk.groupby(dates[in_window].dt.date, sort=False):
+                    day_dir = spill_root / _day_key(day)
+                    day_dir.mkdir(exist_ok=True)
+                    frame.to_pickle(day_dir / f"{chunk_no:05d}.pkl")
+
+            rows_by_day = {}
+            for day in days:
+                day_dir = spill_root / _day_key(day)
+                parts = sorted(day_dir.glob("*.pkl")) if day_dir.exists() else []
+                trades = (pd.concat([pd.read_pickle(part) for part in parts], ignore_index=True) if parts
+                          else pd.DataFrame(columns=columns or []))
+                path = self.write_day(environment, product_type, legal_entity, source_system, day, trades)
+                if aggregate:
+                    write_aggregate(path, frames=[trades])
+                rows_by_day[_day_key(day)] = len(trades)
+                shutil.rmtree(day_dir, ignore_errors=True)
+        finally:
+            shutil.rmtree(spill_root, ignore_errors=True)
+
+        rows = sum(rows_by_day.values())
+        logger.info(f"Partitioned {rows} {environment} trades for {legal_entity}/{source_system} "
+                    f"into {len(days)} day(s)")
+        return {"days_written": len(days), "rows": rows, "rows_by_day": rows_by_day}
+
+    # -- reads ---------------------------------------------------------
+
+    def _read_partition(self, path: Path, columns: Optional[List[str]],
+                        filters: List[Filter]) -> pd.DataFrame:
+        if PARTITION_SUFFIX == ".parquet":
+            if columns is not None:
+                names = pq.ParquetFile(path).schema_arrow.names
+                columns = [column for column in columns if column in names]
+            df = pd.read_parquet(path, columns=columns, filters=filters or None)
+            return apply_trade_dtypes(df) if len(df) else df
+        return read_trades(path, columns=columns, filters=filters)
+
+    def range_files(self, environment: str, product_type: str,
+                    legal_entities: Union[str, Sequence[str]], source_systems: Union[str, Sequence[str]],
+                    start_date: DateLike, end_date: DateLike) -> List[Path]:
+        """Day partitions on disk for a range, oldest first"""
+        paths = []
+        for day in date_range(start_date, end_date):
+            for legal_entity in _as_list(legal_entities):
+                for source_system in _as_list(source_systems):
+                    path = self.partition_path(environment, product_type, legal_entity, source_system, day)
+                    if path.exists():
+                        paths.append(path)
+        return paths
+
+    def partition_files(self, environment: str) -> List[Path]:
+        """Every day partition of an environment, across products, legal entities and sources"""
+        directory = self.root / environment
+        if not directory.exists():
+            return []
+        return sorted(directory.glob(f"*/*/*/*{PARTITION_SUFFIX}"))
+
+    def iter_range(self, environment: str, product_type: str,
+                   legal_entities: Union[str, Sequence[str]], source_systems: Union[str, Sequence[str]],
+                   start_date: DateLike, end_date: DateLike,
+                   columns: Optional[Sequence[str]] = None,
+                   filters: Optional[Sequence[Filter]] = None) -> Iterator[pd.DataFrame]:
+        """Yield one frame per non-empty day partition in the range, oldest first"""
+        columns = list(columns) if columns is not None else None
+        filters = list(filters or [])
+        for path in self.range_files(environment, product_type, legal_entities, source_systems,
+                                     start_date, end_date):
+            df = self._read_partition(path, columns, filters)
+            if len(df):
+                yield df
+
+    def read_range(self, environment: str, product_type: str,
+                   legal_entities: Union[str, Sequence[str]], source_systems: Union[str, Sequence[str]],
+                   start_date: DateLike, end_date: DateLike,
+                   columns: Optional[Sequence[str]] = None,
+                   filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+        """Trades for any date range, reading only the day partitions inside it"""
+        frames = list(self.iter_range(environment, product_type, legal_entities, source_systems,
+                                      start_date, end_date, columns, filters))
+        if not frames:
+            return pd.DataFrame(columns=columns or [])
+        return apply_trade_dtypes(pd.concat(frames, ignore_index=True))
+
+    # -- assembled windows ---------------------------------------------
+
+    def write_range(self, path: Path, environment: str, product_type: str, legal_entity: str,
+                    source_system: str, start_date: DateLike, end_date: DateLike) -> int:
+        """Write a range's day partitions, oldest first, as one CSV (gzip for .gz) like a download
+
+        Only for consumers that need a single file, such as EPE consolidation;
+        trade readers go through the partitions directly.
+
+        Returns the row count. Every day in the range must have a partition.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".part")
+        rows = 0
+        header = True
+        try:
+            opener = gzip.open if path.suffix == ".gz" else open
+            with opener(tmp_path, 'wt', newline='') as out:
+                for day in date_range(start_date, end_date):
+                    day_path = self.partition_path(environment, product_type, legal_entity, source_system, day)
+                    df = self._read_partition(day_path, None, [])
+                    if header or len(df):
+                        df.to_csv(out, index=False, header=header)
+                    header = False
+                    rows += len(df)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        logger.info(f"Assembled {rows} {environment} rows for {legal_entity}/{source_system} into {path.name}")
+        return rows
+
+    def window_rows(self, path: Path, environment: str, product_type: str, legal_entity: str,
+                    source_system: str, start_date: DateLike, end_date: DateLike) -> Optional[int]:
+        """Row count of a window file if it is unchanged and was built from the current slices"""
+        path = Path(path)
+        meta_path = path.with_name(path.name + WINDOW_META_SUFFIX)
+        if not path.exists() or not meta_path.exists():
+            return None
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        slices = self.slice_checksums(environment, product_type, legal_entity, source_system, start_date, end_date)
+        if meta.get("slices") != slices or meta.get("fingerprint") != file_fingerprint(path):
+            return None
+        return meta.get("rows")
+
+    def record_window(self, path: Path, environment: str, product_type: str, legal_entity: str,
+                      source_system: str, start_date: DateLike, end_date: DateLike, rows: int):
+        path = Path(path)
+        meta = {
+            "slices": self.slice_checksums(environment, product_type, legal_entity, source_system,
+                                           start_date, end_date),
+            "fingerprint": file_fingerprint(path),
+            "rows": rows,
+        }
+        with open(path.with_name(path.name + WINDOW_META_SUFFIX), 'w') as f:
+            json.dump(meta, f)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - EPE Exception Consolidation
+Streams the Closed and new EPE extracts of one environment into a single
+de-duplicated CSV, skipping sides whose inputs have not changed
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import List, Dict
+
+import numpy as np
+import pandas as pd
+import logging
+
+from trade_store import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ID_COLUMN = "exception_id"
+
+DEFAULT_CHUNK_ROWS = 200_000
+
+# Hashes buffered before being merged into the sorted seen-id array
+SEEN_BUFFER_SIZE = 1_000_000
+
+META_SUFFIX = ".meta.json"
+
+
+def _in_sorted(sorted_hashes: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+    """Membership by binary search, O(n log m) without re-sorting sorted_hashes"""
+    if not len(sorted_hashes):
+        return np.zeros(len(hashes), dtype=bool)
+    idx = np.searchsorted(sorted_hashes, hashes)
+    np.minimum(idx, len(sorted_hashes) - 1, out=idx)
+    return sorted_hashes[idx] == hashes
+
+
+class _SeenIds:
+    """Set of 64-bit id hashes kept as sorted numpy arrays (8 bytes per id)"""
+
+    def __init__(self):
+        self._sorted = np.empty(0, dtype=np.uint64)
+        self._buffer: List[np.ndarray] = []
+        self._buffered = 0
+
+    def _contains(self, hashes: np.ndarray) -> np.ndarray:
+        found = _in_sorted(self._sorted, hashes)
+        for block in self._buffer:
+            found |= _in_sorted(block, hashes)
+        return found
+
+    def add_new(self, hashes: np.ndarray) -> np.ndarray:
+        """Mask of hashes not seen before (first occurrence only), recording them"""
+        first = np.zeros(len(hashes), dtype=bool)
+        first[np.unique(hashes, return_index=True)[1]] = True
+        keep = first & ~self._contains(hashes)
+
+        fresh = hashes[keep]
+        if len(fresh):
+            self._buffer.append(np.sort(fresh))
+            self._buffered += len(fresh)
+            if self._buffered >= SEEN_BUFFER_SIZE:
+                self._sorted = np.union1d(self._sorted, np.concatenate(self._buffer))
+                self._buffer, self._buffered = [], 0
+        return keep
+
+
+def _hash_ids(ids: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(ids.str.strip(), index=False).to_numpy()
+
+
+def _header(path: Path) -> List[str]:
+    return list(pd.read_csv(path, dtype=str, nrows=0).columns)
+
+
+def _inputs_fingerprint(paths: Dict[str, Path]) -> Dict:
+    return {name: file_fingerprint(path) for name, path in paths.items()}
+
+
+def consolidate_side(closed_path: Path, new_path: Path, output_path: Path,
+                     id_column: str = DEFAULT_ID_COLUMN,
+                     chunksize: int = DEFAULT_CHUNK_ROWS,
+                     force: bool = False) -> Dict:
+    """Stream one environment's Closed then new extract into output_path
+
+    An exception present in both keeps its Closed row; repeats within a file
+    keep the first row. Counts are taken during the same pass. When the
+    inputs' fingerprints match the last run and the output still exists,
+    the previous result is returned without reading anything.
+    """
+    closed_path, new_path, output_path = Path(closed_path), Path(new_path), Path(output_path)
+    missing = [str(p) for p in (closed_path, new_path) if not p.exists()]
+    if missing:
+        raise FileNotFoundError(f"EPE extract not found: {', '.join(missing)}")
+
+    meta_path = output_path.with_name(output_path.name + META_SUFFIX)
+    fingerprint = _inputs_fingerprint({"closed": closed_path, "new": new_path})
+    if not force and output_path.exists() and meta_path.exists():
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("inputs") == fingerprint:
+            logger.info(f"EPE inputs unchanged, reusing {output_path.name}")
+            return {**meta["result"], "skipped": True}
+
+    # Union of both headers, in file order, so every chunk lines up
+    columns = _header(closed_path)
+    columns += [c for c in _header(new_path) if c not in columns]
+    if id_column not in columns:
+        raise ValueError(f"EPE extracts have no {id_column} column")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".part")
+    seen = _SeenIds()
+    counts = {"closed": 0, "new": 0}
+    duplicates = 0
+
+    try:
+        with open(tmp_path, 'w', newline='') as out:
+            pd.DataFrame(columns=columns).to_csv(out, index=False)
+            for side, path in (("closed", closed_path), ("new", new_path)):
+                for chunk in pd.read_csv(path, dtype=str, chunksize=chunksize, keep_default_na=False,
+                                         na_values=[""]):
+                    # Rows without an id cannot be matched up, so they are all kept
+                    ids = chunk[id_column]
+                    has_id = ids.notna().to_numpy()
+                    keep = ~has_id
+                    keep[has_id] = seen.add_new(_hash_ids(ids[has_id]))
+                    duplicates += int((~keep).sum())
+                    kept = chunk[keep].reindex(columns=columns)
+                    kept.to_csv(out, index=False, header=False)
+                    counts[side] += len(kept)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    result = {
+        "consolidated_len": counts["closed"] + counts["new"],
+        "closed_count": counts["closed"],
+        "open_count": counts["new"],
+        "duplicates_dropped": duplicates,
+        "output_file": str(output_path),
+    }
+    with open(meta_path, 'w') as f:
+        json.dump({"inputs": fingerprint, "result": result}, f)
+
+    logger.info(f"Consolidated {output_path.name}: {result['closed_count']} closed, "
+                f"{result['open_count']} open, {duplicates} duplicates dropped")
+    return {**result, "skipped": False}
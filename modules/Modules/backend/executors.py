@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - CPU Stage Executor
+Runs CPU-bound stages (parsing, matching, aggregation, alert summaries and
+threshold sweeps) inline or in a process pool
+
+Multi-core scaling is opt-in: the default "thread" backend runs every stage
+inline on the calling thread, and GFX_CPU_BACKEND=process moves stages into
+a spawn pool so they are not serialized by the GIL in the download threads.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+CPU_BACKENDS = ("thread", "process")
+
+# Inline by default; GFX_CPU_BACKEND=process opts in to the spawn pool. Its
+# workers re-import the launching script, so scripts need a __main__ guard
+DEFAULT_CPU_BACKEND = os.environ.get("GFX_CPU_BACKEND", "thread")
+
+
+class CpuExecutor:
+    """Runs CPU stages inline ("thread") or in a shared process pool ("process")
+
+    Stage functions must be module-level so they can be pickled, and should
+    return small results (counts, file paths) rather than DataFrames.
+    """
+
+    def __init__(self, backend: str = DEFAULT_CPU_BACKEND, max_workers: Optional[int] = None):
+        if backend not in CPU_BACKENDS:
+            raise ValueError(f"Unknown CPU backend: {backend} (expected one of {CPU_BACKENDS})")
+        self.backend = backend
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a multi-threaded Flask worker can deadlock
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info(f"Started CPU process pool with {self.max_workers} workers")
+            return self._pool
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Schedule a stage; the thread backend runs it immediately"""
+        if self.backend == "thread":
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        pool = self._get_pool()
+        try:
+            return pool.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            raise
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a stage and wait for its result"""
+        if self.backend == "thread":
+            return self.submit(fn, *args, **kwargs).result()
+        pool = self._get_pool()
+        try:
+            return pool.submit(fn, *args, **kwargs).result()
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            raise
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Shut down a pool poisoned by a crashed worker so the next call starts a new one"""
+        pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Trade Export
+Filtered CSV exports streamed chunk by chunk, optionally gzipped, and
+cached by the fingerprints of the files they were built from
+"""
+
+import hashlib
+import json
+import os
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Dict, Optional, Sequence, Iterator, Tuple
+
+import logging
+
+from trade_store import Filter, file_fingerprint, iter_trades
+
+logger = logging.getLogger(__name__)
+
+# Query parameters accepted as export filters, and the trade column each one filters
+EXPORT_FILTER_COLUMNS = {
+    "legal_entity": "legal_entity",
+    "source_system": "source_system",
+    "ccy_pair": "ccy_pair",
+}
+
+# Cached exports kept on disk; the least recently used are removed first
+DEFAULT_MAX_CACHED_EXPORTS = 20
+
+EXPORT_CHUNK_ROWS = 100_000
+
+# Bytes read per chunk when replaying a cached export
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_export_filters(args: Dict[str, str]) -> List[Filter]:
+    """Build trade filters from query parameters; list values are comma-separated"""
+    filters: List[Filter] = []
+    for param, column in EXPORT_FILTER_COLUMNS.items():
+        if args.get(param):
+            values = [value.strip() for value in args[param].split(",") if value.strip()]
+            filters.append((column, "in", values))
+
+    try:
+        if args.get("start_date"):
+            filters.append(("trade_date", ">=", datetime.strptime(args["start_date"], "%Y-%m-%d")))
+        if args.get("end_date"):
+            end = datetime.strptime(args["end_date"], "%Y-%m-%d") + timedelta(days=1)
+            filters.append(("trade_date", "<", end))
+    except ValueError:
+        raise ValueError("start_date and end_date must be YYYY-MM-DD")
+    return filters
+
+
+def _file_may_match(path: Path, filters: Sequence[Filter]) -> bool:
+    """Skip day partitions whose path rules them out: .../{LE}/{source}/{YYYY-MM-DD}.parquet
+
+    Legal entity and source come from directory names, so underscores in
+    them are harmless. A file whose name is not a day is read and filtered.
+    """
+    try:
+        day = datetime.strptime(path.name[:10], "%Y-%m-%d")
+    except ValueError:
+        return True
+    legal_entity, source_system = path.parent.parent.name, path.parent.name
+    for column, op, value in filters:
+        if column == "legal_entity" and legal_entity not in value:
+            return False
+        if column == "source_system" and source_system not in value:
+            return False
+        if column == "trade_date" and op == ">=" and day + timedelta(days=1) <= value:
+            return False
+        if column == "trade_date" and op == "<" and day >= value:
+            return False
+    return True
+
+
+def _csv_chunks(paths: Sequence[Path], filters: Sequence[Filter]) -> Iterator[bytes]:
+    """Filtered rows of every file as CSV bytes, with a single header"""
+    columns: Optional[List[str]] = None
+    for path in paths:
+        try:
+            for chunk in iter_trades(path, filters=filters, chunksize=EXPORT_CHUNK_ROWS):
+                if columns is None:
+                    columns = list(chunk.columns)
+                    yield chunk.iloc[:0].to_csv(index=False).encode()
+                if len(chunk):
+                    yield chunk.reindex(columns=columns).to_csv(index=False, header=False).encode()
+        except Exception as e:
+            # A silently skipped file would be cached as a complete export
+            logger.error(f"Export failed reading {path.name}: {str(e)}")
+            raise
+
+
+def _gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class ExportCache:
+    """Completed exports on disk, keyed by input fingerprints, filters and encoding"""
+
+    def __init__(self, cache_dir: Path, max_entries: int = DEFAULT_MAX_CACHED_EXPORTS):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+
+    def key(self, paths: Sequence[Path], filters: Sequence[Filter], compress: bool) -> str:
+        payload = {
+            "inputs": sorted((str(path), file_fingerprint(path)) for path in paths),
+            "filters": filters,
+            "compress": compress,
+        }
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, key: str, compress: bool) -> Path:
+        return self.cache_dir / f"{key}.csv{'.gz' if compress else ''}"
+
+    def _prune(self):
+        # Replays hold an open handle, so removing their file does not cut them short
+        entries = sorted(self.cache_dir.glob("*.csv*"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for stale in [p for p in entries if not p.name.endswith(".part")][self.max_entries:]:
+            stale.unlink(missing_ok=True)
+
+    def stream(self, paths: Sequence[Path], filters: Sequence[Filter],
+               compress: bool = False) -> Tuple[Iterator[bytes], bool]:
+        """(byte iterator, cache hit) for an export of paths under filters
+
+        A miss streams rows to the caller while writing them to a private
+        temp file that becomes the cache entry only if the export completes.
+        """
+        paths = [Path(p) for p in paths if _file_may_match(Path(p), filters)]
+        key = self.key(paths, filters, compress)
+        cached = self.path(key, compress)
+
+        # Opened here rather than in the generator, so a concurrent prune
+        # between this check and the first read cannot remove it
+        try:
+            handle = open(cached, 'rb')
+        except FileNotFoundError:
+            return self._build(paths, filters, compress, cached), False
+        try:
+            os.utime(cached)
+        except FileNotFoundError:
+            pass
+        return self._replay(handle), True
+
+    def _replay(self, handle) -> Iterator[bytes]:
+        with handle:
+            while True:
+                block = handle.read(READ_CHUNK_SIZE)
+                if not block:
+                    break
+                yield block
+
+    def _build(self, paths: Sequence[Path], filters: Sequence[Filter],
+               compress: bool, cached: Path) -> Iterator[bytes]:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Unique temp name so concurrent exports never write the same file
+        tmp_path = cached.with_name(f"{cached.name}.{uuid.uuid4().hex}.part")
+        chunks = _csv_chunks(paths, filters)
+        if compress:
+            chunks = _gzip_chunks(chunks)
+
+        completed = False
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, cached)
+            completed = True
+            self._prune()
+        finally:
+            if not completed:
+                # Client went away or a source failed; the partial file is not a valid entry
+                tmp_path.unlink(missing_ok=True)
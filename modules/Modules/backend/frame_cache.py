@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Frame Cache
+Process-wide LRU of parsed DataFrames, bounded by total bytes
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Callable, Optional
+
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default budget for cached frames; override with GFX_FRAME_CACHE_MB
+DEFAULT_MAX_BYTES = int(os.environ.get("GFX_FRAME_CACHE_MB", "512")) * 1024 * 1024
+
+
+def frame_nbytes(frame: Optional[pd.DataFrame]) -> int:
+    """In-memory size of a frame, including object column contents"""
+    if frame is None:
+        return 0
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+class FrameCache:
+    """Thread-safe LRU of DataFrames evicted by total size rather than count
+
+    Keys should include a file fingerprint so a rewritten file misses
+    instead of serving stale rows. Cached frames are shared: callers must
+    not modify them in place.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Optional[pd.DataFrame]]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Optional[pd.DataFrame]]) -> Optional[pd.DataFrame]:
+        """Return the cached frame for key, loading and caching it on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Load outside the lock so slow reads of different keys overlap
+        frame = loader()
+        self.put(key, frame)
+        return frame
+
+    def put(self, key: Hashable, frame: Optional[pd.DataFrame]):
+        size = frame_nbytes(frame)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            if size > self.max_bytes:
+                # Larger than the whole budget; serve it uncached
+                return
+            self._entries[key] = frame
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]):
+        """Drop every entry whose key matches predicate"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+                self._bytes -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# Shared by every enrichment and drill-down request in the process
+market_frames = FrameCache()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Environment HTTP Clients
+Pooled sessions, cached OAuth tokens and per-host concurrency limits
+for the UAT and PROD APIs
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Callable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENVIRONMENT_URLS = {
+    "UAT": "https://api-uat.company.com",
+    "PROD": "https://api-prod.company.com",
+}
+
+# Connections kept alive per host; sized to the download executor
+DEFAULT_POOL_SIZE = 8
+
+# Requests allowed in flight against one host at a time
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 60
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Returns (access_token, expires_in_seconds) for an environment
+TokenFetcher = Callable[[str], Tuple[str, float]]
+
+
+@dataclass
+class CachedToken:
+    access_token: str
+    expires_at: float
+
+
+class TokenCache:
+    """Thread-safe per-environment OAuth token cache"""
+
+    def __init__(self, fetcher: TokenFetcher, refresh_margin: float = TOKEN_REFRESH_MARGIN):
+        self.fetcher = fetcher
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[str, CachedToken] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, environment: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(environment, threading.Lock())
+
+    def _is_fresh(self, token: Optional[CachedToken]) -> bool:
+        return token is not None and time.monotonic() < token.expires_at - self.refresh_margin
+
+    def get(self, environment: str) -> str:
+        """Return a valid token, fetching once even when many threads ask at the same time"""
+        token = self._tokens.get(environment)
+        if self._is_fresh(token):
+            return token.access_token
+
+        with self._lock_for(environment):
+            token = self._tokens.get(environment)
+            if not self._is_fresh(token):
+                access_token, expires_in = self.fetcher(environment)
+                token = CachedToken(access_token, time.monotonic() + float(expires_in))
+                self._tokens[environment] = token
+                logger.info(f"Fetched OAuth token for {environment} (expires in {expires_in}s)")
+            return token.access_token
+
+    def invalidate(self, environment: str):
+        """Drop a token the server rejected so the next call fetches a new one"""
+        with self._lock_for(environment):
+            self._tokens.pop(environment, None)
+
+
+def _build_retry(retries: int, backoff_factor: float, backoff_jitter: float) -> Retry:
+    kwargs = dict(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        # Only idempotent reads; a retried POST could repeat its side effects
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_jitter=backoff_jitter, **kwargs)
+    except TypeError:
+        # urllib3 < 2 has no jitter support; fall back to plain exponential backoff
+        return Retry(**kwargs)
+
+
+class EnvironmentClient:
+    """Shared keep-alive session for one environment's API host"""
+
+    def __init__(self, environment: str, base_url: str, tokens: TokenCache,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 retries: int = 3, backoff_factor: float = 0.5, backoff_jitter: float = 0.5,
+                 timeout: Tuple[float, float] = (10, 300)):
+        self.environment = environment
+        self.base_url = base_url.rstrip("/")
+        self.tokens = tokens
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=_build_retry(retries, backoff_factor, backoff_jitter),
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _send(self, method: str, path: str, **kwargs) -> requests.Response:
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        kwargs.setdefault("timeout", self.timeout)
+
+        extra_headers = kwargs.pop("headers", None) or {}
+
+        for attempt in range(2):
+            headers = {**extra_headers, "Authorization": f"Bearer {self.tokens.get(self.environment)}"}
+            response = self.session.request(method, url, headers=headers, **kwargs)
+
+            # A rejected token is refreshed once before giving up
+            if response.status_code == 401 and attempt == 0:
+                response.close()
+                self.tokens.invalidate(self.environment)
+                continue
+            break
+
+        response.raise_for_status()
+        return response
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request and read the whole body"""
+        with self._slots:
+            return self._send(method, path, **kwargs)
+
+    @contextmanager
+    def stream(self, path: str, **kwargs) -> Iterator[requests.Response]:
+        """GET a streamed response, holding a host slot until the body is consumed"""
+        with self._slots:
+            response = self._send("GET", path, stream=True, **kwargs)
+            try:
+                yield response
+            finally:
+                response.close()
+
+    def close(self):
+        self.session.close()
+
+
+class ClientRegistry:
+    """One EnvironmentClient per environment, created on first use"""
+
+    def __init__(self, token_fetcher: TokenFetcher,
+                 base_urls: Optional[Dict[str, str]] = None,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.tokens = TokenCache(token_fetcher)
+        self.base_urls = dict(base_urls or ENVIRONMENT_URLS)
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self._clients: Dict[str, EnvironmentClient] = {}
+        self._lock = threading.Lock()
+
+    def get(self, environment: str) -> EnvironmentClient:
+        with self._lock:
+            client = self._clients.get(environment)
+            if client is None:
+                if environment not in self.base_urls:
+                    raise ValueError(f"Unknown environment: {environment}")
+                client = EnvironmentClient(
+                    environment, self.base_urls[environment], self.tokens,
+                    pool_size=self.pool_size, max_concurrency=self.max_concurrency,
+                )
+                self._clients[environment] = client
+            return client
+
+    def token(self, environment: str) -> str:
+        return self.tokens.get(environment)
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Background Job Manager
+Bounded worker pool, admission queue, request de-duplication,
+TTL/LRU eviction of job statuses and versioned progress events
+"""
+
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, is_dataclass
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Callable, Any
+import logging
+
+from metrics import TaskMetrics
+
+logger = logging.getLogger(__name__)
+
+# Jobs running at once; further jobs wait in the admission queue
+DEFAULT_MAX_WORKERS = 4
+
+# Jobs allowed to wait for a worker before new submissions are rejected
+DEFAULT_MAX_QUEUED = 32
+
+# Finished jobs are kept this long for status polling
+DEFAULT_STATUS_TTL = 3600
+
+# Upper bound on stored statuses; the least recently read finished jobs go first
+DEFAULT_MAX_ENTRIES = 500
+
+# Progress events kept per job; a client further behind is told to resync
+DEFAULT_MAX_EVENTS = 1000
+
+# Seconds between background sweeps for expired jobs, so an idle server still evicts
+DEFAULT_EVICT_INTERVAL = 60
+
+
+class JobQueueFull(Exception):
+    """Raised when the admission queue has no room for another job"""
+
+
+def request_key(request: Any) -> str:
+    """Stable key for a request so identical submissions can be coalesced"""
+    payload = asdict(request) if is_dataclass(request) else request
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def new_job_id(prefix: str = "req") -> str:
+    """Readable, collision-free job id: req_20240131_101500_3f2a9c1b"""
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+def _remove_artifact_files(artifacts: Optional[Dict]):
+    """Delete the per-job result files of an evicted job, {pair: {kind: path}}, with their sidecars"""
+    for files in (artifacts or {}).values():
+        for path in (files or {}).values():
+            for target in [path, *glob.glob(f"{glob.escape(str(path))}.*")]:
+                try:
+                    os.remove(target)
+                except OSError:
+                    pass
+
+
+class JobManager:
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_queued: int = DEFAULT_MAX_QUEUED,
+                 status_ttl: float = DEFAULT_STATUS_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_events: int = DEFAULT_MAX_EVENTS,
+                 evict_interval: float = DEFAULT_EVICT_INTERVAL):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.status_ttl = status_ttl
+        self.max_entries = max_entries
+        self.max_events = max_events
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gfx-job")
+        self._lock = threading.Lock()
+        # Signalled on every status change or event; waits release the lock
+        self._changed = threading.Condition(self._lock)
+        self._statuses: "OrderedDict[str, Dict]" = OrderedDict()
+        self._artifacts: Dict[str, Dict] = {}
+        self._finished_at: Dict[str, float] = {}
+        self._metrics: Dict[str, TaskMetrics] = {}
+        # Bumped on every change to a job; events carry the version they were published at
+        self._versions: Dict[str, int] = {}
+        self._events: Dict[str, deque] = {}
+        self._dropped_through: Dict[str, int] = {}
+        self._active: Dict[str, str] = {}   # request key -> running/queued job id
+        self._pending = 0
+
+        self._sweeper = threading.Thread(target=self._sweep, args=(evict_interval,),
+                                         name="gfx-job-evict", daemon=True)
+        self._sweeper.start()
+
+    def submit(self, fn: Callable[[str], None], key: Optional[str] = None,
+               prefix: str = "req") -> Tuple[str, bool]:
+        """Queue fn(job_id); returns (job_id, coalesced)
+
+        A submission whose key matches a queued or running job returns that
+        job's id instead of starting a duplicate.
+        """
+        self.evict_expired()
+        with self._lock:
+            if key is not None and key in self._active:
+                return self._active[key], True
+
+            if self._pending >= self.max_workers + self.max_queued:
+                raise JobQueueFull(f"{self._pending} jobs already queued or running")
+
+            job_id = new_job_id(prefix)
+            self._statuses[job_id] = {"status": "queued"}
+            self._metrics[job_id] = TaskMetrics(queue="jobs")
+            self._versions[job_id] = 0
+            self._events[job_id] = deque()
+            self._append_event(job_id, {"type": "status", "status": "queued"})
+            if key is not None:
+                self._active[key] = job_id
+            self._pending += 1
+
+        self._executor.submit(self._run, job_id, key, fn)
+        return job_id, False
+
+    def _run(self, job_id: str, key: Optional[str], fn: Callable[[str], None]):
+        metrics = self.job_metrics(job_id)
+        try:
+            metrics.start()
+            with metrics.stage("job"):
+                fn(job_id)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self.set_status(job_id, {"status": "failed", "error": str(e)})
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if key is not None and self._active.get(key) == job_id:
+                    del self._active[key]
+                self._finished_at[job_id] = time.monotonic()
+                if job_id in self._versions:
+                    self._versions[job_id] += 1
+                self._changed.notify_all()
+
+    def _append_event(self, job_id: str, event: Dict):
+        """Record an event at the next version; caller holds the lock"""
+        version = self._versions[job_id] + 1
+        self._versions[job_id] = version
+        events = self._events[job_id]
+        if len(events) >= self.max_events:
+            self._dropped_through[job_id] = events.popleft()["version"]
+        events.append({"version": version, **event})
+        self._changed.notify_all()
+
+    def set_status(self, job_id: str, status: Dict):
+        """Replace a job's status snapshot; a change of its "status" field is also published as an event"""
+        with self._lock:
+            if job_id in self._statuses:
+                previous = self._statuses[job_id].get("status")
+                self._statuses[job_id] = status
+                if status.get("status") != previous:
+                    event = {"type": "status", "status": status.get("status")}
+                    if "error" in status:
+                        event["error"] = status["error"]
+                    self._append_event(job_id, event)
+                else:
+                    self._versions[job_id] += 1
+
+    def publish(self, job_id: str, event: Dict):
+        """Publish a small progress event, e.g. one download or match finishing"""
+        with self._lock:
+            if job_id in self._statuses:
+                self._append_event(job_id, event)
+
+    def set_artifacts(self, job_id: str, artifacts: Dict):
+        """Attach result files to a job; they are evicted together with its status"""
+        with self._lock:
+            if job_id in self._statuses:
+                self._artifacts[job_id] = artifacts
+
+    def get_artifacts(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._artifacts.get(job_id)
+
+    def job_metrics(self, job_id: str) -> TaskMetrics:
+        """Queue wait, run time and stage timings of a job; stages may be added by the job itself"""
+        with self._lock:
+            return self._metrics.get(job_id) or TaskMetrics()
+
+    def get_status(self, job_id: str) -> Optional[Dict]:
+        """Status snapshot with its version; only the references are taken under the lock"""
+        with self._lock:
+            status = self._statuses.get(job_id)
+            if status is None:
+                return None
+            self._statuses.move_to_end(job_id)
+            metrics = self._metrics.get(job_id)
+            version = self._versions.get(job_id, 0)
+        result = {**status, "version": version}
+        if metrics is not None:
+            result["metrics"] = metrics.to_dict()
+        return result
+
+    def status_version(self, job_id: str) -> Optional[int]:
+        with self._lock:
+            return self._versions.get(job_id) if job_id in self._statuses else None
+
+    def status_etag(self, job_id: str) -> Optional[str]:
+        """Validator for the status snapshot: its version plus the revision of its metrics"""
+        with self._lock:
+            if job_id not in self._statuses:
+                return None
+            metrics = self._metrics.get(job_id)
+            return f"{self._versions.get(job_id, 0)}.{metrics.revision if metrics is not None else 0}"
+
+    def events(self, job_id: str, since: int = 0, timeout: float = 0) -> Optional[Dict]:
+        """Events published after version since, waiting up to timeout for the first one
+
+        Returns {"version", "events", "finished", "resync"}, or None for an
+        unknown job. resync means events after since were dropped, so the
+        caller should re-read the status snapshot.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                if job_id not in self._statuses:
+                    return None
+                events: List[Dict] = [event for event in self._events.get(job_id, ()) if event["version"] > since]
+                finished = job_id in self._finished_at
+                remaining = deadline - time.monotonic()
+                if events or finished or remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return {
+                "version": self._versions.get(job_id, 0),
+                "events": events,
+                "finished": finished,
+                "resync": since < self._dropped_through.get(job_id, 0),
+            }
+
+    def __contains__(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._statuses
+
+    def evict_expired(self):
+        """Evict expired and over-cap finished jobs, deleting their result files outside the lock"""
+        with self._lock:
+            evicted = self._evict()
+        for artifacts in evicted:
+            _remove_artifact_files(artifacts)
+
+    def _sweep(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.evict_expired()
+            except Exception as e:
+                logger.error(f"Job eviction sweep failed: {str(e)}")
+
+    def _evict(self) -> List[Dict]:
+        """Drop expired finished jobs, then the least recently read ones over the cap
+
+        Returns the evicted jobs' artifacts; the caller deletes their files
+        after releasing the lock.
+        """
+        evicted = []
+        now = time.monotonic()
+        for job_id, finished in list(self._finished_at.items()):
+            if now - finished > self.status_ttl:
+                evicted.append(self._forget(job_id))
+
+        if len(self._statuses) > self.max_entries:
+            for job_id in list(self._statuses):
+                if len(self._statuses) <= self.max_entries:
+                    break
+                if job_id in self._finished_at:
+                    evicted.append(self._forget(job_id))
+        return [artifacts for artifacts in evicted if artifacts]
+
+    def _forget(self, job_id: str) -> Optional[Dict]:
+        self._statuses.pop(job_id, None)
+        artifacts = self._artifacts.pop(job_id, None)
+        self._finished_at.pop(job_id, None)
+        self._metrics.pop(job_id, None)
+        self._versions.pop(job_id, None)
+        self._events.pop(job_id, None)
+        self._dropped_through.pop(job_id, None)
+        return artifacts
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "stored_statuses": len(self._statuses),
+                "max_workers": self.max_workers,
+                "max_queued": self.max_queued,
+            }
@@ -10,17 +10,51 @@ import pandas as pd
 import requests
 import gzip
 import threading
-from datetime import datetime, timedelta
+import time
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator, Callable, Any
 from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
 import logging
 
+from aggregates import AggregateStore
+from http_client import ClientRegistry
+from matching import match_trade_files, partition_count
+from executors import CpuExecutor, DEFAULT_CPU_BACKEND
+from thresholds import ThresholdStore
+from market_data import enrich_with_nearest
+from market_cache import MarketDataCache, MarketFetcher, merge_day_ranges
+from epe import consolidate_side
+from dataset import TradeDataset, date_range
+from metrics import TaskMetrics
+from synthetic import TradeProfile, daily_trade_csv_chunks, daily_epe_frame, exception_frame, market_ticks
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Response bytes written per chunk when streaming a download to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Parallel download workers; also sizes each environment's connection pool
+DOWNLOAD_WORKERS = 8
+
+# Concurrent UAT/PROD matches run while downloads are still in flight;
+# each one waits on a CPU worker, so match as many pairs as there are cores
+MATCH_WORKERS = os.cpu_count() or 4
+
+# Synthetic feed sizes (per 30 days, drawn day by day) and seed used with
+# use_mock_data; raise the row counts to load-test at production volumes
+MOCK_TRADE_ROWS = int(os.environ.get("GFX_MOCK_TRADE_ROWS", "1000"))
+MOCK_EXCEPTION_ROWS = int(os.environ.get("GFX_MOCK_EXCEPTION_ROWS", "50"))
+MOCK_SEED = int(os.environ.get("GFX_MOCK_SEED", "0"))
+
+# EPE extracts are split into day slices on this column
+EPE_DATE_COLUMN = "created_at"
+
+# (range start, range end, file path) -> records written; one API download
+RangeFetcher = Callable[[str, str, Path], int]
+
 @dataclass
 class DataRequest:
     product_type: str
@@ -39,70 +73,102 @@ class ProcessingStatus:
     status: str  # pending, downloading, processing, completed, failed
     records_count: int = 0
     error_message: Optional[str] = None
+    metrics: Optional[Dict] = None  # stage timings, counts, queue wait and peak memory
+
+def _mock_rows_per_day(rows_per_30_days: int) -> int:
+    """Mock feeds are drawn day by day; MOCK_*_ROWS are per 30 days"""
+    return max(-(-rows_per_30_days // 30), 1)
 
 class GFXDataProcessor:
-    def __init__(self):
+    def __init__(self, use_mock_data: bool = True, cpu_backend: str = DEFAULT_CPU_BACKEND,
+                 cpu_workers: Optional[int] = None, kdb_fetcher: Optional[MarketFetcher] = None):
+        self.use_mock_data = use_mock_data
+        # e.g. KDB_GFX_Enrichment.get_kdb_market_data; mock data brings its own ticks
+        if kdb_fetcher is None:
+            if not use_mock_data:
+                raise ValueError("kdb_fetcher is required when use_mock_data is False, "
+                                 "e.g. KDB_GFX_Enrichment.get_kdb_market_data")
+            kdb_fetcher = self._generate_mock_market_data
+        self.kdb_fetcher = kdb_fetcher
+        self.mock_profile = TradeProfile()
         self.base_dir = Path("data")
         self.trades_dir = self.base_dir / "trades"
         self.exceptions_dir = self.base_dir / "exceptions"
         self.thresholds_dir = self.base_dir / "thresholds"
+        self.market_data_dir = self.base_dir / "exports" / "kdb_market_data"
+        
+        # Trades partitioned by env/product/LE/source/day, stored once across overlapping requests
+        self.dataset = TradeDataset(self.trades_dir / "dataset")
+        # EPE extracts by env/EPE/status/ALL/day, so they download incrementally too
+        self.epe_dataset = TradeDataset(self.exceptions_dir / "dataset")
+        
+        # Network I/O stays on threads; parsing, matching and aggregation go here
+        self.cpu_executor = CpuExecutor(cpu_backend, cpu_workers)
+        self.aggregate_store = AggregateStore(executor=self.cpu_executor)
+        self.http_clients = ClientRegistry(self._request_oauth_token, pool_size=DOWNLOAD_WORKERS)
+        self.market_cache = MarketDataCache(self.market_data_dir, self.kdb_fetcher)
+        self._threshold_stores: Dict[str, ThresholdStore] = {}
+        self._threshold_lock = threading.Lock()
         
         # Create directories
         for directory in [self.trades_dir, self.exceptions_dir, self.thresholds_dir]:
             directory.mkdir(parents=True, exist_ok=True)
     
-    def get_oauth_token(self, environment: str) -> str:
-        """Get OAuth token for UAT or PROD environment"""
+    def _request_oauth_token(self, environment: str) -> Tuple[str, float]:
+        """Fetch a new OAuth token and its lifetime in seconds"""
         # TODO: Implement OAuth authentication
         # This would connect to your actual OAuth service
-        return f"mock_token_{environment.lower()}"
+        return f"mock_token_{environment.lower()}", 3600
+    
+    def get_oauth_token(self, environment: str) -> str:
+        """Get OAuth token for UAT or PROD environment, cached until shortly before expiry"""
+        return self.http_clients.token(environment)
+    
+    def authenticate(self, environment: str) -> str:
+        """Alias of get_oauth_token used by the exception download route"""
+        return self.get_oauth_token(environment)
     
     def download_trade_data(self, legal_entity: str, source_system: str, 
                           environment: str, product_type: str, 
-                          start_date: str, end_date: str) -> Tuple[int, Optional[str]]:
-        """Download trade data for specific parameters"""
+                          start_date: str, end_date: str,
+                          metrics: Optional[TaskMetrics] = None) -> Tuple[int, Optional[str]]:
+        """Download trade data for specific parameters, fetching only days not already on disk"""
+        metrics = metrics or TaskMetrics()
         try:
-            # Construct filename: ProductType_LegalEntity_SourceSystem_StartDate_EndDate.gz
-            filename = f"{product_type}_{legal_entity}_{source_system}_{start_date}_{end_date}.gz"
-            file_path = self.trades_dir / environment / filename
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Get OAuth token
-            token = self.get_oauth_token(environment)
-            
-            # Construct API URL (replace with actual endpoints)
-            base_url = "https://api-uat.company.com" if environment == "UAT" else "https://api-prod.company.com"
-            url = f"{base_url}/trades"
-            
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            }
-            
-            params = {
-                "product_type": product_type,
-                "legal_entity": legal_entity,
-                "source_system": source_system,
-                "start_date": start_date,
-                "end_date": end_date
-            }
+            # Downloads are named ProductType_LegalEntity_SourceSystem_StartDate_EndDate.gz
+            # and kept only until they are split into day partitions
+            def path_for(range_start: str, range_end: str) -> Path:
+                return self.trades_dir / environment / f"{product_type}_{legal_entity}_{source_system}_{range_start}_{range_end}.gz"
             
-            logger.info(f"Downloading {environment} data for {legal_entity}/{source_system}")
-            
-            # Simulate API call with mock data for demo
-            # In real implementation, uncomment the following:
-            # response = requests.get(url, headers=headers, params=params, stream=True)
-            # response.raise_for_status()
-            
-            # Mock data generation for demo
-            mock_data = self._generate_mock_trade_data(legal_entity, source_system, 1000)
-            
-            # Save compressed data
-            with gzip.open(file_path, 'wt') as f:
-                mock_data.to_csv(f, index=False)
+            def fetch(range_start: str, range_end: str, path: Path) -> int:
+                logger.info(f"Downloading {environment} data for {legal_entity}/{source_system} "
+                            f"{range_start} to {range_end}")
+                # Compress chunks to disk as they arrive, never holding the payload
+                if self.use_mock_data:
+                    # Mock data generation for demo
+                    chunks = self._generate_mock_trade_chunks(legal_entity, source_system, environment,
+                                                              product_type, range_start, range_end)
+                    return self._stream_to_file(chunks, path, metrics)
+                
+                params = {
+                    "product_type": product_type,
+                    "legal_entity": legal_entity,
+                    "source_system": source_system,
+                    "start_date": range_start,
+                    "end_date": range_end
+                }
+                # Pooled session with a cached token for this environment
+                client = self.http_clients.get(environment)
+                with client.stream("/trades", params=params) as response:
+                    chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+                    return self._stream_to_file(chunks, path, metrics)
             
-            records_count = len(mock_data)
-            logger.info(f"Downloaded {records_count} records to {file_path}")
+            key = (environment, product_type, legal_entity, source_system)
+            records_count = self._sync_window(self.dataset, key, start_date, end_date, path_for, fetch,
+                                              "trade_date", metrics, aggregate=True)
+            self._index_partitions(key, start_date, end_date, records_count, metrics)
+            logger.info(f"{environment} {legal_entity}/{source_system} {start_date} to {end_date} "
+                        f"has {records_count} records")
             
             return records_count, None
             
@@ -111,22 +177,74 @@ class GFXDataProcessor:
             logger.error(error_msg)
             return 0, error_msg
     
-    def download_exception_data(self, start_date: str, end_date: str) -> Tuple[int, Optional[str]]:
-        """Download exception data for date range"""
+    def _index_partitions(self, key: Tuple[str, str, str, str], start_date: str, end_date: str,
+                          records_count: int, metrics: TaskMetrics):
+        """Bucket aggregates of a range's day partitions; only days without a current one are read"""
+        # Days split by this download already have theirs; older days may predate them
+        with metrics.stage("aggregate") as stage:
+            for path in self.dataset.range_files(*key, start_date, end_date):
+                try:
+                    self.aggregate_store.get(path)
+                except Exception as e:
+                    logger.warning(f"Failed to build aggregate for {path}: {str(e)}")
+            stage["rows"] = records_count
+    
+    def _sync_window(self, dataset: TradeDataset, key: Tuple[str, str, str, str],
+                     start_date: str, end_date: str, path_for: Callable[[str, str], Path],
+                     fetch: RangeFetcher, date_column: str, metrics: TaskMetrics,
+                     aggregate: bool = False) -> int:
+        """Bring the day partitions for key up to date, downloading only the days the manifest lacks
+        
+        Missing days are fetched one contiguous range at a time into a
+        temporary file and split into day slices, each range recorded in the
+        manifest as soon as it lands, so a failed task resumes from the first
+        range it did not finish. Overlapping requests share the slices, so a
+        day is stored once however many windows cover it. aggregate writes
+        each new slice's bucket aggregate as it is split. Returns the rows in
+        the window.
+        """
+        window_days = date_range(start_date, end_date)
+        missing = dataset.missing_days(*key, start_date, end_date)
+        if not missing:
+            logger.info(f"{'/'.join(key)} {start_date} to {end_date} is up to date, nothing to download")
+        else:
+            logger.info(f"{len(missing)} of {len(window_days)} day(s) missing for {'/'.join(key)}")
+        
+        for range_start, range_end in merge_day_ranges(missing, max_days=len(window_days), skip_weekends=False):
+            range_start, range_end = range_start.isoformat(), range_end.isoformat()
+            named = path_for(range_start, range_end)
+            download_path = named.parent / "delta" / named.name
+            download_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                fetch(range_start, range_end, download_path)
+                with metrics.stage("partition") as stage:
+                    ingested = self.cpu_executor.run(dataset.ingest, download_path, *key, range_start, range_end,
+                                                     date_column=date_column, aggregate=aggregate)
+                    stage["rows"] = ingested["rows"]
+                dataset.record_days(*key, ingested["rows_by_day"])
+            finally:
+                download_path.unlink(missing_ok=True)
+        
+        return dataset.range_rows(*key, start_date, end_date)
+    
+    def download_exception_data(self, start_date: str, end_date: str,
+                                exception_status: Optional[str] = None,
+                                environment: Optional[str] = None,
+                                metrics: Optional[TaskMetrics] = None) -> Tuple[int, Optional[str]]:
+        """Download exception data for date range, or one environment's EPE extract"""
+        metrics = metrics or TaskMetrics()
+        if exception_status is not None and environment is not None:
+            return self._download_epe_extract(start_date, end_date, exception_status, environment, metrics)
+        
         try:
             filename = f"exceptions_{start_date}_{end_date}.csv"
             file_path = self.exceptions_dir / filename
             
             # Mock exception data
-            mock_exceptions = pd.DataFrame({
-                'trade_id': [f'TRD-2024-{i:06d}' for i in range(1, 51)],
-                'exception_type': ['PRICE_DEVIATION', 'LIQUIDITY_ISSUE', 'TIMEOUT'] * 17,
-                'description': ['Price deviation detected', 'Low liquidity', 'Request timeout'] * 17,
-                'status': ['OPEN', 'RESOLVED', 'PENDING'] * 17,
-                'created_at': [datetime.now() - timedelta(days=i) for i in range(50)]
-            })
-            
-            mock_exceptions.to_csv(file_path, index=False)
+            with metrics.stage("download") as stage:
+                mock_exceptions = exception_frame(MOCK_EXCEPTION_ROWS, seed=MOCK_SEED)
+                mock_exceptions.to_csv(file_path, index=False)
+                stage["rows"] = len(mock_exceptions)
             logger.info(f"Downloaded {len(mock_exceptions)} exception records")
             
             return len(mock_exceptions), None
@@ -136,34 +254,185 @@ class GFXDataProcessor:
             logger.error(error_msg)
             return 0, error_msg
     
-    def _generate_mock_trade_data(self, legal_entity: str, source_system: str, count: int) -> pd.DataFrame:
-        """Generate mock trade data for demo purposes"""
-        import random
-        
-        currencies = ['EURUSD', 'GBPUSD', 'USDJPY', 'USDCHF', 'USDCAD', 'EURGBP']
-        
-        data = []
-        for i in range(count):
-            ccy_pair = random.choice(currencies)
-            deviation = round(random.uniform(0.1, 3.0), 4)
+    def epe_extract_path(self, environment: str, exception_status: str, start_date: str, end_date: str) -> Path:
+        """exceptions/{ENV}/{start}_EPE_Data_{Closed|new}_{end}.csv"""
+        label = "Closed" if exception_status.lower() == "closed" else "new"
+        return self.exceptions_dir / environment / f"{start_date}_EPE_Data_{label}_{end_date}.csv"
+    
+    def _download_epe_extract(self, start_date: str, end_date: str, exception_status: str,
+                              environment: str, metrics: TaskMetrics) -> Tuple[int, Optional[str]]:
+        """Stream one environment's Closed or new EPE extract to disk, fetching only days not already on disk"""
+        try:
+            def path_for(range_start: str, range_end: str) -> Path:
+                return self.epe_extract_path(environment, exception_status, range_start, range_end)
+            
+            def fetch(range_start: str, range_end: str, path: Path) -> int:
+                logger.info(f"Downloading {environment} EPE {exception_status} exceptions "
+                            f"{range_start} to {range_end}")
+                if self.use_mock_data:
+                    mock = self._generate_mock_epe_data(exception_status, MOCK_EXCEPTION_ROWS, range_start, range_end)
+                    return self._stream_to_file([mock.to_csv(index=False).encode()], path, metrics)
+                
+                client = self.http_clients.get(environment)
+                params = {"start_date": range_start, "end_date": range_end, "status": exception_status}
+                with client.stream("/exceptions", params=params) as response:
+                    chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+                    return self._stream_to_file(chunks, path, metrics)
             
-            trade = {
-                'trade_id': f'TRD-{legal_entity}-{i+1:06d}',
-                'product_type': 'FX_SPOT',
-                'legal_entity': legal_entity,
-                'source_system': source_system,
-                'ccy_pair': ccy_pair,
-                'trade_date': datetime.now() - timedelta(days=random.randint(1, 30)),
-                'deviation_percent': deviation,
-                'alert_description': f'Deviation {deviation}% detected' if deviation > 0.5 else None,
-                'is_out_of_scope': random.random() > 0.95
+            key = (environment, "EPE", exception_status.lower(), "ALL")
+            self._sync_window(self.epe_dataset, key, start_date, end_date, path_for, fetch,
+                              EPE_DATE_COLUMN, metrics)
+            
+            # Consolidation reads the extract as one file, so it is assembled from the slices
+            file_path = path_for(start_date, end_date)
+            records_count = self.epe_dataset.window_rows(file_path, *key, start_date, end_date)
+            if records_count is None:
+                with metrics.stage("assemble") as stage:
+                    records_count = self.cpu_executor.run(self.epe_dataset.write_range, file_path, *key,
+                                                          start_date, end_date)
+                    stage["rows"] = records_count
+                self.epe_dataset.record_window(file_path, *key, start_date, end_date, records_count)
+            
+            logger.info(f"{file_path} has {records_count} EPE records")
+            return records_count, None
+            
+        except Exception as e:
+            error_msg = f"Failed to download {environment} {exception_status} exceptions: {str(e)}"
+            logger.error(error_msg)
+            return 0, error_msg
+    
+    def _generate_mock_epe_data(self, exception_status: str, count: int,
+                                start_date: str, end_date: str) -> pd.DataFrame:
+        """Generate mock EPE exceptions (count per 30 days); closed and new overlap on half their ids"""
+        return daily_epe_frame(exception_status, _mock_rows_per_day(count), start_date, end_date,
+                               overlap=0.5, seed=MOCK_SEED)
+    
+    def process_exception_downloads(self, start_date: str, end_date: str,
+                                    metrics: Optional[TaskMetrics] = None,
+                                    on_event: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Download the Closed and new EPE extracts of both environments, then consolidate each
+        
+        on_event receives each download and consolidation as it finishes.
+        """
+        metrics = metrics or TaskMetrics()
+        on_event = on_event or (lambda event: None)
+        downloads = {}
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = {
+                executor.submit(self._run_task, TaskMetrics(queue="download"), self.download_exception_data,
+                                start_date, end_date, exception_status, environment): (environment, exception_status)
+                for environment in ["UAT", "PROD"]
+                for exception_status in ["closed", "new"]
             }
-            data.append(trade)
+            for future in as_completed(futures):
+                environment, exception_status = futures[future]
+                (record_count, error), task_metrics = future.result()
+                downloads.setdefault(exception_status, {})[environment] = {
+                    "count": record_count,
+                    "status": "failed" if error else "completed",
+                    "error": error,
+                    "metrics": task_metrics
+                }
+                on_event({"type": "download", "environment": environment, "exception_status": exception_status,
+                          **downloads[exception_status][environment]})
         
-        return pd.DataFrame(data)
+        # Consolidate each environment whose Closed and new extracts both arrived
+        ready = [env for env in ["UAT", "PROD"]
+                 if all(downloads[s][env]["status"] == "completed" for s in ["closed", "new"])]
+        consolidated = {}
+        for environment in ready:
+            try:
+                with metrics.stage("consolidate") as stage:
+                    result = self.consolidated_epe_files(environment, start_date, end_date)
+                    stage["rows"] = sum(side.get("consolidated_len", 0) for side in result.values())
+                consolidated.update(result)
+            except Exception as e:
+                logger.error(f"Error consolidating {environment} EPE files: {str(e)}")
+                consolidated[environment] = {"error": str(e)}
+            on_event({"type": "consolidate", "environment": environment,
+                      "status": "failed" if "error" in consolidated[environment] else "completed",
+                      "result": consolidated[environment]})
+        
+        return {"downloads": downloads, "consolidated": consolidated}
     
-    def process_parallel_downloads(self, request: DataRequest) -> List[ProcessingStatus]:
-        """Process downloads in parallel for all legal entity/source system combinations"""
+    def consolidated_epe_files(self, env: str = "both", start_date: str = "", end_date: str = "",
+                               force: bool = False) -> Dict:
+        """Stream each environment's Closed and new EPE extracts into one de-duplicated CSV
+        
+        An environment whose extracts are unchanged since the last run is skipped.
+        """
+        environments = ["UAT", "PROD"] if env == "both" else [env]
+        result = {}
+        for environment in environments:
+            output_path = self.base_dir / "exports" / f"EPE_Consolidated_{environment}_{start_date}_{end_date}.csv"
+            result[environment] = self.cpu_executor.run(
+                consolidate_side,
+                self.epe_extract_path(environment, "closed", start_date, end_date),
+                self.epe_extract_path(environment, "new", start_date, end_date),
+                output_path,
+                force=force
+            )
+        
+        logger.info("OMRC EPE Files Pre-Process completed")
+        return result
+    
+    def _stream_to_file(self, chunks: Iterable[bytes], file_path: Path,
+                        metrics: Optional[TaskMetrics] = None) -> int:
+        """Write CSV byte chunks to a temp file (gzip for .gz), rename it into place and return the row count
+        
+        Time spent waiting for chunks is recorded as the "receive" stage and
+        time spent compressing/writing them as "write".
+        """
+        tmp_path = file_path.with_name(file_path.name + ".part")
+        opener = gzip.open if file_path.suffix == ".gz" else open
+        newlines = 0
+        last_byte = b""
+        received = 0
+        receive_seconds = write_seconds = 0.0
+        
+        try:
+            with opener(tmp_path, 'wb') as f:
+                chunk_iter = iter(chunks)
+                while True:
+                    started = time.perf_counter()
+                    chunk = next(chunk_iter, None)
+                    receive_seconds += time.perf_counter() - started
+                    if chunk is None:
+                        break
+                    if not chunk:
+                        continue
+                    started = time.perf_counter()
+                    f.write(chunk)
+                    write_seconds += time.perf_counter() - started
+                    received += len(chunk)
+                    newlines += chunk.count(b"\n")
+                    last_byte = chunk[-1:]
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        
+        # Lines minus the header; the last line may lack a trailing newline
+        lines = newlines + (1 if last_byte not in (b"", b"\n") else 0)
+        records = max(lines - 1, 0)
+        if metrics is not None:
+            metrics.add("receive", receive_seconds, records, received)
+            metrics.add("write", write_seconds, records, file_path.stat().st_size)
+        return records
+    
+    def _generate_mock_trade_chunks(self, legal_entity: str, source_system: str, environment: str,
+                                    product_type: str, start_date: str, end_date: str) -> Iterator[bytes]:
+        """Yield mock trade data as CSV byte chunks, like a streamed API response
+        
+        UAT and PROD come from the same seeded draws, so they match on most
+        trade ids with a realistic share of diffs and one-sided trades. Each
+        day is drawn on its own, so delta downloads return the same trades.
+        """
+        return daily_trade_csv_chunks(legal_entity, source_system, environment, _mock_rows_per_day(MOCK_TRADE_ROWS),
+                                      start_date, end_date, product_type, self.mock_profile, MOCK_SEED)
+    
+    def _build_status_list(self, request: DataRequest) -> List[ProcessingStatus]:
+        """Create pending status objects for every download in a request"""
         status_list = []
         
         # Create status objects for all combinations
@@ -179,87 +448,239 @@ class GFXDataProcessor:
         if request.download_exceptions:
             status_list.append(ProcessingStatus("ALL", "ALL", "EXCEPTIONS", "pending"))
         
+        return status_list
+    
+    def _submit_download(self, executor: ThreadPoolExecutor, status: ProcessingStatus,
+                         request: DataRequest) -> Future:
+        """Submit the download task behind a status object"""
+        metrics = TaskMetrics(queue="download")
+        if status.environment in ["UAT", "PROD"]:
+            future = executor.submit(
+                self._run_task,
+                metrics,
+                self.download_trade_data,
+                status.legal_entity,
+                status.source_system,
+                status.environment,
+                request.product_type,
+                request.start_date,
+                request.end_date
+            )
+        else:
+            future = executor.submit(
+                self._run_task,
+                metrics,
+                self.download_exception_data,
+                request.start_date,
+                request.end_date
+            )
+        
+        status.status = "downloading"
+        return future
+    
+    def _run_task(self, metrics: TaskMetrics, fn: Callable, *args) -> Tuple[Any, Dict]:
+        """Run a queued task with its metrics; returns (result, metrics dict)"""
+        metrics.start()
+        return fn(*args, metrics=metrics), metrics.to_dict()
+    
+    def _record_download_result(self, status: ProcessingStatus, future: Future):
+        """Copy a finished download's outcome onto its status object"""
+        try:
+            (records_count, error), status.metrics = future.result()
+            if error:
+                status.status = "failed"
+                status.error_message = error
+            else:
+                status.status = "completed"
+                status.records_count = records_count
+        except Exception as e:
+            status.status = "failed"
+            status.error_message = str(e)
+    
+    def process_parallel_downloads(self, request: DataRequest) -> List[ProcessingStatus]:
+        """Process downloads in parallel for all legal entity/source system combinations"""
+        status_list = self._build_status_list(request)
+        
         # Process downloads in parallel
-        with ThreadPoolExecutor(max_workers=6) as executor:
-            future_to_status = {}
-            
-            for status in status_list:
-                if status.environment in ["UAT", "PROD"]:
-                    future = executor.submit(
-                        self.download_trade_data,
-                        status.legal_entity,
-                        status.source_system,
-                        status.environment,
-                        request.product_type,
-                        request.start_date,
-                        request.end_date
-                    )
-                elif status.environment == "EXCEPTIONS":
-                    future = executor.submit(
-                        self.download_exception_data,
-                        request.start_date,
-                        request.end_date
-                    )
-                
-                future_to_status[future] = status
-                status.status = "downloading"
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            future_to_status = {
+                self._submit_download(executor, status, request): status
+                for status in status_list
+            }
             
             # Collect results
             for future in as_completed(future_to_status):
-                status = future_to_status[future]
-                try:
-                    records_count, error = future.result()
-                    if error:
-                        status.status = "failed"
-                        status.error_message = error
-                    else:
-                        status.status = "completed"
-                        status.records_count = records_count
-                except Exception as e:
-                    status.status = "failed"
-                    status.error_message = str(e)
+                self._record_download_result(future_to_status[future], future)
         
         return status_list
     
+    def process_download_pipeline(self, request: DataRequest,
+                                  on_update: Optional[Callable[[Dict], None]] = None,
+                                  on_event: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Download and match as a task graph
+        
+        Each (legal_entity, source_system) match is submitted as soon as its
+        UAT and PROD downloads have both completed, instead of waiting for every
+        download. on_update receives a snapshot after every download and match;
+        on_event receives just the task that finished and the progress counts.
+        """
+        status_list = self._build_status_list(request)
+        matching_results: Dict[str, Dict] = {}
+        artifacts: Dict[str, Dict[str, str]] = {}
+        state_lock = threading.Lock()
+        
+        def progress() -> Dict:
+            return {
+                "downloads_total": len(status_list),
+                "downloads_finished": sum(1 for status in status_list if status.status in ("completed", "failed")),
+                "matches_started": sum(1 for value in matching_results.values() if "UAT" in value and "PROD" in value),
+                "matches_finished": sum(1 for value in matching_results.values() if "matching" in value),
+            }
+        
+        def snapshot() -> Dict:
+            return {
+                "progress": progress(),
+                "statuses": [dict(status.__dict__) for status in status_list],
+                "matching_results": {key: dict(value) for key, value in matching_results.items()},
+                "artifacts": dict(artifacts),
+            }
+        
+        def publish(event: Dict):
+            # Published under the lock so snapshots and events never arrive out of order;
+            # the snapshot goes first so a client that sees an event can read it back
+            with state_lock:
+                if on_update is not None:
+                    on_update(snapshot())
+                if on_event is not None:
+                    on_event({**event, "progress": progress()})
+        
+        def run_match(legal_entity: str, source_system: str, metrics: TaskMetrics) -> Dict:
+            result, task_metrics = self._run_task(
+                metrics, self.match_uat_prod_trades, legal_entity, source_system,
+                request.product_type, request.start_date, request.end_date
+            )
+            return {**result, "metrics": task_metrics}
+        
+        def match_done(key: str, future: Future):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": f"Matching failed: {str(e)}"}
+            
+            # Row-level outputs stay on disk; the status only carries counts
+            result = dict(result)
+            output_files = result.pop("output_files", None)
+            with state_lock:
+                matching_results[key]["matching"] = result
+                if output_files:
+                    artifacts[key] = output_files
+            publish({"type": "match", "pair": key, "status": "failed" if "error" in result else "completed",
+                     "result": result})
+        
+        pairs: Dict[Tuple[str, str], Dict[str, ProcessingStatus]] = {}
+        
+        with ThreadPoolExecutor(max_workers=MATCH_WORKERS) as match_executor:
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_executor:
+                future_to_status = {
+                    self._submit_download(download_executor, status, request): status
+                    for status in status_list
+                }
+                publish({"type": "started"})
+                
+                for future in as_completed(future_to_status):
+                    status = future_to_status[future]
+                    with state_lock:
+                        self._record_download_result(status, future)
+                    
+                    if status.environment in ["UAT", "PROD"] and status.status == "completed":
+                        pair = pairs.setdefault((status.legal_entity, status.source_system), {})
+                        pair[status.environment] = status
+                        key = f"{status.legal_entity}_{status.source_system}"
+                        
+                        with state_lock:
+                            matching_results.setdefault(key, {})[status.environment] = {
+                                "count": status.records_count,
+                                "status": status.status
+                            }
+                        
+                        # Both sides are on disk: match this pair now
+                        if "UAT" in pair and "PROD" in pair:
+                            match_future = match_executor.submit(run_match, status.legal_entity, status.source_system,
+                                                                 TaskMetrics(queue="match"))
+                            match_future.add_done_callback(lambda f, key=key: match_done(key, f))
+                    
+                    publish({"type": "download", **dict(status.__dict__)})
+        
+        with state_lock:
+            return snapshot()
+    
     def match_uat_prod_trades(self, legal_entity: str, source_system: str, 
-                            product_type: str, start_date: str, end_date: str) -> Dict:
+                            product_type: str, start_date: str, end_date: str,
+                            metrics: Optional[TaskMetrics] = None) -> Dict:
         """Match UAT trades with PROD trades by trade_id"""
+        metrics = metrics or TaskMetrics()
         try:
-            # Load UAT and PROD data
-            uat_file = self.trades_dir / "UAT" / f"{product_type}_{legal_entity}_{source_system}_{start_date}_{end_date}.gz"
-            prod_file = self.trades_dir / "PROD" / f"{product_type}_{legal_entity}_{source_system}_{start_date}_{end_date}.gz"
-            
-            if not uat_file.exists() or not prod_file.exists():
-                return {"error": "Required files not found"}
+            # UAT and PROD day partitions of the range; every day must have been downloaded
+            sides = {}
+            for environment in ["UAT", "PROD"]:
+                key = (environment, product_type, legal_entity, source_system)
+                files = self.dataset.range_files(*key, start_date, end_date)
+                if len(files) < len(date_range(start_date, end_date)):
+                    return {"error": "Required files not found"}
+                sides[environment] = (files, self.dataset.range_rows(*key, start_date, end_date))
             
-            # Read data
-            with gzip.open(uat_file, 'rt') as f:
-                uat_df = pd.read_csv(f)
+            # Size partitions from the manifest row counts so each fits in memory
+            rows = max(rows for _, rows in sides.values())
             
-            with gzip.open(prod_file, 'rt') as f:
-                prod_df = pd.read_csv(f)
+            output_prefix = self.base_dir / "exports" / f"{product_type}_{legal_entity}_{source_system}_{start_date}_{end_date}"
+            with metrics.stage("match") as stage:
+                result = self.cpu_executor.run(match_trade_files, sides["UAT"][0], sides["PROD"][0], output_prefix,
+                                               n_partitions=partition_count(rows))
+                stage["rows"] = result["uat_count"] + result["prod_count"]
             
-            # Match by trade_id
-            prod_trade_ids = set(prod_df['trade_id'])
-            uat_matched = uat_df[uat_df['trade_id'].isin(prod_trade_ids)]
-            uat_unmatched = uat_df[~uat_df['trade_id'].isin(prod_trade_ids)]
-            
-            # Filter out "out of scope" trades
-            uat_matched_filtered = uat_matched[
-                ~uat_matched['alert_description'].str.contains('out of scope', case=False, na=False)
-            ]
-            
-            return {
-                "prod_count": len(prod_df),
-                "uat_count": len(uat_df),
-                "matched_count": len(uat_matched_filtered),
-                "unmatched_count": len(uat_unmatched),
-                "matched_data": uat_matched_filtered
-            }
+            return result
             
         except Exception as e:
             return {"error": f"Matching failed: {str(e)}"}
     
+    def _generate_mock_market_data(self, ccy_pair: str, start_time: str, end_time: str) -> pd.DataFrame:
+        """Generate mock one-minute bid/ask ticks, identical across overlapping queries"""
+        return market_ticks(ccy_pair, start_time, end_time, seed=MOCK_SEED)
+    
+    def read_trade_range(self, environment: str, product_type: str, legal_entities: List[str],
+                         source_systems: List[str], start_date: str, end_date: str,
+                         columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Trades for any date range from the day partitions it covers"""
+        return self.dataset.read_range(environment, product_type, legal_entities, source_systems,
+                                       start_date, end_date, columns=columns)
+    
+    def enrich_trades_with_market_data(self, trades: pd.DataFrame, tolerance_minutes: int = 15,
+                                       direction: str = "nearest", pair_col: str = "CLEAN CCY Pair",
+                                       time_col: str = "trade_date") -> pd.DataFrame:
+        """Attach the nearest KDB bid/ask within tolerance to each trade, fetching uncached days first"""
+        metrics = TaskMetrics()
+        with metrics.stage("kdb_fetch"):
+            self.market_cache.ensure_for_trades(trades, pair_col=pair_col, time_col=time_col)
+        with metrics.stage("enrich") as stage:
+            stage["rows"] = len(trades)
+            return enrich_with_nearest(
+                trades,
+                loader=self.market_cache.load_day,
+                pair_col=pair_col,
+                time_col=time_col,
+                tolerance=pd.Timedelta(minutes=tolerance_minutes),
+                direction=direction
+            )
+    
+    def get_threshold_store(self, threshold_mode: str = "group") -> ThresholdStore:
+        """Shared in-memory store for processed_thresholds_{mode}.csv"""
+        with self._threshold_lock:
+            store = self._threshold_stores.get(threshold_mode)
+            if store is None:
+                store = ThresholdStore(self.thresholds_dir / f"processed_thresholds_{threshold_mode}.csv")
+                self._threshold_stores[threshold_mode] = store
+            return store
+    
     def process_threshold_file(self, file_path: str, threshold_mode: str = "group") -> Dict:
         """Process uploaded threshold file"""
         try:
@@ -280,6 +701,9 @@ class GFXDataProcessor:
             processed_path = self.thresholds_dir / f"processed_thresholds_{threshold_mode}.csv"
             df.to_csv(processed_path, index=False)
             
+            # Updates logged against the previous file no longer apply
+            self.get_threshold_store(threshold_mode).reset()
+            
             return {
                 "status": "success",
                 "rows_processed": len(df),
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - KDB Market Data Cache
+One time-sorted columnar file per currency pair, a coverage manifest of
+fetched days and whether they are final, and range-batched parallel KDB fetches
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple, Iterable, Callable
+
+import pandas as pd
+import logging
+
+from market_data import normalize_market_frame
+from frame_cache import FrameCache, market_frames
+from trade_store import file_fingerprint
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+# Concurrent KDB queries
+DEFAULT_FETCH_WORKERS = 4
+
+# Longest date range requested in one KDB query
+DEFAULT_MAX_RANGE_DAYS = 31
+
+# (ccy_pair, start_time, end_time) -> ticks, e.g. get_kdb_market_data
+MarketFetcher = Callable[[str, str, str], Optional[pd.DataFrame]]
+
+DayRange = Tuple[date, date]
+
+
+def _day_key(day: date) -> str:
+    return day.strftime("%Y-%m-%d")
+
+
+def merge_day_ranges(days: Iterable[date], max_days: int = DEFAULT_MAX_RANGE_DAYS,
+                     skip_weekends: bool = True) -> List[DayRange]:
+    """Collapse days into contiguous (start, end) ranges of at most max_days
+
+    With skip_weekends a Friday and the following Monday count as contiguous,
+    so a weekday run is still one query.
+    """
+    ranges: List[DayRange] = []
+    for day in sorted(set(days)):
+        if ranges:
+            start, end = ranges[-1]
+            gap = (day - end).days
+            bridged = skip_weekends and gap <= 3 and all(
+                (end + timedelta(days=i)).weekday() >= 5 for i in range(1, gap))
+            if (gap == 1 or bridged) and (day - start).days < max_days:
+                ranges[-1] = (start, day)
+                continue
+        ranges.append((day, day))
+    return ranges
+
+
+def _manifest_entry(entry) -> Dict:
+    """{"ticks", "final"}; bare tick counts from older manifests are not final"""
+    if isinstance(entry, dict):
+        return entry
+    return {"ticks": int(entry), "final": False}
+
+
+class MarketDataCache:
+    """Per-pair KDB tick cache with a coverage manifest
+
+    The manifest maps pair -> {day: {"ticks", "final"}}. A day is final once
+    it has ended, whether or not KDB had ticks for it; today's partial day is
+    fetched again by the next call that needs it, and days whose fetch failed
+    are never recorded.
+    """
+
+    def __init__(self, cache_dir: Path, fetcher: MarketFetcher,
+                 max_workers: int = DEFAULT_FETCH_WORKERS,
+                 max_range_days: int = DEFAULT_MAX_RANGE_DAYS,
+                 skip_weekends: bool = True,
+                 frame_cache: Optional[FrameCache] = market_frames):
+        self.cache_dir = Path(cache_dir)
+        self.frame_cache = frame_cache
+        self.fetcher = fetcher
+        self.max_workers = max_workers
+        self.max_range_days = max_range_days
+        self.skip_weekends = skip_weekends
+
+        self._lock = threading.Lock()
+        self._pair_locks: Dict[str, threading.Lock] = {}
+        self._manifest: Optional[Dict[str, Dict[str, Dict]]] = None
+
+    # -- manifest ------------------------------------------------------
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.cache_dir / MANIFEST_NAME
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Dict]]:
+        if self._manifest is None:
+            if self.manifest_path.exists():
+                with open(self.manifest_path) as f:
+                    self._manifest = json.load(f)
+            else:
+                self._manifest = {}
+        return self._manifest
+
+    def _save_manifest(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_name(MANIFEST_NAME + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self._manifest, f, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _entries(self, ccy_pair: str) -> Dict[str, Dict]:
+        with self._lock:
+            return {day: _manifest_entry(entry) for day, entry in self._load_manifest().get(ccy_pair, {}).items()}
+
+    def coverage(self, ccy_pair: str) -> Dict[str, int]:
+        """{YYYY-MM-DD: tick count} for every day fetched for a pair"""
+        return {day: entry["ticks"] for day, entry in self._entries(ccy_pair).items()}
+
+    def missing_days(self, ccy_pair: str, days: Iterable[date]) -> List[date]:
+        """Days without a final manifest entry"""
+        entries = self._entries(ccy_pair)
+        return sorted({day for day in days if not entries.get(_day_key(day), {}).get("final")
+                       and not (self.skip_weekends and day.weekday() >= 5)})
+
+    # -- storage -------------------------------------------------------
+
+    def pair_path(self, ccy_pair: str) -> Path:
+        return self.cache_dir / f"{ccy_pair}{'.parquet' if pq is not None else '.csv'}"
+
+    def _pair_lock(self, ccy_pair: str) -> threading.Lock:
+        with self._lock:
+            return self._pair_locks.setdefault(ccy_pair, threading.Lock())
+
+    def _read_pair(self, ccy_pair: str, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None) -> Optional[pd.DataFrame]:
+        path = self.pair_path(ccy_pair)
+        if not path.exists():
+            return None
+        if pq is not None:
+            filters = []
+            if start is not None:
+                filters.append(('time', '>=', pd.Timestamp(start)))
+            if end is not None:
+                filters.append(('time', '<', pd.Timestamp(end)))
+            return pd.read_parquet(path, filters=filters or None)
+        df = normalize_market_frame(pd.read_csv(path))
+        if start is not None:
+            df = df[df['time'] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df['time'] < pd.Timestamp(end)]
+        return df.reset_index(drop=True)
+
+    def _merge_into_pair(self, ccy_pair: str, ticks: pd.DataFrame, days: Iterable[str] = ()):
+        """Add fetched ticks to the pair file, keeping it sorted by time
+
+        Ticks already cached for days are dropped first, since the fetch
+        replaces them.
+        """
+        with self._pair_lock(ccy_pair):
+            existing = self._read_pair(ccy_pair)
+            days = set(days)
+            if existing is not None and days and not existing.empty:
+                existing = existing[~existing['time'].dt.strftime("%Y-%m-%d").isin(days)]
+            if existing is None:
+                combined = ticks
+            elif ticks.empty:
+                combined = existing
+            else:
+                combined = pd.concat([existing, ticks], ignore_index=True)
+            combined = combined.drop_duplicates().sort_values('time', kind='stable').reset_index(drop=True)
+
+            path = self.pair_path(ccy_pair)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            if pq is not None:
+                combined.to_parquet(tmp_path, index=False)
+            else:
+                combined.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+    # -- fetching ------------------------------------------------------
+
+    def _fetch_range(self, ccy_pair: str, day_range: DayRange) -> pd.DataFrame:
+        start, end = day_range
+        ticks = self.fetcher(ccy_pair, f"{_day_key(start)}T00:00:00", f"{_day_key(end)}T23:59:59")
+        if ticks is None or ticks.empty:
+            return pd.DataFrame(columns=['time'])
+        return normalize_market_frame(ticks)
+
+    def ensure(self, pair_days: Dict[str, Iterable[date]]) -> Dict:
+        """Fetch every uncovered pair/day, one query per contiguous range
+
+        Ranges run in a bounded thread pool; each pair's file is rewritten
+        once, after all of its ranges have arrived. Failed ranges are left
+        out of the manifest so a later call retries them.
+        """
+        plan: Dict[str, List[DayRange]] = {}
+        for ccy_pair, days in pair_days.items():
+            missing = self.missing_days(ccy_pair, days)
+            if missing:
+                plan[ccy_pair] = merge_day_ranges(missing, self.max_range_days, self.skip_weekends)
+
+        summary = {"queries": 0, "failed": 0, "days_fetched": 0, "empty_days": 0}
+        if not plan:
+            return summary
+
+        results: Dict[str, List[Tuple[DayRange, pd.DataFrame]]] = {pair: [] for pair in plan}
+        remaining = {pair: len(ranges) for pair, ranges in plan.items()}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="kdb-fetch") as executor:
+            futures = {
+                executor.submit(self._fetch_range, ccy_pair, day_range): (ccy_pair, day_range)
+                for ccy_pair, ranges in plan.items() for day_range in ranges
+            }
+            summary["queries"] = len(futures)
+
+            for future in as_completed(futures):
+                ccy_pair, day_range = futures[future]
+                try:
+                    results[ccy_pair].append((day_range, future.result()))
+                except Exception as e:
+                    summary["failed"] += 1
+                    logger.warning(f"KDB fetch failed for {ccy_pair} {day_range[0]}..{day_range[1]}: {str(e)}")
+
+                remaining[ccy_pair] -= 1
+                if remaining[ccy_pair] == 0 and results[ccy_pair]:
+                    fetched = self._store_pair(ccy_pair, results.pop(ccy_pair))
+                    summary["days_fetched"] += fetched["days"]
+                    summary["empty_days"] += fetched["empty_days"]
+
+        logger.info(f"KDB cache: {summary['queries']} range queries for {len(plan)} pairs, "
+                    f"{summary['days_fetched']} days fetched ({summary['empty_days']} empty), "
+                    f"{summary['failed']} failed")
+        return summary
+
+    def _store_pair(self, ccy_pair: str, fetched: List[Tuple[DayRange, pd.DataFrame]]) -> Dict:
+        # Record every requested day, including the ones KDB had nothing for
+        today = date.today()
+        entries: Dict[str, Dict] = {}
+        for (start, end), ticks in fetched:
+            per_day = ticks['time'].dt.strftime("%Y-%m-%d").value_counts() if not ticks.empty else {}
+            day = start
+            while day <= end:
+                count = int(per_day.get(_day_key(day), 0))
+                entries[_day_key(day)] = {"ticks": count, "final": day < today}
+                day += timedelta(days=1)
+
+        # Refetched days replace whatever was cached for them before
+        previous = self.coverage(ccy_pair)
+        frames = [ticks for _, ticks in fetched if not ticks.empty]
+        if frames or any(previous.get(day) for day in entries):
+            ticks = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['time'])
+            self._merge_into_pair(ccy_pair, ticks, entries)
+
+        with self._lock:
+            self._load_manifest().setdefault(ccy_pair, {}).update(entries)
+            self._save_manifest()
+
+        return {"days": len(entries), "empty_days": sum(1 for e in entries.values() if e["ticks"] == 0)}
+
+    def ensure_for_trades(self, trades: pd.DataFrame, pair_col: str = "CLEAN CCY Pair",
+                          time_col: str = "trade_date") -> Dict:
+        """Cover every (pair, trade day) present in a trade frame"""
+        days = pd.to_datetime(trades[time_col], format='mixed', errors='coerce').dt.normalize()
+        keys = pd.DataFrame({'pair': trades[pair_col], 'day': days}).dropna().drop_duplicates()
+        pair_days: Dict[str, List[date]] = {}
+        for pair, day in zip(keys['pair'], keys['day']):
+            pair_days.setdefault(pair, []).append(day.date())
+        return self.ensure(pair_days)
+
+    # -- reads ---------------------------------------------------------
+
+    def load_day(self, ccy_pair: str, day: date) -> Optional[pd.DataFrame]:
+        """Cached ticks for one pair/day; a MarketLoader for enrich_with_nearest
+
+        Day slices are served from the shared frame cache after the first read.
+        """
+        if not self.coverage(ccy_pair).get(_day_key(day)):
+            return None
+        start = datetime.combine(day, datetime.min.time())
+        load = lambda: self._read_pair(ccy_pair, start, start + timedelta(days=1))
+        if self.frame_cache is None:
+            return load()
+
+        # The fingerprint changes whenever new ranges are merged into the pair file
+        path = self.pair_path(ccy_pair)
+        key = ("market_pair", str(path), _day_key(day), tuple(file_fingerprint(path).values()))
+        return self.frame_cache.get(key, load)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Market Data Enrichment
+Nearest KDB market tick per trade via sorted as-of joins, one market file
+load per (currency pair, day)
+"""
+
+from datetime import date
+from pathlib import Path
+from typing import List, Optional, Sequence, Callable, Union
+
+import numpy as np
+import pandas as pd
+import logging
+
+from frame_cache import FrameCache, market_frames
+from trade_store import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Maximum distance between a trade and the market tick matched to it
+DEFAULT_TOLERANCE = pd.Timedelta(minutes=15)
+
+# merge_asof directions: closest tick either side, last tick before, first tick after
+DIRECTIONS = ("nearest", "backward", "forward")
+
+# Market tick time column, in order of preference
+MARKET_TIME_COLUMNS = ["time", "kdb_market_time"]
+
+# Market columns copied onto trades, prefixed with "kdb_"
+DEFAULT_MARKET_COLUMNS = ["bid", "ask"]
+
+# (ccy_pair, day) -> market ticks for that day, or None when there are none
+MarketLoader = Callable[[str, date], Optional[pd.DataFrame]]
+
+
+def normalize_market_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse the tick time into a 'time' column and sort by it"""
+    for column in MARKET_TIME_COLUMNS:
+        if column in df.columns:
+            df = df.assign(time=pd.to_datetime(df[column]))
+            break
+    else:
+        raise KeyError("No expected time column in market data")
+    df = df.dropna(subset=['time'])
+    return df.sort_values('time', kind='stable').reset_index(drop=True)
+
+
+def load_cached_market_df(market_dir: Path, ccy_pair: str, day: date,
+                          cache: Optional[FrameCache] = market_frames) -> Optional[pd.DataFrame]:
+    """Ticks from market_dir/{pair}/{YYYY-MM-DD}.csv, sorted by time
+
+    Parsed frames are kept in the process-wide frame cache, keyed by the
+    file's fingerprint, so repeat requests for a day skip the CSV parse.
+    """
+    csv_path = Path(market_dir) / ccy_pair / f"{day.strftime('%Y-%m-%d')}.csv"
+    if not csv_path.exists():
+        return None
+    load = lambda: normalize_market_frame(pd.read_csv(csv_path))
+    if cache is None:
+        return load()
+    key = ("market_csv", str(csv_path), tuple(file_fingerprint(csv_path).values()))
+    return cache.get(key, load)
+
+
+def _as_datetime(values: pd.Series) -> pd.Series:
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.to_datetime(values, format='mixed', errors='coerce')
+    return values.dt.as_unit('ns')
+
+
+def enrich_with_nearest(trades: pd.DataFrame,
+                        market_dir: Optional[Path] = None,
+                        pair_col: str = "CLEAN CCY Pair",
+                        time_col: str = "trade_date",
+                        tolerance: Union[pd.Timedelta, str] = DEFAULT_TOLERANCE,
+                        direction: str = "nearest",
+                        market_columns: Sequence[str] = DEFAULT_MARKET_COLUMNS,
+                        loader: Optional[MarketLoader] = None) -> pd.DataFrame:
+    """Attach the nearest market tick within tolerance to every trade
+
+    Trades are grouped by (pair, trade day); each group's market file is
+    loaded once and matched with a sorted merge_asof. Returns a copy of
+    trades with kdb_{column} for each market column plus kdb_time, left
+    empty where no tick is within tolerance.
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"direction must be one of {DIRECTIONS}")
+    if loader is None:
+        if market_dir is None:
+            raise ValueError("Either market_dir or loader is required")
+        loader = lambda pair, day: load_cached_market_df(market_dir, pair, day)
+
+    tolerance = pd.Timedelta(tolerance)
+    market_columns = list(market_columns)
+    output_columns = [f"kdb_{column}" for column in market_columns] + ["kdb_time"]
+
+    trade_times = _as_datetime(trades[time_col])
+    valid = (trade_times.notna() & trades[pair_col].notna()).to_numpy()
+
+    keys = pd.DataFrame({
+        'pair': trades[pair_col].to_numpy()[valid],
+        'day': trade_times.dt.normalize().to_numpy()[valid],
+        'time': trade_times.to_numpy()[valid],
+        'row': np.flatnonzero(valid),
+    })
+
+    parts: List[pd.DataFrame] = []
+    groups = files = 0
+    for (pair, day), group in keys.groupby(['pair', 'day'], sort=False):
+        groups += 1
+        market = loader(pair, pd.Timestamp(day).date())
+        if market is None or market.empty:
+            continue
+        files += 1
+
+        right = market[[c for c in market_columns if c in market.columns]].rename(
+            columns={column: f"kdb_{column}" for column in market_columns})
+        right['kdb_time'] = market['time'].dt.as_unit('ns')
+
+        joined = pd.merge_asof(
+            group.sort_values('time', kind='stable'), right,
+            left_on='time', right_on='kdb_time',
+            direction=direction, tolerance=tolerance,
+        )
+        parts.append(joined.drop(columns=['pair', 'day', 'time']))
+
+    # Scatter the per-group matches back into the original trade order
+    if parts:
+        found = pd.concat(parts, ignore_index=True).set_index('row').reindex(range(len(trades)))
+    else:
+        found = pd.DataFrame(index=range(len(trades)))
+    found = found.reindex(columns=output_columns)
+    found['kdb_time'] = pd.to_datetime(found['kdb_time'])
+
+    enriched = trades.copy()
+    for column in output_columns:
+        enriched[column] = found[column].to_numpy()
+
+    logger.info(f"Enriched {len(trades)} trades from {files} market files "
+                f"({groups} pair/day groups, tolerance {tolerance}, {direction})")
+    return enriched
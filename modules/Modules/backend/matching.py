@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - UAT/PROD Matching Engine
+Hash-partitioned, out-of-core matching by trade_id with field-level diffs
+"""
+
+import bisect
+import json
+import math
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+from typing import List, Dict, Optional, Sequence, Iterator
+
+import numpy as np
+import pandas as pd
+import logging
+
+from trade_store import iter_trades
+
+logger = logging.getLogger(__name__)
+
+# Fields compared between UAT and PROD on matched trades
+DIFF_FIELDS = ['deviation_percent', 'alert_description', 'is_out_of_scope']
+
+# Absolute tolerance for deviation_percent differences
+DEVIATION_TOLERANCE = 1e-9
+
+# Target rows per partition; both sides of a partition must fit in memory
+DEFAULT_PARTITION_ROWS = 2_000_000
+
+DEFAULT_CHUNK_ROWS = 500_000
+
+OUT_OF_SCOPE_PATTERN = 'out of scope'
+
+# Result files record the byte offset of at least every this many rows
+RESULT_INDEX_ROWS = 10_000
+
+OUTPUT_SUFFIXES = {
+    "matched": "matched",
+    "uat_only": "uat_only",
+    "prod_only": "prod_only",
+    "diffs": "diffs",
+}
+
+
+def partition_count(rows: int, partition_rows: int = DEFAULT_PARTITION_ROWS) -> int:
+    """Number of hash partitions needed to keep each one under partition_rows"""
+    return max(1, math.ceil(rows / partition_rows))
+
+
+def _partition_ids(trade_ids: pd.Series, n_partitions: int) -> np.ndarray:
+    hashes = pd.util.hash_pandas_object(trade_ids.astype(str), index=False).to_numpy()
+    return (hashes % np.uint64(n_partitions)).astype(np.int64)
+
+
+def _iter_files(paths: Sequence[Path], columns: Optional[List[str]], chunksize: int) -> Iterator[pd.DataFrame]:
+    """Non-empty chunks of several trade files, e.g. the day partitions of one side"""
+    for path in paths:
+        for chunk in iter_trades(path, columns, chunksize=chunksize):
+            if len(chunk):
+                yield chunk
+
+
+def _read_side(paths: Sequence[Path], columns: Optional[List[str]], chunksize: int) -> pd.DataFrame:
+    frames = list(_iter_files(paths, columns, chunksize))
+    if not frames:
+        return pd.DataFrame(columns=columns or ['trade_id'] + DIFF_FIELDS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _spill_partitions(paths: Sequence[Path], work_dir: Path, columns: Optional[List[str]],
+                      n_partitions: int, chunksize: int) -> int:
+    """Split trade files into per-partition pickle parts; returns rows read"""
+    rows = 0
+    for chunk_no, chunk in enumerate(_iter_files(paths, columns, chunksize)):
+        rows += len(chunk)
+        parts = _partition_ids(chunk['trade_id'], n_partitions)
+        for part, frame in chunk.groupby(parts, sort=False):
+            part_dir = work_dir / f"{part:04d}"
+            part_dir.mkdir(parents=True, exist_ok=True)
+            frame.to_pickle(part_dir / f"{chunk_no:05d}.pkl")
+    return rows
+
+
+def _load_partition(part_dir: Path) -> Optional[pd.DataFrame]:
+    files = sorted(part_dir.glob("*.pkl")) if part_dir.exists() else []
+    if not files:
+        return None
+    return pd.concat([pd.read_pickle(f) for f in files], ignore_index=True)
+
+
+def _not_equal(uat: pd.Series, prod: pd.Series, field: str) -> np.ndarray:
+    """Vectorized inequality that treats two missing values as equal"""
+    both_missing = (uat.isna() & prod.isna()).to_numpy()
+    if field == 'deviation_percent':
+        u = pd.to_numeric(uat, errors="coerce").to_numpy(dtype=float)
+        p = pd.to_numeric(prod, errors="coerce").to_numpy(dtype=float)
+        differs = ~np.isclose(u, p, rtol=0, atol=DEVIATION_TOLERANCE, equal_nan=True)
+    else:
+        differs = (uat.astype(object).to_numpy() != prod.astype(object).to_numpy())
+    return differs & ~both_missing
+
+
+def match_frames(uat_df: pd.DataFrame, prod_df: pd.DataFrame) -> Dict:
+    """Match one partition: UAT-only, PROD-only, matched rows and field diffs"""
+    prod_unique = prod_df.drop_duplicates('trade_id')
+    prod_fields = [f for f in DIFF_FIELDS if f in prod_unique.columns]
+
+    merged = uat_df.merge(
+        prod_unique[['trade_id'] + prod_fields].rename(columns={f: f"{f}_prod" for f in prod_fields}),
+        on='trade_id', how='left', indicator=True,
+    )
+    in_prod = (merged['_merge'] == 'both').to_numpy()
+    matched = merged[in_prod]
+    uat_only = uat_df[~in_prod]
+    prod_only = prod_df[~prod_df['trade_id'].isin(uat_df['trade_id'])]
+
+    # Out-of-scope alerts are excluded from the matched set, as before
+    if 'alert_description' in matched.columns:
+        out_of_scope = matched['alert_description'].astype(str).str.contains(
+            OUT_OF_SCOPE_PATTERN, case=False, na=False).to_numpy() & matched['alert_description'].notna().to_numpy()
+    else:
+        out_of_scope = np.zeros(len(matched), dtype=bool)
+
+    field_diffs = {}
+    any_diff = np.zeros(len(matched), dtype=bool)
+    for field in prod_fields:
+        if field not in matched.columns:
+            continue
+        mask = _not_equal(matched[field], matched[f"{field}_prod"], field)
+        field_diffs[field] = int(mask.sum())
+        any_diff |= mask
+
+    diff_columns = ['trade_id'] + [c for f in field_diffs for c in (f, f"{f}_prod")]
+    return {
+        "matched": matched.loc[~out_of_scope, uat_df.columns],
+        "uat_only": uat_only,
+        "prod_only": prod_only,
+        "diffs": matched.loc[any_diff, diff_columns].rename(columns={f: f"{f}_uat" for f in field_diffs}),
+        "out_of_scope_count": int(out_of_scope.sum()),
+        "field_diffs": field_diffs,
+    }
+
+
+def result_index_path(path: Path) -> Path:
+    """Sidecar holding [row, byte offset] pairs for a result CSV"""
+    path = Path(path)
+    return path.with_name(path.name + ".idx.json")
+
+
+class _OutputWriter:
+    """Appends partition results to one CSV per result kind
+
+    Rows go to private .part files under a per-run prefix, so concurrent
+    matches of the same pair never share a file; publish() renames them into
+    place once the run has finished. Rows are written in slices of at most
+    RESULT_INDEX_ROWS, and the byte offset of each slice is kept for paging.
+    """
+
+    def __init__(self, output_prefix: Path, run_id: str):
+        self.paths = {kind: Path(f"{output_prefix}_{run_id}_{suffix}.csv") for kind, suffix in OUTPUT_SUFFIXES.items()}
+        self.parts = {kind: path.with_name(path.name + ".part") for kind, path in self.paths.items()}
+        self.counts = {kind: 0 for kind in self.paths}
+        self.index: Dict[str, List[List[int]]] = {kind: [] for kind in self.paths}
+        for path in self.paths.values():
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, kind: str, frame: pd.DataFrame):
+        """Append rows; an empty frame still writes the header of a new file"""
+        with open(self.parts[kind], 'ab') as handle:
+            if handle.tell() == 0:
+                handle.write(frame.iloc[:0].to_csv(index=False).encode())
+            for start in range(0, len(frame), RESULT_INDEX_ROWS):
+                self.index[kind].append([self.counts[kind] + start, handle.tell()])
+                handle.write(frame.iloc[start:start + RESULT_INDEX_ROWS].to_csv(index=False, header=False).encode())
+        self.counts[kind] += len(frame)
+
+    def publish(self) -> Dict[str, Path]:
+        """Atomically move the finished parts and their row indexes to their final paths"""
+        published = {}
+        for kind, part in self.parts.items():
+            if part.exists():
+                index_part = result_index_path(part)
+                index_part.write_text(json.dumps(self.index[kind]))
+                os.replace(index_part, result_index_path(self.paths[kind]))
+                os.replace(part, self.paths[kind])
+                published[kind] = self.paths[kind]
+        return published
+
+    def discard(self):
+        for part in self.parts.values():
+            part.unlink(missing_ok=True)
+            result_index_path(part).unlink(missing_ok=True)
+
+
+def _seek_rows(path: Path, offset: int):
+    """Open a result CSV at the indexed row nearest before offset
+
+    Returns (handle, header, rows still to skip).
+    """
+    path = Path(path)
+    header = list(pd.read_csv(path, nrows=0).columns)
+    try:
+        index = json.loads(result_index_path(path).read_text())
+    except FileNotFoundError:
+        index = []
+    handle = open(path, 'rb')
+    position = bisect.bisect_right([row for row, _ in index], offset) - 1
+    if position < 0:
+        handle.readline()
+        return handle, header, offset
+    row, byte = index[position]
+    handle.seek(byte)
+    return handle, header, offset - row
+
+
+def read_result_page(path: Path, offset: int, limit: int,
+                     columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Rows offset..offset+limit of a result file, skipping at most RESULT_INDEX_ROWS rows"""
+    handle, header, skip = _seek_rows(path, offset)
+    with handle:
+        usecols = [c for c in columns if c in header] if columns else None
+        try:
+            return pd.read_csv(handle, header=None, names=header, usecols=usecols,
+                               skiprows=skip, nrows=limit)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame(columns=usecols or header)
+
+
+def iter_result_rows(path: Path, offset: int, chunksize: int,
+                     columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """Every row of a result file from offset onwards, chunksize rows at a time"""
+    handle, header, skip = _seek_rows(path, offset)
+    with handle:
+        usecols = [c for c in columns if c in header] if columns else None
+        try:
+            yield from pd.read_csv(handle, header=None, names=header, usecols=usecols,
+                                   skiprows=skip, chunksize=chunksize)
+        except pd.errors.EmptyDataError:
+            return
+
+
+def match_trade_files(uat_files: Sequence[Path], prod_files: Sequence[Path], output_prefix: Path,
+                      n_partitions: int = 1, chunksize: int = DEFAULT_CHUNK_ROWS,
+                      work_dir: Optional[Path] = None, run_id: Optional[str] = None) -> Dict:
+    """Match UAT and PROD trade files, e.g. the day partitions of a range, by trade_id
+
+    Both sides are hash-partitioned on trade_id into spill files so only one
+    partition of each side is in memory at a time. Matched, UAT-only, PROD-only
+    and differing rows are written to {output_prefix}_{run_id}_{kind}.csv;
+    run_id defaults to a fresh random id.
+    """
+    writer = _OutputWriter(output_prefix, run_id or uuid.uuid4().hex[:12])
+    totals = {"uat_count": 0, "prod_count": 0, "out_of_scope_count": 0}
+    field_diffs = {field: 0 for field in DIFF_FIELDS}
+
+    def consume(result: Dict):
+        for kind in OUTPUT_SUFFIXES:
+            writer.write(kind, result[kind])
+        totals["out_of_scope_count"] += result["out_of_scope_count"]
+        for field, count in result["field_diffs"].items():
+            field_diffs[field] += count
+
+    prod_columns = ['trade_id'] + DIFF_FIELDS
+
+    try:
+        if n_partitions <= 1:
+            uat_df = _read_side(uat_files, None, chunksize)
+            prod_df = _read_side(prod_files, prod_columns, chunksize)
+            totals["uat_count"], totals["prod_count"] = len(uat_df), len(prod_df)
+            consume(match_frames(uat_df, prod_df))
+        else:
+            spill_root = Path(tempfile.mkdtemp(prefix="gfx_match_", dir=work_dir))
+            try:
+                totals["uat_count"] = _spill_partitions(uat_files, spill_root / "uat", None, n_partitions, chunksize)
+                totals["prod_count"] = _spill_partitions(prod_files, spill_root / "prod", prod_columns, n_partitions, chunksize)
+
+                for part in range(n_partitions):
+                    uat_df = _load_partition(spill_root / "uat" / f"{part:04d}")
+                    prod_df = _load_partition(spill_root / "prod" / f"{part:04d}")
+                    if uat_df is None and prod_df is None:
+                        continue
+                    if uat_df is None:
+                        writer.write("prod_only", prod_df)
+                        continue
+                    if prod_df is None:
+                        prod_df = pd.DataFrame(columns=prod_columns)
+                    consume(match_frames(uat_df, prod_df))
+            finally:
+                shutil.rmtree(spill_root, ignore_errors=True)
+        output_files = writer.publish()
+    except BaseException:
+        writer.discard()
+        raise
+
+    logger.info(f"Matched {output_prefix.name}: {writer.counts['matched']} matched, "
+                f"{writer.counts['uat_only']} UAT-only, {writer.counts['prod_only']} PROD-only "
+                f"across {n_partitions} partition(s)")
+
+    return {
+        "prod_count": totals["prod_count"],
+        "uat_count": totals["uat_count"],
+        "matched_count": writer.counts["matched"],
+        "unmatched_count": writer.counts["uat_only"],
+        "prod_only_count": writer.counts["prod_only"],
+        "out_of_scope_count": totals["out_of_scope_count"],
+        "diff_count": writer.counts["diffs"],
+        "field_diffs": field_diffs,
+        "partitions": n_partitions,
+        "output_files": {kind: str(path) for kind, path in output_files.items()},
+    }
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Metrics
+Per-task stage timings, row/byte counts, queue wait and peak memory, and
+process-wide counters and histograms in Prometheus text format
+"""
+
+import bisect
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple, Sequence, Iterator
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+# Seconds; covers sub-millisecond reads up to multi-minute downloads
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0, 120.0, 300.0, 600.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, where /proc is available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Highest resident set size this process has reached"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic total per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """Last value set per label set"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., count above the last bucket], sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "gfx_stage_duration_seconds", "Time spent in each processing stage", ["stage"])
+STAGE_ROWS = REGISTRY.counter(
+    "gfx_stage_rows_total", "Rows handled by each processing stage", ["stage"])
+STAGE_BYTES = REGISTRY.counter(
+    "gfx_stage_bytes_total", "Bytes read or written by each processing stage", ["stage"])
+STAGE_FAILURES = REGISTRY.counter(
+    "gfx_stage_failures_total", "Processing stages that raised", ["stage"])
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "gfx_queue_wait_seconds", "Time tasks waited for a worker", ["queue"])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "gfx_http_request_duration_seconds", "API request latency", ["endpoint", "method", "status"])
+
+
+class TaskMetrics:
+    """Stage timings, counts, queue wait and peak memory of one job or task
+
+    Created when the task is queued; start() records the queue wait. Memory
+    is the API process's RSS: the highest value seen at stage boundaries,
+    or the new process peak when a stage raised it.
+    """
+
+    def __init__(self, queue: Optional[str] = None):
+        self.queue = queue
+        self._submitted = time.monotonic()
+        self._lock = threading.Lock()
+        self.queue_wait_seconds: Optional[float] = None
+        self.stages: Dict[str, Dict] = {}
+        self.peak_rss_bytes: Optional[int] = None
+        # Bumped on every recorded change, so a snapshot can tell it is stale
+        self.revision = 0
+
+    def start(self):
+        """The task got a worker"""
+        wait = time.monotonic() - self._submitted
+        with self._lock:
+            self.queue_wait_seconds = round(wait, 4)
+            self.revision += 1
+        if self.queue is not None:
+            QUEUE_WAIT_SECONDS.observe(wait, queue=self.queue)
+
+    def _note_memory(self, peak_before: Optional[int]):
+        peak_after = peak_rss_bytes()
+        if peak_before is not None and peak_after is not None and peak_after > peak_before:
+            observed = peak_after
+        else:
+            observed = current_rss_bytes()
+        if observed is not None:
+            with self._lock:
+                if observed > (self.peak_rss_bytes or 0):
+                    self.peak_rss_bytes = observed
+                    self.revision += 1
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict]:
+        """Time a stage; the block may add "rows" and "bytes" to the yielded dict"""
+        counts: Dict = {}
+        peak_before = peak_rss_bytes()
+        self._note_memory(None)
+        start = time.perf_counter()
+        try:
+            yield counts
+        except BaseException:
+            STAGE_FAILURES.inc(stage=name)
+            raise
+        finally:
+            self.add(name, time.perf_counter() - start, counts.get("rows"), counts.get("bytes"))
+            self._note_memory(peak_before)
+
+    def add(self, name: str, seconds: float, rows: Optional[int] = None, nbytes: Optional[int] = None):
+        """Record time (and counts) for a stage; repeated stages accumulate"""
+        STAGE_SECONDS.observe(seconds, stage=name)
+        if rows:
+            STAGE_ROWS.inc(rows, stage=name)
+        if nbytes:
+            STAGE_BYTES.inc(nbytes, stage=name)
+        with self._lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0})
+            entry["seconds"] = round(entry["seconds"] + seconds, 4)
+            if rows is not None:
+                entry["rows"] = entry.get("rows", 0) + int(rows)
+            if nbytes is not None:
+                entry["bytes"] = entry.get("bytes", 0) + int(nbytes)
+            self.revision += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "queue_wait_seconds": self.queue_wait_seconds,
+                "stages": {name: dict(entry) for name, entry in self.stages.items()},
+                "peak_rss_mb": round(self.peak_rss_bytes / 1024 / 1024, 1) if self.peak_rss_bytes else None,
+            }
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Rounding
+Vectorized, decimal-exact half-up rounding for prices and deviations
+"""
+
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+# 10 ** places must be exact in float64 and leave room for the scaled value
+MAX_PLACES = 15
+
+ArrayLike = Union[pd.Series, np.ndarray, list, float]
+
+
+def round_half_up(values: ArrayLike, places: int = 0) -> ArrayLike:
+    """Round to places decimals with ties away from zero, like Decimal ROUND_HALF_UP
+
+    Floats are treated as the shortest decimal they represent, so 0.15 rounds
+    to 0.2 and 2.675 to 2.68 even though the stored doubles sit just below the
+    half. A value counts as a tie when it is within float error of one: the
+    representation error of the input plus that of the scaling. Exact for
+    inputs of up to 15 significant digits. NaN and inf pass through. Series
+    keep their index and name.
+    """
+    if not 0 <= int(places) <= MAX_PLACES:
+        raise ValueError(f"places must be between 0 and {MAX_PLACES}")
+    places = int(places)
+
+    if isinstance(values, pd.Series):
+        return pd.Series(round_half_up(values.to_numpy(dtype=float, na_value=np.nan), places),
+                         index=values.index, name=values.name)
+
+    array = np.asarray(values, dtype=float)
+    factor = 10.0 ** places
+
+    magnitude = np.abs(array)
+    scaled = magnitude * factor
+    floored = np.floor(scaled)
+
+    # Half a ulp of the input, scaled, plus half a ulp from the multiplication
+    tolerance = np.spacing(magnitude) * factor + np.spacing(scaled)
+
+    with np.errstate(invalid='ignore'):
+        rounded = (floored + (scaled - floored >= 0.5 - tolerance)) / factor
+        # The requested digit is below float resolution for this value, so a
+        # decimal input has nothing there to round; scaling back would add noise
+        rounded = np.where(tolerance >= 0.5, magnitude, rounded)
+
+    result = np.copysign(rounded, array)
+    return result if result.ndim else float(result)
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Synthetic Data
+Seeded, vectorized generators for UAT/PROD trade sets, EPE exception
+extracts and KDB ticks at production volumes, for demos and load tests
+"""
+
+import gzip
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Optional, Iterator, Union
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import logging
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CCY_PAIRS = ['EURUSD', 'GBPUSD', 'USDJPY', 'USDCHF', 'USDCAD', 'EURGBP', 'AUDUSD', 'NZDUSD']
+
+# Rows drawn per random stream; output is identical however callers re-chunk it
+BLOCK_ROWS = 250_000
+
+# Reference mid used to seed each pair's tick walk
+PAIR_MIDS = {
+    'EURUSD': 1.08, 'GBPUSD': 1.27, 'USDJPY': 148.0, 'USDCHF': 0.88,
+    'USDCAD': 1.35, 'EURGBP': 0.86, 'AUDUSD': 0.66, 'NZDUSD': 0.61,
+}
+
+# Matching treats descriptions containing "out of scope" as out of scope
+OUT_OF_SCOPE_DESCRIPTION = 'Trade out of scope'
+
+EXCEPTION_TYPES = ['PRICE_DEVIATION', 'LIQUIDITY_ISSUE', 'TIMEOUT']
+EXCEPTION_DESCRIPTIONS = ['Price deviation detected', 'Low liquidity', 'Request timeout']
+EXCEPTION_STATUSES = ['OPEN', 'RESOLVED', 'PENDING']
+
+DateLike = Union[str, date, datetime]
+
+# Distinct deviations whose formatted alert description is kept across blocks
+DESCRIPTION_CACHE_SIZE = 65_536
+
+
+@dataclass
+class TradeProfile:
+    """Shape of a synthetic UAT/PROD trade set"""
+    ccy_pairs: List[str] = field(default_factory=lambda: list(DEFAULT_CCY_PAIRS))
+    pair_skew: float = 1.0           # Zipf exponent of pair popularity; 0 is uniform
+    prod_coverage: float = 0.97      # share of UAT trades also booked in PROD
+    prod_only_rate: float = 0.02     # PROD-only trades, per UAT trade
+    diff_rate: float = 0.05          # share of matched trades whose PROD deviation differs
+    deviation_scale: float = 0.5     # mean deviation_percent of ordinary trades
+    tail_rate: float = 0.01          # share of trades from the heavy tail
+    tail_scale: float = 5.0          # mean deviation_percent of tail trades
+    out_of_scope_rate: float = 0.05  # flagged and described as out of scope
+    alert_threshold: float = 0.5     # deviations above this carry an alert_description
+
+
+def _stream_key(*parts) -> int:
+    return zlib.crc32("|".join(str(p) for p in parts).encode())
+
+
+def _rng(seed: int, *parts) -> np.random.Generator:
+    return np.random.default_rng([seed, _stream_key(*parts)])
+
+
+def _today() -> datetime:
+    return datetime.combine(date.today(), datetime.min.time())
+
+
+def _to_datetime(value: DateLike) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d")
+
+
+def numbered_ids(prefix: str, numbers: np.ndarray, width: int = 6) -> pd.Series:
+    """f"{prefix}{n:0{width}d}" for every number, built as bytes without a Python loop"""
+    numbers = np.asarray(numbers, dtype=np.int64)
+    if len(numbers):
+        width = max(width, len(str(int(numbers.max()))))
+    head = np.frombuffer(prefix.encode(), dtype=np.uint8)
+    raw = np.empty((len(numbers), len(head) + width), dtype=np.uint8)
+    raw[:, :len(head)] = head
+    for position in range(width):
+        raw[:, len(head) + position] = (numbers // 10 ** (width - 1 - position)) % 10 + ord('0')
+    if pa is not None:
+        # Fixed-width rows are already a valid Arrow string buffer
+        offsets = np.arange(0, raw.size + 1, raw.shape[1], dtype=np.int32)
+        return pa.StringArray.from_buffers(len(numbers), pa.py_buffer(offsets), pa.py_buffer(raw)).to_pandas()
+    return pd.Series(raw.view(f"S{raw.shape[1]}").ravel().astype(str))
+
+
+def _pair_weights(profile: TradeProfile) -> np.ndarray:
+    weights = 1.0 / np.arange(1, len(profile.ccy_pairs) + 1) ** profile.pair_skew
+    return np.cumsum(weights / weights.sum())
+
+
+def _deviations(rng: np.random.Generator, rows: int, profile: TradeProfile) -> np.ndarray:
+    tail = rng.random(rows) < profile.tail_rate
+    scale = np.where(tail, profile.tail_scale, profile.deviation_scale)
+    return np.round(rng.exponential(1.0, rows) * scale, 4)
+
+
+@lru_cache(maxsize=DESCRIPTION_CACHE_SIZE)
+def _description_label(deviation: float) -> str:
+    return f'Deviation {deviation}% detected'
+
+
+def _alert_descriptions(deviation: np.ndarray, out_of_scope: np.ndarray, threshold: float) -> pd.Categorical:
+    """'Deviation {d}% detected' above threshold, OUT_OF_SCOPE_DESCRIPTION for
+    out-of-scope trades, None otherwise
+
+    Deviations have 4 decimals, so only the distinct values are formatted.
+    """
+    alerting = (deviation > threshold) & ~out_of_scope
+    values, inverse = np.unique(deviation[alerting], return_inverse=True)
+    codes = np.full(len(deviation), -1, dtype=np.int64)
+    codes[alerting] = inverse
+    codes[out_of_scope] = len(values)
+    labels = [_description_label(v) for v in values.tolist()]
+    return pd.Categorical.from_codes(codes, labels + [OUT_OF_SCOPE_DESCRIPTION])
+
+
+def _trade_block(legal_entity: str, source_system: str, environment: str, product_type: str,
+                 window_start: datetime, window_seconds: int, rows: int, block_no: int,
+                 first: int, id_width: int, profile: TradeProfile, seed: int, tag: str = "") -> pd.DataFrame:
+    """One block of trades; UAT and PROD draw the same shared stream
+
+    A tag (the day, for daily sets) gets its own streams and id range.
+    """
+    stream = (block_no, tag) if tag else (block_no,)
+    id_prefix = f"TRD-{legal_entity}-{tag}-" if tag else f"TRD-{legal_entity}-"
+    shared = _rng(seed, "trades", legal_entity, source_system, product_type, *stream)
+    pair_codes = np.searchsorted(_pair_weights(profile), shared.random(rows), side='right')
+    offsets = shared.integers(0, window_seconds + 1, rows)
+    deviation = _deviations(shared, rows, profile)
+    out_of_scope = shared.random(rows) < profile.out_of_scope_rate
+    in_prod = shared.random(rows) < profile.prod_coverage
+    differs = shared.random(rows) < profile.diff_rate
+    numbers = np.arange(first + 1, first + rows + 1)
+
+    if environment.upper() == "PROD":
+        # PROD keeps covered trades, moves some deviations and adds trades UAT never saw
+        drift = np.round(shared.normal(0, profile.deviation_scale / 4, rows), 4)
+        deviation = np.where(differs, np.abs(deviation + drift), deviation)
+
+        prod_only = _rng(seed, "prod_only", legal_entity, source_system, product_type, *stream)
+        extra = int(round(rows * profile.prod_only_rate))
+        keep = in_prod
+        pair_codes = np.concatenate([pair_codes[keep], np.searchsorted(
+            _pair_weights(profile), prod_only.random(extra), side='right')])
+        offsets = np.concatenate([offsets[keep], prod_only.integers(0, window_seconds + 1, extra)])
+        deviation = np.concatenate([deviation[keep], _deviations(prod_only, extra, profile)])
+        out_of_scope = np.concatenate([out_of_scope[keep], prod_only.random(extra) < profile.out_of_scope_rate])
+        ids = pd.concat([
+            numbered_ids(id_prefix, numbers[keep], id_width),
+            numbered_ids(f"{id_prefix}P", numbers[:extra], id_width),
+        ], ignore_index=True)
+    else:
+        ids = numbered_ids(id_prefix, numbers, id_width)
+
+    pair_codes = np.minimum(pair_codes, len(profile.ccy_pairs) - 1)
+    trade_dates = np.datetime64(window_start, 's') + offsets.astype('timedelta64[s]')
+    # Low-cardinality columns as categoricals, matching the typed trade reader
+    constant = lambda value: pd.Categorical.from_codes(np.zeros(len(ids), dtype=np.int8), [value])
+    return pd.DataFrame({
+        'trade_id': ids,
+        'product_type': constant(product_type),
+        'legal_entity': constant(legal_entity),
+        'source_system': constant(source_system),
+        'ccy_pair': pd.Categorical.from_codes(pair_codes, profile.ccy_pairs),
+        'trade_date': trade_dates,
+        'deviation_percent': deviation,
+        'alert_description': _alert_descriptions(deviation, out_of_scope, profile.alert_threshold),
+        'is_out_of_scope': out_of_scope,
+    })
+
+
+def trade_chunks(legal_entity: str, source_system: str, environment: str, rows: int,
+                 start_date: Optional[DateLike] = None, end_date: Optional[DateLike] = None,
+                 product_type: str = "FX_SPOT", profile: Optional[TradeProfile] = None,
+                 seed: int = 0) -> Iterator[pd.DataFrame]:
+    """Yield a trade set block by block
+
+    rows is the size of the UAT set; PROD is derived from the same draws, so
+    generating the two environments separately still yields matching trade
+    ids, the configured coverage and diff rates, and PROD-only trades.
+    Trades fall between start_date and end_date inclusive (the last 30
+    days when no window is given).
+    """
+    profile = profile or TradeProfile()
+    if start_date and end_date:
+        window_start = _to_datetime(start_date)
+        window_end = _to_datetime(end_date) + timedelta(days=1)
+    else:
+        window_end = _today()
+        window_start = window_end - timedelta(days=30)
+    window_seconds = max(int((window_end - window_start).total_seconds()) - 1, 0)
+    id_width = max(6, len(str(rows)))
+
+    for block_no, first in enumerate(range(0, rows, BLOCK_ROWS)):
+        yield _trade_block(legal_entity, source_system, environment, product_type,
+                           window_start, window_seconds, min(BLOCK_ROWS, rows - first),
+                           block_no, first, id_width, profile, seed)
+
+
+def trade_frame(legal_entity: str, source_system: str, environment: str, rows: int,
+                start_date: Optional[DateLike] = None, end_date: Optional[DateLike] = None,
+                product_type: str = "FX_SPOT", profile: Optional[TradeProfile] = None,
+                seed: int = 0) -> pd.DataFrame:
+    """Whole trade set as one frame; see trade_chunks"""
+    blocks = list(trade_chunks(legal_entity, source_system, environment, rows, start_date, end_date,
+                               product_type, profile, seed))
+    return concat_blocks(blocks)
+
+
+def concat_blocks(blocks: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate generated blocks, merging categories instead of falling back to strings"""
+    if len(blocks) == 1:
+        return blocks[0]
+    columns = {}
+    for name, dtype in blocks[0].dtypes.items():
+        parts = [block[name] for block in blocks]
+        if isinstance(dtype, pd.CategoricalDtype):
+            columns[name] = union_categoricals(parts)
+        else:
+            columns[name] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def trade_csv_chunks(legal_entity: str, source_system: str, environment: str, rows: int,
+                     start_date: Optional[DateLike] = None, end_date: Optional[DateLike] = None,
+                     product_type: str = "FX_SPOT", profile: Optional[TradeProfile] = None,
+                     seed: int = 0) -> Iterator[bytes]:
+    """Trade set as CSV byte chunks, like a streamed API response"""
+    for block_no, block in enumerate(trade_chunks(legal_entity, source_system, environment, rows,
+                                                  start_date, end_date, product_type, profile, seed)):
+        yield block.to_csv(index=False, header=(block_no == 0)).encode()
+
+
+def daily_trade_csv_chunks(legal_entity: str, source_system: str, environment: str, rows_per_day: int,
+                           start_date: DateLike, end_date: DateLike, product_type: str = "FX_SPOT",
+                           profile: Optional[TradeProfile] = None, seed: int = 0) -> Iterator[bytes]:
+    """Trade set drawn day by day, as CSV byte chunks
+
+    Each day has its own seeded streams and trade ids, so a request for a
+    few days returns exactly the rows a request for the whole month has on
+    those days, as a real feed would for delta downloads.
+    """
+    profile = profile or TradeProfile()
+    id_width = max(6, len(str(rows_per_day)))
+    header = True
+    day, last = _to_datetime(start_date), _to_datetime(end_date)
+    while day <= last:
+        tag = day.strftime("%Y%m%d")
+        for block_no, first in enumerate(range(0, rows_per_day, BLOCK_ROWS)):
+            block = _trade_block(legal_entity, source_system, environment, product_type, day, 86399,
+                                 min(BLOCK_ROWS, rows_per_day - first), block_no, first, id_width,
+                                 profile, seed, tag)
+            yield block.to_csv(index=False, header=header).encode()
+            header = False
+        day += timedelta(days=1)
+
+
+def epe_frame(exception_status: str, count: int, overlap: float = 0.5,
+              start_date: Optional[DateLike] = None, seed: int = 0) -> pd.DataFrame:
+    """One EPE extract; the Closed and new extracts share overlap * count exception ids"""
+    is_closed = exception_status.lower() == "closed"
+    offset = 0 if is_closed else int(round(count * (1 - overlap)))
+    numbers = np.arange(offset, offset + count)
+    rng = _rng(seed, "epe", exception_status.lower(), count)
+    created_base = _to_datetime(start_date) if start_date else _today()
+    created_at = (np.datetime64(created_base, 's')
+                  - rng.integers(0, 30 * 86400, count).astype('timedelta64[s]'))
+    return pd.DataFrame({
+        'exception_id': numbered_ids('EPE-', numbers),
+        'trade_id': numbered_ids('TRD-2024-', numbers),
+        'exception_status': exception_status,
+        'created_at': created_at,
+    })
+
+
+def daily_epe_frame(exception_status: str, count_per_day: int, start_date: DateLike, end_date: DateLike,
+                    overlap: float = 0.5, seed: int = 0) -> pd.DataFrame:
+    """EPE extract drawn day by day, created within the window; see daily_trade_csv_chunks"""
+    is_closed = exception_status.lower() == "closed"
+    offset = 0 if is_closed else int(round(count_per_day * (1 - overlap)))
+    numbers = np.arange(offset, offset + count_per_day)
+    frames = []
+    day, last = _to_datetime(start_date), _to_datetime(end_date)
+    while day <= last:
+        tag = day.strftime("%Y%m%d")
+        rng = _rng(seed, "epe", exception_status.lower(), count_per_day, tag)
+        frames.append(pd.DataFrame({
+            'exception_id': numbered_ids(f'EPE-{tag}-', numbers),
+            'trade_id': numbered_ids(f'TRD-{tag}-', numbers),
+            'exception_status': exception_status,
+            'created_at': np.datetime64(day, 's') + rng.integers(0, 86400, count_per_day).astype('timedelta64[s]'),
+        }))
+        day += timedelta(days=1)
+    return pd.concat(frames, ignore_index=True)
+
+
+def exception_frame(count: int, seed: int = 0) -> pd.DataFrame:
+    """Generic trade exceptions, one type/status cycle per trade"""
+    rng = _rng(seed, "exceptions", count)
+    kinds = rng.integers(0, len(EXCEPTION_TYPES), count)
+    created_at = (np.datetime64(_today(), 's')
+                  - rng.integers(0, 30 * 86400, count).astype('timedelta64[s]'))
+    return pd.DataFrame({
+        'trade_id': numbered_ids('TRD-2024-', np.arange(1, count + 1)),
+        'exception_type': np.asarray(EXCEPTION_TYPES, dtype=object)[kinds],
+        'description': np.asarray(EXCEPTION_DESCRIPTIONS, dtype=object)[kinds],
+        'status': np.asarray(EXCEPTION_STATUSES, dtype=object)[rng.integers(0, len(EXCEPTION_STATUSES), count)],
+        'created_at': created_at,
+    })
+
+
+def market_ticks(ccy_pair: str, start_time: DateLike, end_time: DateLike,
+                 freq: str = "1min", volatility: float = 0.0001, spread: float = 0.0001,
+                 seed: int = 0) -> pd.DataFrame:
+    """Weekday bid/ask ticks between two timestamps
+
+    Each day is its own seeded walk, so overlapping queries return the same
+    ticks for the days they share.
+    """
+    times = pd.date_range(start_time, end_time, freq=freq)
+    times = times[times.weekday < 5]
+    if not len(times):
+        return pd.DataFrame({'time': times, 'bid': [], 'ask': []})
+
+    days = times.normalize()
+    day_starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    mid = np.empty(len(times))
+    base = PAIR_MIDS.get(ccy_pair, 1.0)
+    for i, lo in enumerate(day_starts):
+        hi = day_starts[i + 1] if i + 1 < len(day_starts) else len(times)
+        day = days[lo]
+        rng = _rng(seed, "kdb", ccy_pair, day.strftime("%Y-%m-%d"), freq)
+        # Minutes elapsed since midnight, so a partial day lines up with the full one
+        elapsed = int((times[lo] - day) / pd.Timedelta(freq))
+        steps = rng.normal(0, volatility * base, elapsed + hi - lo)
+        mid[lo:hi] = base + np.cumsum(steps)[elapsed:]
+
+    half_spread = spread * base / 2
+    return pd.DataFrame({
+        'time': times,
+        'bid': (mid - half_spread).round(5),
+        'ask': (mid + half_spread).round(5),
+    })
+
+
+def write_trade_set(trades_dir: Path, legal_entity: str, source_system: str, rows: int,
+                    start_date: DateLike, end_date: DateLike, product_type: str = "FX_SPOT",
+                    profile: Optional[TradeProfile] = None, seed: int = 0,
+                    compresslevel: int = 1) -> Dict[str, Path]:
+    """Write UAT and PROD files in the download layout: {trades_dir}/{ENV}/{name}.gz"""
+    start, end = _to_datetime(start_date).strftime("%Y-%m-%d"), _to_datetime(end_date).strftime("%Y-%m-%d")
+    paths = {}
+    for environment in ["UAT", "PROD"]:
+        path = Path(trades_dir) / environment / f"{product_type}_{legal_entity}_{source_system}_{start}_{end}.gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=compresslevel, mtime=0) as f:
+                for chunk in trade_csv_chunks(legal_entity, source_system, environment, rows,
+                                              start, end, product_type, profile, seed):
+                    f.write(chunk)
+        paths[environment] = path
+    logger.info(f"Wrote synthetic {legal_entity}/{source_system} trade set of {rows} rows")
+    return paths
+
+
+def write_epe_set(exceptions_dir: Path, environment: str, start_date: str, end_date: str,
+                  count: int, overlap: float = 0.5, seed: int = 0) -> Dict[str, Path]:
+    """Write an environment's Closed and new extracts: {ENV}/{start}_EPE_Data_{Closed|new}_{end}.csv"""
+    paths = {}
+    for status, label in (("closed", "Closed"), ("new", "new")):
+        path = Path(exceptions_dir) / environment / f"{start_date}_EPE_Data_{label}_{end_date}.csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        epe_frame(status, count, overlap, start_date, seed).to_csv(path, index=False)
+        paths[status] = path
+    return paths
+
+
+def threshold_frame(legal_entities: List[str], currencies: Optional[List[str]] = None,
+                    groups: int = 4, seed: int = 0) -> pd.DataFrame:
+    """Threshold upload covering every (LegalEntity, CCY), in the columns process_threshold_file expects"""
+    if currencies is None:
+        currencies = sorted({pair[i:i + 3] for pair in DEFAULT_CCY_PAIRS for i in (0, 3)})
+    rng = _rng(seed, "thresholds", len(legal_entities), len(currencies))
+    rows = len(legal_entities) * len(currencies)
+    levels = np.round(0.1 * 2.0 ** np.arange(groups), 4)
+    original = rng.integers(0, groups, rows)
+    proposed = np.clip(original + rng.integers(-1, 2, rows), 0, groups - 1)
+    return pd.DataFrame({
+        'LegalEntity': np.repeat(legal_entities, len(currencies)),
+        'CCY': np.tile(currencies, len(legal_entities)),
+        'Original_Group': [f'Group {g + 1}' for g in original],
+        'Original_Threshold': levels[original],
+        'Proposed_Group': [f'Group {g + 1}' for g in proposed],
+        'Proposed_Threshold': levels[proposed],
+    })
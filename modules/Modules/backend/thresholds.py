@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Threshold Store
+In-memory, indexed threshold table backed by the processed CSV and an
+append-only update log
+"""
+
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple, Any
+
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+THRESHOLD_COLUMNS = ['Original_Threshold', 'Proposed_Threshold', 'Adjusted_Threshold']
+
+# Log entries replayed before the CSV is rewritten and the log truncated
+DEFAULT_COMPACT_EVERY = 200
+
+
+class ThresholdUpdateError(ValueError):
+    """Raised when an update names an unknown group, currency or id"""
+
+
+def _clean(value: Any) -> Any:
+    """JSON-safe cell value: NaN becomes None, numpy scalars become Python"""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+class ThresholdStore:
+    """Thresholds for one mode, loaded once and indexed by (LegalEntity, CCY) and group"""
+
+    def __init__(self, csv_path: Path, compact_every: int = DEFAULT_COMPACT_EVERY):
+        self.csv_path = Path(csv_path)
+        self.log_path = self.csv_path.with_suffix(".log")
+        self.compact_every = compact_every
+
+        self._lock = threading.RLock()
+        self._rows: List[Dict] = []
+        self._columns: List[str] = []
+        self._by_key: Dict[Tuple[str, str], int] = {}
+        self._by_group: Dict[str, List[int]] = {}
+        self._log_entries = 0
+        self._views: Dict[str, List[Dict]] = {}
+        self._loaded = False
+
+    # -- loading -------------------------------------------------------
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+
+    def _load(self):
+        self._rows, self._columns = [], []
+        if self.csv_path.exists():
+            df = pd.read_csv(self.csv_path)
+            self._columns = list(df.columns)
+            self._rows = [{k: _clean(v) for k, v in row.items()} for row in df.to_dict('records')]
+        self._reindex()
+
+        # Replay updates made since the last compaction
+        self._log_entries = 0
+        if self.log_path.exists():
+            with open(self.log_path) as f:
+                for line in f:
+                    if line.strip():
+                        self._apply(json.loads(line))
+                        self._log_entries += 1
+
+        self._views.clear()
+        self._loaded = True
+        logger.info(f"Loaded {len(self._rows)} thresholds from {self.csv_path.name} "
+                    f"({self._log_entries} logged updates)")
+
+    def _reindex(self):
+        self._by_key, self._by_group = {}, {}
+        for idx, row in enumerate(self._rows):
+            self._by_key[(row.get('LegalEntity'), row.get('CCY'))] = idx
+            self._by_group.setdefault(row.get('Adjusted_Group'), []).append(idx)
+
+    def reset(self):
+        """Drop the update log and reload, e.g. after a new threshold file upload"""
+        with self._lock:
+            self.log_path.unlink(missing_ok=True)
+            self._load()
+
+    # -- reads ---------------------------------------------------------
+
+    def get(self, legal_entity: str, currency: str) -> Optional[Dict]:
+        """O(1) lookup of one currency's thresholds"""
+        self._ensure_loaded()
+        idx = self._by_key.get((legal_entity, currency))
+        return dict(self._rows[idx]) if idx is not None else None
+
+    def group_rows(self, group: str) -> List[Dict]:
+        self._ensure_loaded()
+        return [dict(self._rows[idx]) for idx in self._by_group.get(group, [])]
+
+    def group_view(self) -> List[Dict]:
+        """Per-group max thresholds in the /api/thresholds group shape"""
+        self._ensure_loaded()
+        with self._lock:
+            if "group" not in self._views:
+                view = []
+                for group in sorted(g for g in self._by_group if g is not None):
+                    rows = [self._rows[idx] for idx in self._by_group[group]]
+                    maxima = {}
+                    for column in THRESHOLD_COLUMNS:
+                        values = [r.get(column) for r in rows if r.get(column) is not None]
+                        maxima[column] = max(values) if values else None
+                    view.append({
+                        "id": len(view) + 1,
+                        "group": group,
+                        "originalThreshold": maxima['Original_Threshold'],
+                        "proposedThreshold": maxima['Proposed_Threshold'],
+                        "adjustedThreshold": maxima['Adjusted_Threshold']
+                    })
+                self._views["group"] = view
+            return self._views["group"]
+
+    def currency_view(self) -> List[Dict]:
+        """One entry per (LegalEntity, CCY) in the /api/thresholds currency shape"""
+        self._ensure_loaded()
+        with self._lock:
+            if "currency" not in self._views:
+                self._views["currency"] = [{
+                    "id": idx + 1,
+                    "legalEntity": row.get('LegalEntity'),
+                    "currency": row.get('CCY'),
+                    "group": row.get('Adjusted_Group'),
+                    "originalThreshold": row.get('Original_Threshold'),
+                    "proposedThreshold": row.get('Proposed_Threshold'),
+                    "adjustedThreshold": row.get('Adjusted_Threshold')
+                } for idx, row in enumerate(self._rows)]
+            return self._views["currency"]
+
+    def threshold_map(self, column: str = 'Adjusted_Threshold') -> Dict[Tuple[str, str], float]:
+        """{(LegalEntity, CCY): threshold} for vectorized per-trade lookups"""
+        self._ensure_loaded()
+        with self._lock:
+            return {key: self._rows[idx].get(column) for key, idx in self._by_key.items()
+                    if self._rows[idx].get(column) is not None}
+
+    def group_for_id(self, threshold_id: int) -> Optional[str]:
+        view = self.group_view()
+        return view[threshold_id - 1]["group"] if 0 < threshold_id <= len(view) else None
+
+    # -- writes --------------------------------------------------------
+
+    def _resolve(self, update: Dict) -> Dict:
+        """Turn an API update into a log entry, validating its target"""
+        if not isinstance(update, dict):
+            raise ThresholdUpdateError("Each update must be an object")
+        value = update.get('adjustedThreshold')
+        if value is None:
+            raise ThresholdUpdateError("adjustedThreshold is required")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ThresholdUpdateError(f"adjustedThreshold must be a number, got {value!r}")
+        if not math.isfinite(value):
+            raise ThresholdUpdateError(f"adjustedThreshold must be finite, got {value!r}")
+
+        if update.get('legalEntity') is not None or update.get('currency') is not None:
+            key = (update.get('legalEntity'), update.get('currency'))
+            if key not in self._by_key:
+                raise ThresholdUpdateError(f"Unknown currency threshold: {key[0]}/{key[1]}")
+            return {"op": "currency", "legalEntity": key[0], "currency": key[1], "value": value}
+
+        if update.get('id') is not None and update.get('group') is None:
+            try:
+                idx = int(update['id']) - 1
+            except (TypeError, ValueError):
+                raise ThresholdUpdateError(f"Unknown threshold id: {update['id']}")
+            if not 0 <= idx < len(self._rows):
+                raise ThresholdUpdateError(f"Unknown threshold id: {update['id']}")
+            row = self._rows[idx]
+            return {"op": "currency", "legalEntity": row.get('LegalEntity'),
+                    "currency": row.get('CCY'), "value": value}
+
+        group = update.get('group')
+        if group not in self._by_group:
+            raise ThresholdUpdateError(f"Unknown threshold group: {group}")
+        return {"op": "group", "group": group, "value": value}
+
+    def _apply(self, entry: Dict):
+        if entry["op"] == "group":
+            indices = self._by_group.get(entry["group"], [])
+        else:
+            idx = self._by_key.get((entry["legalEntity"], entry["currency"]))
+            indices = [] if idx is None else [idx]
+        for idx in indices:
+            self._rows[idx]['Adjusted_Threshold'] = entry["value"]
+
+    def update(self, updates: List[Dict]) -> int:
+        """Apply a batch of group and/or currency updates atomically
+
+        Each update is {"group", "adjustedThreshold"} or
+        {"legalEntity", "currency", "adjustedThreshold"} (or a currency "id").
+        The whole batch is validated first, appended to the log with one
+        fsync, then applied in memory. Returns the number of rows changed.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            entries = [self._resolve(update) for update in updates]
+            if not entries:
+                return 0
+
+            with open(self.log_path, 'a') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            changed = 0
+            for entry in entries:
+                self._apply(entry)
+                changed += len(self._by_group.get(entry["group"], [])) if entry["op"] == "group" else 1
+            self._log_entries += len(entries)
+            self._views.clear()
+
+            if self._log_entries >= self.compact_every:
+                self.compact()
+            return changed
+
+    def compact(self):
+        """Rewrite the CSV from memory and truncate the update log"""
+        self._ensure_loaded()
+        with self._lock:
+            if not self._columns:
+                return
+            tmp_path = self.csv_path.with_name(self.csv_path.name + ".tmp")
+            pd.DataFrame(self._rows, columns=self._columns).to_csv(tmp_path, index=False)
+            os.replace(tmp_path, self.csv_path)
+            self.log_path.unlink(missing_ok=True)
+            self._log_entries = 0
+            logger.info(f"Compacted thresholds into {self.csv_path.name}")
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+GFX Threshold Deviation Dashboard - Columnar Trade Cache
+Typed Parquet copies of the gzip CSV trade drops, read with column
+projection and predicate pushdown
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import List, Dict, Optional, Sequence, Iterable, Tuple, Any
+
+import pandas as pd
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_SUFFIX = ".parquet"
+FINGERPRINT_KEY = b"gfx_source_fingerprint"
+
+CATEGORICAL_COLUMNS = ['product_type', 'legal_entity', 'source_system', 'ccy_pair']
+DATETIME_COLUMNS = ['trade_date']
+FLOAT_COLUMNS = ['deviation_percent']
+BOOL_COLUMNS = ['is_out_of_scope']
+
+# A filter is (column, op, value) as understood by pyarrow.parquet
+Filter = Tuple[str, str, Any]
+
+
+def file_fingerprint(path: Path) -> Dict:
+    """Identify a file's content by size and modification time"""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def columnar_path(path: Path) -> Path:
+    """Parquet cache path for a trade file: FX_SPOT_..._2024-01-31.gz -> .parquet"""
+    return Path(path).with_suffix(COLUMNAR_SUFFIX)
+
+
+def _arrow_type(column: str):
+    if column in CATEGORICAL_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if column in DATETIME_COLUMNS:
+        return pa.timestamp("us")
+    if column in FLOAT_COLUMNS:
+        return pa.float64()
+    if column in BOOL_COLUMNS:
+        return pa.bool_()
+    return pa.string()
+
+
+def apply_trade_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Coerce raw CSV columns to the typed trade schema"""
+    for column in df.columns:
+        if column in CATEGORICAL_COLUMNS:
+            df[column] = df[column].astype("category")
+        elif column in DATETIME_COLUMNS:
+            df[column] = pd.to_datetime(df[column], errors="coerce")
+        elif column in FLOAT_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+        elif column in BOOL_COLUMNS:
+            df[column] = df[column].astype(str).str.lower().eq("true")
+    return df
+
+
+def columnar_available(path: Path) -> bool:
+    """True if a Parquet cache exists and was built from the current gzip file"""
+    if pq is None:
+        return False
+    cache = columnar_path(path)
+    if not cache.exists():
+        return False
+    try:
+        metadata = pq.read_schema(cache).metadata or {}
+        return json.loads(metadata.get(FINGERPRINT_KEY, b"{}")) == file_fingerprint(path)
+    except Exception:
+        return False
+
+
+def _parquet_source(path: Path) -> Optional[Path]:
+    """Parquet file to read for a trade file: the file itself, or its current columnar cache"""
+    if pq is None:
+        return None
+    path = Path(path)
+    if path.suffix == COLUMNAR_SUFFIX:
+        return path
+    return columnar_path(path) if columnar_available(path) else None
+
+
+def write_columnar_cache(path: Path, chunksize: int = 500_000) -> Optional[Path]:
+    """Convert a gzip CSV trade file to a typed Parquet file alongside it"""
+    if pq is None:
+        return None
+
+    path = Path(path)
+    cache = columnar_path(path)
+    tmp_path = cache.with_name(cache.name + ".tmp")
+    fingerprint = json.dumps(file_fingerprint(path)).encode()
+
+    writer = None
+    try:
+        for chunk in pd.read_csv(path, compression="gzip", chunksize=chunksize, dtype=str):
+            if writer is None:
+                schema = pa.schema([(column, _arrow_type(column)) for column in chunk.columns])
+                schema = schema.with_metadata({FINGERPRINT_KEY: fingerprint})
+                writer = pq.ParquetWriter(tmp_path, schema)
+            table = pa.Table.from_pandas(apply_trade_dtypes(chunk), schema=schema, preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        return None
+    os.replace(tmp_path, cache)
+    logger.info(f"Wrote columnar cache {cache}")
+    return cache
+
+
+def _filter_mask(df: pd.DataFrame, filters: Sequence[Filter]) -> pd.Series:
+    """Evaluate pyarrow-style filters against an in-memory frame"""
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        series = df[column]
+        if column in DATETIME_COLUMNS:
+            value = pd.to_datetime(value) if op not in ("in", "not in") else pd.to_datetime(list(value))
+        if op in ("=", "=="):
+            mask &= series == value
+        elif op == "!=":
+            mask &= series != value
+        elif op == "<":
+            mask &= series < value
+        elif op == "<=":
+            mask &= series <= value
+        elif op == ">":
+            mask &= series > value
+        elif op == ">=":
+            mask &= series >= value
+        elif op == "in":
+            mask &= series.isin(value)
+        elif op == "not in":
+            mask &= ~series.isin(value)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+    return mask
+
+
+def _csv_columns(path: Path, columns: Optional[Sequence[str]], filters: Sequence[Filter]) -> Optional[List[str]]:
+    """Columns to parse from the CSV: the projection plus anything filtered on"""
+    if columns is None:
+        return None
+    header = pd.read_csv(path, nrows=0).columns
+    wanted = list(dict.fromkeys(list(columns) + [f[0] for f in filters]))
+    return [column for column in wanted if column in header]
+
+
+def read_trades(path: Path, columns: Optional[Sequence[str]] = None,
+                filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+    """Read a trade file (gzip CSV or Parquet), preferring its Parquet cache
+
+    Only the requested columns are read, and filters are pushed down to the
+    Parquet reader so non-matching row groups are skipped.
+    """
+    filters = list(filters or [])
+    columns = list(columns) if columns is not None else None
+
+    cache = _parquet_source(path)
+    if cache is not None:
+        if columns is not None:
+            # Unknown columns are dropped, as the CSV path does
+            names = pq.read_schema(cache).names
+            columns = [column for column in columns if column in names]
+        return pq.read_table(cache, columns=columns, filters=filters or None).to_pandas()
+
+    df = apply_trade_dtypes(pd.read_csv(path,
+                                        usecols=_csv_columns(path, columns, filters)))
+    if filters:
+        df = df[_filter_mask(df, filters)].reset_index(drop=True)
+    if columns is not None:
+        df = df[[column for column in columns if column in df.columns]]
+    return df
+
+
+def read_trade_files(paths: Sequence[Path], columns: Optional[Sequence[str]] = None) -> Optional[pd.DataFrame]:
+    """Concatenate the given columns of several trade files; unreadable files are skipped"""
+    frames = []
+    for path in paths:
+        try:
+            frames.append(read_trades(path, columns=columns))
+        except Exception:
+            continue
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def iter_trades(path: Path, columns: Optional[Sequence[str]] = None,
+                filters: Optional[Sequence[Filter]] = None,
+                chunksize: int = 500_000) -> Iterable[pd.DataFrame]:
+    """Stream a trade file (gzip CSV or Parquet) in chunks of typed rows"""
+    filters = list(filters or [])
+    columns = list(columns) if columns is not None else None
+
+    cache = _parquet_source(path)
+    if cache is not None:
+        parquet = pq.ParquetFile(cache)
+        if columns is not None:
+            columns = [column for column in columns if column in parquet.schema_arrow.names]
+        read_columns = None if columns is None else list(dict.fromkeys(columns + [f[0] for f in filters]))
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=read_columns):
+            df = batch.to_pandas()
+            if filters:
+                df = df[_filter_mask(df, filters)]
+            yield df[columns] if columns is not None else df
+        return
+
+    for df in pd.read_csv(path, chunksize=chunksize,
+                          usecols=_csv_columns(path, columns, filters)):
+        df = apply_trade_dtypes(df)
+        if filters:
+            df = df[_filter_mask(df, filters)]
+        yield df[[column for column in columns if column in df.columns]] if columns is not None else df
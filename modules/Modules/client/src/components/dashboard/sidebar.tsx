@@ -40,8 +40,8 @@ export default function Sidebar({ config, onConfigChange }: SidebarProps) {
     onSuccess: (data) => {
       setRequestId(data.request_id);
       toast({ title: "Success", description: "Data download started" });
-      // Start polling for status
-      pollProcessingStatus(data.request_id);
+      // Follow progress as the server pushes it
+      watchProcessingStatus(data.request_id);
     },
     onError: () => {
       toast({ title: "Error", description: "Failed to start data download", variant: "destructive" });
@@ -69,25 +69,71 @@ export default function Sidebar({ config, onConfigChange }: SidebarProps) {
     }
   });
 
-  const pollProcessingStatus = (reqId: string) => {
-    const interval = setInterval(async () => {
+  const notifyFinished = (status: string) => {
+    if (status === 'completed') {
+      toast({ title: "Success", description: "Data processing completed" });
+    } else if (status === 'failed') {
+      toast({ title: "Error", description: "Data processing failed", variant: "destructive" });
+    }
+  };
+
+  // Progress is pushed as small events; the full status is only read when
+  // the job starts and when the server says events were missed
+  const watchProcessingStatus = (reqId: string) => {
+    const statusUrl = `http://localhost:5001/api/data/status/${reqId}`;
+    let source: EventSource | null = null;
+
+    const subscribe = async () => {
+      source?.close();
       try {
-        const response = await fetch(`http://localhost:5001/api/data/status/${reqId}`);
-        const status = await response.json();
-        setProcessingStatus(status);
-        
-        if (status.status === 'completed' || status.status === 'failed') {
-          clearInterval(interval);
-          if (status.status === 'completed') {
-            toast({ title: "Success", description: "Data processing completed" });
-          } else {
-            toast({ title: "Error", description: "Data processing failed", variant: "destructive" });
-          }
+        const response = await fetch(statusUrl);
+        const snapshot = await response.json();
+        setProcessingStatus(snapshot);
+        if (snapshot.status === 'completed' || snapshot.status === 'failed') {
+          notifyFinished(snapshot.status);
+          return;
         }
+
+        source = new EventSource(`${statusUrl}/stream?since=${snapshot.version}`);
+        source.addEventListener('started', subscribe);
+        source.addEventListener('resync', subscribe);
+        source.addEventListener('status', (message) => {
+          const event = JSON.parse((message as MessageEvent).data);
+          setProcessingStatus((prev: any) => ({ ...prev, status: event.status, error: event.error }));
+          notifyFinished(event.status);
+        });
+        source.addEventListener('download', (message) => {
+          const event = JSON.parse((message as MessageEvent).data);
+          setProcessingStatus((prev: any) => ({
+            ...prev,
+            progress: event.progress,
+            statuses: (prev?.statuses || []).map((status: any) =>
+              status.legal_entity === event.legal_entity &&
+              status.source_system === event.source_system &&
+              status.environment === event.environment
+                ? { ...status, status: event.status, records_count: event.records_count, error_message: event.error_message }
+                : status
+            ),
+          }));
+        });
+        source.addEventListener('match', (message) => {
+          const event = JSON.parse((message as MessageEvent).data);
+          setProcessingStatus((prev: any) => ({
+            ...prev,
+            progress: event.progress,
+            matching_results: {
+              ...(prev?.matching_results || {}),
+              [event.pair]: { ...(prev?.matching_results?.[event.pair] || {}), matching: event.result },
+            },
+          }));
+        });
+        source.addEventListener('end', () => source?.close());
       } catch (error) {
-        console.error('Error polling status:', error);
+        console.error('Error watching status:', error);
       }
-    }, 2000);
+    };
+
+    subscribe();
   };
 
   const handleConfigChange = (field: string, value: any) => {